@@ -0,0 +1,98 @@
+import argparse
+import base64
+import json
+import os
+
+from benchmarks.standin import make_png
+
+SVG_OPEN = '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{w}" height="{h}" viewBox="0 0 {w} {h}">'
+
+
+def _image(base_url: str, name: str, x: int, y: int, w: int, h: int) -> str:
+    return f'<image x="{x}" y="{y}" width="{w}" height="{h}" xlink:href="{base_url}/images/{name}.png?w={w}&amp;h={h}"/>'
+
+
+def _text_block(y: int, text: str) -> str:
+    return f'<text x="80" y="{y}" font-family="sans-serif" font-size="48" fill="#222">{text}</text>'
+
+
+def simple() -> str:
+    shapes = "".join(
+        f'<rect x="{60 + i * 90}" y="{300 + (i % 3) * 120}" width="80" height="80" rx="12" fill="#{(i * 2654435761) % 0xFFFFFF:06x}"/>'
+        for i in range(10)
+    )
+    return (SVG_OPEN.format(w=1080, h=1350) + '<rect width="1080" height="1350" fill="#f4f1ea"/>'
+            + _text_block(160, "Título do post") + shapes + _text_block(1200, "Rodapé &amp; legenda") + '</svg>')
+
+
+def image_heavy(base_url: str, tiles: int = 24) -> str:
+    columns = 4
+    size = 1080 // columns
+    images = "".join(
+        _image(base_url, f"tile-{i}", (i % columns) * size, (i // columns) * size, size, size) for i in range(tiles)
+    )
+    return SVG_OPEN.format(w=1080, h=1620) + images + _text_block(1560, "Galeria") + '</svg>'
+
+
+def huge_base64(size: int = 1400) -> str:
+    encoded = base64.b64encode(make_png("huge", size, size)).decode()
+    return (SVG_OPEN.format(w=1080, h=1350)
+            + f'<image x="0" y="0" width="1080" height="1080" xlink:href="data:image/png;base64,{encoded}"/>'
+            + _text_block(1250, "Imagem já embutida") + '</svg>')
+
+
+def multi_artboard(base_url: str, slides: int = 8) -> str:
+    return "\n".join(
+        SVG_OPEN.format(w=1080, h=1350)
+        + f'<rect width="1080" height="1350" fill="#{(i * 40503) % 0xFFFFFF:06x}"/>'
+        + _image(base_url, f"slide-{i}-a", 40, 200, 1000, 700)
+        + _image(base_url, f"slide-{i}-b", 40, 940, 300, 300)
+        + _text_block(140, f"Slide {i + 1}/{slides}") + '</svg>'
+        for i in range(slides)
+    )
+
+
+def video_template(base_url: str, areas: int = 1) -> str:
+    regions = "".join(
+        f'<rect id="{"video-area" if i == 0 else f"video-area-{i + 1}"}" x="{90 + i * 460}" y="420" '
+        f'width="{900 if areas == 1 else 440}" height="{900 if areas == 1 else 700}" rx="40" fill="#000" '
+        f'data-video-url="{base_url}/videos/sample.mp4"/>'
+        for i in range(areas)
+    )
+    return (SVG_OPEN.format(w=1080, h=1920) + '<rect width="1080" height="1920" fill="#101820"/>'
+            + _image(base_url, "logo", 40, 40, 200, 200) + _text_block(340, "Vídeo em destaque")
+            + regions + '</svg>')
+
+
+# Corpus representativo: cada item diz o endpoint e o corpo da requisição. As URLs
+# apontam para o stand-in (benchmarks.standin) em `base_url`.
+def build_corpus(base_url: str) -> dict:
+    base_url = base_url.rstrip("/")
+    return {
+        "simple": {"service": "png", "svg_content": simple()},
+        "image_heavy": {"service": "png", "svg_content": image_heavy(base_url)},
+        "huge_base64": {"service": "png", "svg_content": huge_base64()},
+        "multi_artboard": {"service": "png", "svg_content": multi_artboard(base_url)},
+        "video_template": {"service": "video", "svg_content": video_template(base_url)},
+        "video_two_areas": {"service": "video", "svg_content": video_template(base_url, areas=2)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grava o corpus de SVGs dos benchmarks")
+    parser.add_argument("--base-url", default="http://127.0.0.1:9000")
+    parser.add_argument("--output", default="benchmarks/corpus")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    corpus = build_corpus(args.base_url)
+    for name, item in corpus.items():
+        with open(os.path.join(args.output, f"{name}.svg"), "w", encoding="utf-8") as f:
+            f.write(item["svg_content"])
+    with open(os.path.join(args.output, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({name: {"service": item["service"], "bytes": len(item["svg_content"])} for name, item in corpus.items()}, f, indent=2)
+    print(f"{len(corpus)} SVGs gravados em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import itertools
+import os
+import resource
+import time
+import uuid
+
+import aiohttp
+
+from benchmarks.corpus import build_corpus
+from benchmarks.report import summarize, write_results
+
+ENDPOINTS = {"png": "/generate-png", "video": "/generate-video/"}
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+# O pid e todos os descendentes (workers do uvicorn, pool de renderização, ffmpeg),
+# via /proc/<pid>/task/<tid>/children
+def _process_tree(pid: int) -> list:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            tasks = os.listdir(f"/proc/{current}/task")
+        except OSError:
+            continue
+        for tid in tasks:
+            try:
+                with open(f"/proc/{current}/task/{tid}/children", "r") as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+    return pids
+
+
+def _tree_rss_bytes(pid: int) -> int:
+    sizes = [rss for rss in map(_rss_bytes, _process_tree(pid)) if rss is not None]
+    return sum(sizes) if sizes else None
+
+
+# Amostra o RSS do processo do serviço (--pid) somado ao dos filhos durante a carga;
+# sem pid, registra apenas o pico do próprio gerador.
+async def _watch_rss(pids: list, peaks: dict, stop: asyncio.Event):
+    while not stop.is_set():
+        for pid in pids:
+            rss = _tree_rss_bytes(pid)
+            if rss is not None:
+                peaks[pid] = max(peaks.get(pid, 0), rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+# Cada requisição pode receber um marcador único (<desc>) para furar os caches e medir
+# o caminho completo; sem ele, mede-se o caminho de cache quente.
+def _payload(item: dict, cache_busting: bool) -> dict:
+    svg = item["svg_content"]
+    if cache_busting:
+        svg = svg.replace("</svg>", f"<desc>{uuid.uuid4().hex}</desc></svg>")
+    return {"svg_content": svg}
+
+
+async def run_load(targets: dict, items: dict, concurrency: int, total: int, duration: float,
+                   cache_busting: bool, timeout: float) -> dict:
+    cycle = itertools.cycle(list(items.items()))
+    latencies = {name: [] for name in items}
+    errors = {}
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async def worker():
+            nonlocal issued
+            while (total is None or issued < total) and (deadline is None or time.perf_counter() < deadline):
+                issued += 1
+                name, item = next(cycle)
+                url = targets[item["service"]] + ENDPOINTS[item["service"]]
+                start = time.perf_counter()
+                try:
+                    async with session.post(url, json=_payload(item, cache_busting)) as response:
+                        await response.read()
+                        status = response.status
+                except Exception as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - start
+                if status == 200:
+                    latencies[name].append(elapsed)
+                else:
+                    errors[f"{name}:{status}"] = errors.get(f"{name}:{status}", 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        wall = time.perf_counter() - start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "wall_seconds": round(wall, 3),
+        "requests": issued,
+        "succeeded": len(all_latencies),
+        "errors": errors,
+        "throughput_rps": round(len(all_latencies) / wall, 3) if wall else None,
+        "latency": summarize(all_latencies),
+        "latency_by_item": {name: summarize(values) for name, values in latencies.items() if values},
+    }
+
+
+async def main_async(args):
+    corpus = build_corpus(args.asset_base_url)
+    items = {name: item for name, item in corpus.items()
+             if (not args.items or name in args.items) and (item["service"] != "video" or args.video_url)}
+    if not items:
+        raise SystemExit("Nenhum item do corpus selecionado (para vídeo, informe --video-url).")
+    targets = {"png": args.png_url.rstrip("/"), "video": (args.video_url or "").rstrip("/")}
+
+    peaks = {}
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_rss(args.pid, peaks, stop))
+    try:
+        results = await run_load(targets, items, args.concurrency, args.requests, args.duration,
+                                 args.cache_busting, args.timeout)
+    finally:
+        stop.set()
+        await watcher
+
+    results["peak_rss_bytes"] = {str(pid): rss for pid, rss in peaks.items()}
+    results["generator_peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    write_results(args.output, "load", results, vars(args))
+    print(f"p50={results['latency']['p50']}s p95={results['latency']['p95']}s p99={results['latency']['p99']}s "
+          f"throughput={results['throughput_rps']} req/s erros={sum(results['errors'].values())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga ponta a ponta para /generate-png e /generate-video/")
+    parser.add_argument("--png-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--video-url", help="base do svg_to_video (omitido: só itens de PNG)")
+    parser.add_argument("--asset-base-url", default="http://127.0.0.1:9000", help="stand-in visto pelos serviços")
+    parser.add_argument("--items", nargs="*", help="itens do corpus (padrão: todos)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, help="total de requisições")
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos (ignorado com --requests)")
+    parser.add_argument("--cache-busting", action="store_true", help="SVG único por requisição (caminho frio)")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--pid", type=int, nargs="*", default=[], help="PIDs dos serviços para medir o pico de RSS")
+    parser.add_argument("--output", default="benchmarks/results/load.json")
+    args = parser.parse_args()
+    if args.requests:
+        args.duration = None
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.corpus import build_corpus
+from benchmarks.report import summarize, write_results
+from benchmarks.standin import make_png, make_sample_video
+from common.render_pool import render_svg
+from common.svg_document import SVGDocument
+from common.svg_metadata import extract_metadata
+
+# compositing/encoding_profiles vivem no serviço de vídeo (importados sem o pacote)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "svg_to_video"))
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+# Sem rede: as imagens do corpus são geradas localmente com o mesmo gerador do stand-in
+def offline_resources(urls) -> dict:
+    resources = {}
+    for url in urls:
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        name = os.path.basename(parsed.path).rsplit(".", 1)[0]
+        resources[url] = make_png(name, int(query.get("w", ["400"])[0]), int(query.get("h", ["400"])[0]))
+    return resources
+
+
+def offline_data_uris(urls) -> dict:
+    return {url: f"data:image/png;base64,{base64.b64encode(content).decode()}"
+            for url, content in offline_resources(urls).items()}
+
+
+def split_svgs(svg_content: str) -> list:
+    return [part for part in svg_content.split("\n") if part.startswith("<svg")] or [svg_content]
+
+
+def bench_document(svg: str, repeat: int, render: bool) -> dict:
+    document = SVGDocument(svg)
+    embedded = offline_data_uris(document.image_urls())
+    results = {
+        "bytes": len(svg),
+        "images": len(document.image_urls()),
+        "parse": measure(lambda: SVGDocument(svg), repeat),
+        "cache_key": measure(lambda: SVGDocument(svg).cache_key(), repeat),
+        "metadata": measure(lambda: extract_metadata(svg).cache_key(), repeat),
+        "embed": measure(lambda: document.serialize(embedded), repeat),
+    }
+    if render:
+        # "render": caminho atual (hrefs originais + url_fetcher); "render_embedded":
+        # o SVG com data URIs, para comparação
+        resources = offline_resources(document.image_urls())
+        processed = document.serialize(embedded).encode()
+        width, height = document.dimensions((1080, 1350))
+        results["render"] = measure(
+            lambda: render_svg(svg.encode(), width, height, 1.0, True, None, resources), max(1, repeat // 5)
+        )
+        results["render_embedded"] = measure(lambda: render_svg(processed, width, height, 1.0, True), max(1, repeat // 5))
+    return results
+
+
+def bench_encode(svg: str, profiles: list, seconds: int) -> dict:
+    from compositing import build_inputs_and_filter, region_from_element
+    from encoding_profiles import ENCODING_PROFILES, FFMPEG_THREADS, encoding_args
+
+    if shutil.which("ffmpeg") is None:
+        return {"skipped": "ffmpeg não encontrado"}
+
+    workdir = tempfile.mkdtemp(prefix="bench-encode-")
+    try:
+        video_path = os.path.join(workdir, "sample.mp4")
+        make_sample_video(video_path, seconds=seconds)
+
+        document = SVGDocument(svg)
+        width, height = document.dimensions((1080, 1920))
+        png_path = os.path.join(workdir, "background.png")
+        render_svg(svg.encode(), width, height, 1.0, False, png_path, offline_resources(document.image_urls()))
+        regions = [region_from_element(elem, 1.0, "sample") for elem in document.video_areas]
+        for region in regions:
+            region["video_url"] = "sample"
+
+        results = {}
+        for profile in profiles:
+            fps = ENCODING_PROFILES[profile]["fps"]
+            inputs, filter_complex = build_inputs_and_filter(
+                png_path, regions, {"sample": video_path}, [None] * len(regions), fps, lambda path: []
+            )
+            output_path = os.path.join(workdir, f"{profile}.mp4")
+            cmd = [
+                "ffmpeg", "-y", "-loglevel", "error",
+                *[arg for input_args in inputs for arg in input_args],
+                "-filter_complex", filter_complex,
+                *encoding_args(profile), "-threads", str(FFMPEG_THREADS), "-movflags", "+faststart", "-f", "mp4", output_path,
+            ]
+            start = time.perf_counter()
+            subprocess.run(cmd, check=True)
+            elapsed = time.perf_counter() - start
+            results[profile] = {
+                "seconds": round(elapsed, 3),
+                "encode_fps": round(seconds * fps / elapsed, 2),
+                "speed": round(seconds / elapsed, 2),
+                "output_bytes": os.path.getsize(output_path),
+            }
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks: parse, chave de cache, embed, render e encode")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-render", action="store_true", help="pula a rasterização (cairosvg)")
+    parser.add_argument("--encode-profiles", nargs="*", default=["fast-preview"], help="vazio pula o encode")
+    parser.add_argument("--encode-seconds", type=int, default=5)
+    parser.add_argument("--output", default="benchmarks/results/micro.json")
+    args = parser.parse_args()
+
+    corpus = build_corpus("http://bench.invalid")
+    results = {}
+    for name, item in corpus.items():
+        svg = split_svgs(item["svg_content"])[0]  # slides do carrossel são equivalentes; mede-se o primeiro
+        print(f"⏱️  {name}")
+        results[name] = bench_document(svg, args.repeat, render=not args.no_render)
+
+    if args.encode_profiles:
+        print("⏱️  encode")
+        results["encode"] = bench_encode(corpus["video_template"]["svg_content"], args.encode_profiles, args.encode_seconds)
+
+    write_results(args.output, "micro", results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import List
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "n": len(samples),
+        "mean": round(sum(samples) / len(samples), 6) if samples else None,
+        "min": round(min(samples), 6) if samples else None,
+        "p50": round(percentile(samples, 50), 6) if samples else None,
+        "p95": round(percentile(samples, 95), 6) if samples else None,
+        "p99": round(percentile(samples, 99), 6) if samples else None,
+        "max": round(max(samples), 6) if samples else None,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# Envelope comum dos resultados: o que foi medido + onde/quando, para comparar
+# execuções ao longo do tempo (mesmo commit, máquina, Python).
+def write_results(path: str, suite: str, results, params: dict = None) -> dict:
+    document = {
+        "suite": suite,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params or {},
+        "results": results,
+    }
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+        print(f"Resultados gravados em {path}")
+    return document
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import uuid
+from functools import lru_cache
+
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+
+# Imagem determinística por nome/tamanho: um gradiente com ruído leve, para o PNG
+# não comprimir de forma irreal.
+@lru_cache(maxsize=256)
+def make_png(name: str, width: int, height: int) -> bytes:
+    rng = random.Random(name)
+    image = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(image)
+    base = [rng.randrange(256) for _ in range(3)]
+    for y in range(height):
+        shade = tuple((c + y * 255 // max(1, height)) % 256 for c in base)
+        draw.line((0, y, width, y), fill=shade)
+    for _ in range(max(1, width * height // 400)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.point((x, y), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_sample_video(path: str, seconds: int = 5, size: str = "640x360"):
+    if shutil.which("ffmpeg") is None:
+        return False
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc=size={size}:rate=30:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest",
+        "-movflags", "+faststart", path,
+    ], check=True)
+    return True
+
+
+# Servidor local que faz o papel da internet nos benchmarks: imagens (com ETag e
+# 304), vídeo MP4 (com Range) e a API de Storage do Supabase (HEAD/info/POST/TUS) em
+# memória. Aponte STORAGE_URL para ele e use URLs do corpus com a mesma base.
+class StandInServer:
+
+    def __init__(self, latency_ms: float = 0, video_path: str = None):
+        self.latency = latency_ms / 1000
+        self.video_path = video_path
+        self.objects = {}
+        self.resumable = {}
+        self.requests = 0
+        self.app = web.Application(client_max_size=512 * 1024 * 1024, middlewares=[self._middleware])
+        self.app.add_routes([
+            web.get("/images/{name}.png", self.image),
+            web.get("/videos/{name}.mp4", self.video),
+            web.head("/storage/v1/object/authenticated/{bucket}/{path:.*}", self.object_head),
+            web.get("/storage/v1/object/info/authenticated/{bucket}/{path:.*}", self.object_info),
+            web.get("/storage/v1/object/public/{bucket}/{path:.*}", self.object_get),
+            web.post("/storage/v1/object/{bucket}/{path:.*}", self.object_post),
+            web.post("/storage/v1/upload/resumable", self.tus_create),
+            web.patch("/storage/v1/upload/resumable/{upload_id}", self.tus_patch),
+            web.head("/storage/v1/upload/resumable/{upload_id}", self.tus_head),
+            web.get("/stats", self.stats),
+        ])
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def image(self, request):
+        name = request.match_info["name"]
+        width = int(request.query.get("w", "400"))
+        height = int(request.query.get("h", "400"))
+        content = make_png(name, width, height)
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "max-age=3600"}
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=content, content_type="image/png", headers=headers)
+
+    async def video(self, request):
+        if not self.video_path or not os.path.isfile(self.video_path):
+            raise web.HTTPNotFound(text="vídeo de exemplo indisponível (ffmpeg ausente?)")
+        return web.FileResponse(self.video_path, headers={"Content-Type": "video/mp4"})
+
+    def _key(self, request) -> str:
+        return f"{request.match_info['bucket']}/{request.match_info['path']}"
+
+    async def object_head(self, request):
+        entry = self.objects.get(self._key(request))
+        if entry is None:
+            raise web.HTTPNotFound()
+        return web.Response(headers={"Content-Length": str(len(entry["data"])), "Content-Type": entry["content_type"]})
+
+    # Como no Supabase: objeto inexistente responde 400 com statusCode "404" no corpo
+    async def object_info(self, request):
+        key = self._key(request)
+        entry = self.objects.get(key)
+        if entry is None:
+            return web.json_response({"statusCode": "404", "error": "not_found", "message": "Object not found"}, status=400)
+        return web.json_response({
+            "name": key.split("/", 1)[1],
+            "size": len(entry["data"]),
+            "content_type": entry["content_type"],
+            "user_metadata": entry["metadata"],
+        })
+
+    async def object_get(self, request):
+        entry = self.objects.get(self._key(request))
+        if entry is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=entry["data"], content_type=entry["content_type"])
+
+    async def object_post(self, request):
+        key = self._key(request)
+        if key in self.objects and request.headers.get("x-upsert") != "true":
+            return web.json_response({"error": "Duplicate", "message": "The resource already exists"}, status=409)
+        metadata = request.headers.get("x-metadata")
+        self.objects[key] = {
+            "data": await request.read(),
+            "content_type": request.headers.get("Content-Type", ""),
+            "metadata": json.loads(base64.b64decode(metadata)) if metadata else {},
+        }
+        return web.json_response({"Key": key})
+
+    async def tus_create(self, request):
+        metadata = {}
+        for item in request.headers.get("Upload-Metadata", "").split(","):
+            if " " in item:
+                key, value = item.split(" ", 1)
+                metadata[key] = base64.b64decode(value).decode()
+        upload_id = uuid.uuid4().hex
+        self.resumable[upload_id] = {
+            "key": f"{metadata.get('bucketName')}/{metadata.get('objectName')}",
+            "content_type": metadata.get("contentType", ""),
+            "metadata": json.loads(metadata["metadata"]) if "metadata" in metadata else {},
+            "length": int(request.headers["Upload-Length"]),
+            "data": bytearray(),
+        }
+        return web.Response(status=201, headers={"Location": f"/storage/v1/upload/resumable/{upload_id}", "Tus-Resumable": "1.0.0"})
+
+    async def tus_patch(self, request):
+        upload = self.resumable.get(request.match_info["upload_id"])
+        if upload is None:
+            raise web.HTTPNotFound()
+        if int(request.headers.get("Upload-Offset", -1)) != len(upload["data"]):
+            return web.Response(status=409)
+        upload["data"] += await request.read()
+        if len(upload["data"]) >= upload["length"]:
+            self.objects[upload["key"]] = {
+                "data": bytes(upload["data"]),
+                "content_type": upload["content_type"],
+                "metadata": upload["metadata"],
+            }
+        return web.Response(status=204, headers={"Upload-Offset": str(len(upload["data"])), "Tus-Resumable": "1.0.0"})
+
+    async def tus_head(self, request):
+        upload = self.resumable.get(request.match_info["upload_id"])
+        if upload is None:
+            raise web.HTTPNotFound()
+        return web.Response(headers={"Upload-Offset": str(len(upload["data"])), "Upload-Length": str(upload["length"])})
+
+    async def stats(self, request):
+        return web.json_response({
+            "requests": self.requests,
+            "objects": len(self.objects),
+            "stored_bytes": sum(len(entry["data"]) for entry in self.objects.values()),
+        })
+
+    async def start(self, host: str = "127.0.0.1", port: int = 9000) -> web.AppRunner:
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de imagens, vídeo e Storage para os benchmarks")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0, help="atraso artificial por requisição")
+    parser.add_argument("--video", help="MP4 servido em /videos/*.mp4 (padrão: gerado com ffmpeg testsrc)")
+    args = parser.parse_args()
+
+    video_path = args.video
+    if video_path is None:
+        video_path = os.path.join(tempfile.gettempdir(), "benchmark-sample.mp4")
+        if not os.path.isfile(video_path) and not make_sample_video(video_path):
+            print("⚠️ ffmpeg não encontrado: /videos/*.mp4 responderá 404")
+
+    server = StandInServer(args.latency_ms, video_path)
+    print(f"Stand-in em http://{args.host}:{args.port} (STORAGE_URL=http://{args.host}:{args.port})")
+    web.run_app(server.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from common.governor import governor
+
+ASSET_CACHE_FOLDER = os.getenv("ASSET_CACHE_FOLDER", "/app/asset_cache")
+ASSET_CACHE_MEMORY_BYTES = int(os.getenv("ASSET_CACHE_MEMORY_MB", "64")) * 1024 * 1024
+ASSET_CACHE_DISK_BYTES = int(os.getenv("ASSET_CACHE_DISK_MB", "512")) * 1024 * 1024
+ASSET_CACHE_FRESH_SECONDS = int(os.getenv("ASSET_CACHE_FRESH_SECONDS", "600"))  # 10 minutos
+
+_MAX_AGE_PATTERN = re.compile(r'max-age\s*=\s*(\d+)', re.IGNORECASE)
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+# LRU de imagens remotas em memória + disco. Os bytes ficam em blobs/<sha256 do
+# conteúdo> (URLs que servem o mesmo arquivo dividem o blob) e cada URL tem um
+# meta/<sha256 da URL>.json com ETag/Last-Modified para revalidação condicional.
+# O orçamento em disco é contado por processo: cada serviço precisa da própria pasta
+# (o docker-compose usa uma subpasta por container no volume asset_cache), senão um
+# remove os blobs do outro e o uso real chega à soma dos orçamentos.
+class AssetCache:
+
+    def __init__(self, folder: str = ASSET_CACHE_FOLDER, max_memory_bytes: int = ASSET_CACHE_MEMORY_BYTES,
+                 max_disk_bytes: int = ASSET_CACHE_DISK_BYTES, fresh_seconds: int = ASSET_CACHE_FRESH_SECONDS):
+        self.folder = folder
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.fresh_seconds = fresh_seconds
+
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()   # url -> entry (com "content")
+        self._memory_bytes = 0
+        self._index = OrderedDict()    # url -> metadados em disco
+        self._blob_refs = {}           # sha do conteúdo -> nº de URLs
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+        self._blobs_dir = os.path.join(folder, "blobs")
+        self._meta_dir = os.path.join(folder, "meta")
+        try:
+            os.makedirs(self._blobs_dir, exist_ok=True)
+            os.makedirs(self._meta_dir, exist_ok=True)
+            self._load_index()
+        except OSError as e:
+            print(f"[AVISO] Cache de imagens sem disco ({folder}): {e}")
+            self.max_disk_bytes = 0
+
+    # ---- índice em disco ----
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self._meta_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._meta_dir, name), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if os.path.isfile(self._blob_path(meta["sha"])):
+                    entries.append(meta)
+            except Exception:
+                continue
+
+        for meta in sorted(entries, key=lambda m: m.get("accessed_at", 0)):
+            self._index_add(meta)
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self._blobs_dir, sha)
+
+    def _meta_path(self, url: str) -> str:
+        return os.path.join(self._meta_dir, f"{_url_key(url)}.json")
+
+    def _index_add(self, meta: dict):
+        self._index[meta["url"]] = meta
+        refs = self._blob_refs.get(meta["sha"], 0)
+        if refs == 0:
+            self._disk_bytes += meta["size"]
+        self._blob_refs[meta["sha"]] = refs + 1
+
+    def _index_remove(self, url: str):
+        meta = self._index.pop(url, None)
+        if meta is None:
+            return
+        refs = self._blob_refs.get(meta["sha"], 1) - 1
+        if refs <= 0:
+            self._blob_refs.pop(meta["sha"], None)
+            self._disk_bytes -= meta["size"]
+            _silent_remove(self._blob_path(meta["sha"]))
+        else:
+            self._blob_refs[meta["sha"]] = refs
+        _silent_remove(self._meta_path(url))
+
+    def _write_meta(self, meta: dict):
+        _atomic_write(self._meta_path(meta["url"]), json.dumps(meta).encode("utf-8"))
+
+    # ---- memória ----
+
+    def _memory_put(self, url: str, entry: dict):
+        old = self._memory.pop(url, None)
+        if old is not None:
+            self._memory_bytes -= old["size"]
+        if entry["size"] > self.max_memory_bytes:
+            return
+        self._memory[url] = entry
+        self._memory_bytes += entry["size"]
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted["size"]
+            self.evictions += 1
+
+    # ---- API pública ----
+
+    def _memory_get(self, url: str):
+        with self._lock:
+            entry = self._memory.get(url)
+            if entry is not None:
+                self._memory.move_to_end(url)
+                if url in self._index:
+                    self._index.move_to_end(url)
+            return entry
+
+    # Lê o blob do disco quando a URL não está em memória: chamado pelo fetch numa
+    # thread (asyncio.to_thread), fora do loop de eventos.
+    def lookup(self, url: str):
+        entry = self._memory_get(url)
+        if entry is not None:
+            return entry
+        with self._lock:
+            meta = self._index.get(url)
+        if meta is None:
+            return None
+        try:
+            with open(self._blob_path(meta["sha"]), "rb") as f:  # fora do lock
+                content = f.read()
+        except OSError:
+            content = None
+
+        with self._lock:
+            if self._index.get(url) is not meta:
+                return None  # substituída ou removida durante a leitura
+            if content is None:
+                self._index_remove(url)
+                return None
+            self._index.move_to_end(url)
+            entry = dict(meta, content=content)
+            self._memory_put(url, entry)
+            return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["validated_at"] <= entry.get("max_age", self.fresh_seconds)
+
+    def conditional_headers(self, entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, content: bytes, headers) -> dict:
+        sha = hashlib.sha256(content).hexdigest()
+        now = time.time()
+        meta = {
+            "url": url,
+            "sha": sha,
+            "size": len(content),
+            "content_type": headers.get("Content-Type", ""),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "validated_at": now,
+            "accessed_at": now,
+        }
+        max_age = _parse_max_age(headers.get("Cache-Control"))
+        if max_age is not None:
+            meta["max_age"] = max_age
+
+        with self._lock:
+            self._index_remove(url)
+            if 0 < len(content) <= self.max_disk_bytes:
+                try:
+                    if not os.path.isfile(self._blob_path(sha)):
+                        _atomic_write(self._blob_path(sha), content)
+                    self._write_meta(meta)
+                    self._index_add(meta)
+                    self._evict_disk()
+                except OSError as e:
+                    print(f"[AVISO] Falha ao gravar imagem no cache: {e}")
+
+            entry = dict(meta, content=content)
+            self._memory_put(url, entry)
+            return entry
+
+    def revalidated_ok(self, url: str, entry: dict, headers) -> dict:
+        with self._lock:
+            entry["validated_at"] = time.time()
+            max_age = _parse_max_age(headers.get("Cache-Control"))
+            if max_age is not None:
+                entry["max_age"] = max_age
+            meta = self._index.get(url)
+            if meta is not None:
+                meta["validated_at"] = entry["validated_at"]
+                meta["accessed_at"] = entry["validated_at"]
+                if max_age is not None:
+                    meta["max_age"] = max_age
+                try:
+                    self._write_meta(meta)
+                except OSError:
+                    pass
+            self.revalidated += 1
+            return entry
+
+    # Blob em disco de uma entrada (para os workers lerem direto, sem passar os bytes
+    # entre processos); None quando a URL não está (ou não está mais) no disco.
+    def content_path(self, entry: dict):
+        with self._lock:
+            meta = self._index.get(entry["url"])
+            if meta is None or meta["sha"] != entry["sha"]:
+                return None
+            path = self._blob_path(meta["sha"])
+        return path if os.path.isfile(path) else None
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._index:
+            oldest = next(iter(self._index))
+            self._index_remove(oldest)
+            self._memory.pop(oldest, None)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "bytes_fetched": self.bytes_fetched,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._index),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # ---- leitura com fallback para a rede ----
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str, headers: dict = None,
+                    timeout: float = 10, max_bytes: int = None):
+        entry = self._memory_get(url) or await asyncio.to_thread(self.lookup, url)
+        if entry is not None and self.is_fresh(entry):
+            self.hits += 1
+            return entry
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            request_headers.update(self.conditional_headers(entry))
+
+        async with governor.slot("fetch"), session.get(
+            url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if entry is not None and response.status == 304:
+                self.hits += 1
+                return await asyncio.to_thread(self.revalidated_ok, url, entry, response.headers)
+
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status} ao baixar {url}")
+
+            if max_bytes and int(response.headers.get("Content-Length", 0)) > max_bytes:
+                raise RuntimeError(f"Imagem muito grande (>{max_bytes // (1024 * 1024)}MB): {url}")
+
+            content = await response.read()
+            self.misses += 1
+            self.bytes_fetched += len(content)
+            return await asyncio.to_thread(self.store, url, content, response.headers)
+
+
+def _parse_max_age(cache_control):
+    if not cache_control:
+        return None
+    if "no-cache" in cache_control.lower() or "no-store" in cache_control.lower():
+        return 0
+    match = _MAX_AGE_PATTERN.search(cache_control)
+    return int(match.group(1)) if match else None
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _silent_remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+asset_cache = AssetCache()
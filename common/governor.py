@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager
+
+from common.render_pool import RENDER_POOL_QUEUE_SIZE, RENDER_POOL_WORKERS, RenderPoolBusy
+
+GOVERNOR_MEMORY_BYTES = int(os.getenv("GOVERNOR_MEMORY_MB", "1024")) * 1024 * 1024
+GOVERNOR_FETCH_CONCURRENCY = int(os.getenv("GOVERNOR_FETCH_CONCURRENCY", "8"))
+# Vídeos de origem (até 100MB, sem prazo curto) têm estágio próprio: não ocupam as
+# vagas das imagens, que correm contra o prazo curto de fetch_assets
+GOVERNOR_DOWNLOAD_CONCURRENCY = int(os.getenv("GOVERNOR_DOWNLOAD_CONCURRENCY", "2"))
+# Tudo que o pool de renderização comporta (workers + fila): abaixo disso a fila do
+# pool nunca encheria e o 429 dele nunca sairia
+GOVERNOR_RASTERIZE_CONCURRENCY = int(os.getenv("GOVERNOR_RASTERIZE_CONCURRENCY",
+                                               str(RENDER_POOL_WORKERS + RENDER_POOL_QUEUE_SIZE)))
+GOVERNOR_ENCODE_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", os.getenv("JOB_WORKERS", "2")))  # ffmpegs simultâneos
+GOVERNOR_UPLOAD_CONCURRENCY = int(os.getenv("STORAGE_UPLOAD_CONCURRENCY", "4"))
+# Estimativas de memória: superfície ARGB32 (4 bytes/pixel) vezes a sobra do render
+# (PNG codificado + imagens decodificadas, já no tamanho dos slots); o x264 mantém
+# dezenas de quadros YUV 4:2:0 (1,5 byte/pixel) entre lookahead e referências.
+RASTER_OVERHEAD = float(os.getenv("GOVERNOR_RASTER_OVERHEAD", "3"))
+ENCODER_FRAMES = int(os.getenv("GOVERNOR_ENCODER_FRAMES", "40"))
+
+# Prazo absoluto (relógio do loop) da requisição atual e a task que o aplica
+_deadline = contextvars.ContextVar("governor_deadline", default=None)
+
+
+class ResourceBusy(RenderPoolBusy):
+
+    def __init__(self, message: str, status_code: int = 429):
+        super().__init__(message, status_code)
+
+
+class DeadlineExceeded(RenderPoolBusy):
+
+    def __init__(self, message: str, status_code: int = 504):
+        super().__init__(message, status_code)
+
+
+def raster_bytes(width: float, height: float) -> int:
+    return int(width * height * 4 * RASTER_OVERHEAD)
+
+
+def encode_bytes(width: float, height: float) -> int:
+    return int(width * height * 1.5 * ENCODER_FRAMES)
+
+
+# Semáforo de um estágio (fetch, download, rasterize, encode, upload) com contadores ao vivo
+class StageLimiter:
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self._semaphore = asyncio.Semaphore(self.limit)
+
+    # wait=False (requisições síncronas): sem vaga livre, recusa com 429 na hora em
+    # vez de esperar na fila até o prazo estourar
+    @asynccontextmanager
+    async def slot(self, wait: bool = True):
+        if not wait and self._semaphore.locked():
+            self.rejected += 1
+            raise ResourceBusy(f"Estágio {self.name} no limite, tente novamente em instantes.")
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.perf_counter() - start
+        self.in_use += 1
+        self.acquired += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "saturation": round(self.in_use / self.limit, 3),
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+# Governador de recursos do processo, usado pelos dois serviços: cada estágio pesado
+# tem seu próprio semáforo (imagens, vídeos de origem, rasterização, ffmpeg, uploads);
+# cada trabalho reserva uma estimativa de memória (pixels do render + tamanho do
+# vídeo) de um orçamento fixo antes de começar, e é recusado com 429 (ou aguarda, nos
+# jobs) quando não cabe; e um prazo de ponta a ponta cancela os estágios em andamento
+# (o ffmpeg é morto), virando 504. A saturação de tudo aparece em /status e /metrics.
+class ResourceGovernor:
+
+    def __init__(self, memory_bytes: int = GOVERNOR_MEMORY_BYTES, limits: dict = None):
+        limits = limits or {
+            "fetch": GOVERNOR_FETCH_CONCURRENCY,
+            "download": GOVERNOR_DOWNLOAD_CONCURRENCY,
+            "rasterize": GOVERNOR_RASTERIZE_CONCURRENCY,
+            "encode": GOVERNOR_ENCODE_CONCURRENCY,
+            "upload": GOVERNOR_UPLOAD_CONCURRENCY,
+        }
+        self.stages = {name: StageLimiter(name, limit) for name, limit in limits.items()}
+        self.memory_bytes = memory_bytes
+        self.reserved_bytes = 0
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.deadline_exceeded = 0
+        self._released = None
+
+    def slot(self, stage: str, wait: bool = True):
+        return self.stages[stage].slot(wait)
+
+    # Reserva `cost` bytes do orçamento enquanto o bloco roda. Um trabalho maior que o
+    # orçamento inteiro roda sozinho; com wait=False (requisições síncronas) a recusa
+    # é imediata, com wait=True (jobs) aguarda a vez dentro do prazo.
+    @asynccontextmanager
+    async def admit(self, name: str, cost: int, wait: bool = False):
+        cost = min(max(0, int(cost)), self.memory_bytes)
+        while self.reserved_bytes + cost > self.memory_bytes:
+            if not wait:
+                self.rejected += 1
+                print(f"🚦 {name}: {cost / (1024 * 1024):.0f}MB não cabem no orçamento "
+                      f"({self.reserved_bytes / (1024 * 1024):.0f}/{self.memory_bytes / (1024 * 1024):.0f}MB em uso)")
+                raise ResourceBusy("Servidor no limite de memória, tente novamente em instantes.")
+            if self._released is None:
+                self._released = asyncio.Event()
+            self.waiting += 1
+            try:
+                await self._released.wait()
+            finally:
+                self.waiting -= 1
+
+        self.reserved_bytes += cost
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.reserved_bytes -= cost
+            self.active -= 1
+            if self._released is not None:
+                self._released.set()
+                self._released = None
+
+    # Prazo de ponta a ponta (`seconds` a partir de agora ou o instante `at` do relógio
+    # do loop): vale para tudo que roda dentro do bloco, inclusive tasks criadas ali (o
+    # single-flight), que herdam o prazo absoluto pelo contexto e o reaplicam com
+    # deadline() sem argumentos. Sem prazo herdado nem informado, não limita nada.
+    @asynccontextmanager
+    async def deadline(self, seconds: float = None, at: float = None):
+        current = _deadline.get()
+        task = asyncio.current_task()
+        if current is not None and current[1] is task:
+            yield  # esta task já está sob o prazo
+            return
+        if current is not None:
+            when = current[0]
+        elif at is not None:
+            when = at
+        elif seconds is not None:
+            when = asyncio.get_running_loop().time() + seconds
+        else:
+            yield
+            return
+
+        originating = current is None  # só quem definiu o prazo conta o estouro
+        token = _deadline.set((when, task))
+        scope = asyncio.timeout_at(when)
+        try:
+            async with scope:
+                yield
+        except TimeoutError:
+            if not scope.expired():
+                raise
+            self.deadline_exceeded += originating
+            raise DeadlineExceeded("Prazo da requisição esgotado; etapas em andamento foram canceladas.")
+        except DeadlineExceeded:
+            self.deadline_exceeded += originating
+            raise
+        finally:
+            _deadline.reset(token)
+
+    def stats(self) -> dict:
+        return {
+            "memory": {
+                "budget_bytes": self.memory_bytes,
+                "reserved_bytes": self.reserved_bytes,
+                "saturation": round(self.reserved_bytes / self.memory_bytes, 3) if self.memory_bytes else 0.0,
+            },
+            "requests": {
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "deadline_exceeded": self.deadline_exceeded,
+            },
+            "stages": {name: limiter.stats() for name, limiter in self.stages.items()},
+        }
+
+
+governor = ResourceGovernor()
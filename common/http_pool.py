@@ -0,0 +1,73 @@
+import asyncio
+import os
+from typing import Dict, Iterable
+
+import aiohttp
+
+from common.asset_cache import asset_cache
+
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "64"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "8"))
+HTTP_KEEPALIVE_SECONDS = int(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+
+_session = None
+
+
+# Uma única sessão por processo: as conexões TLS ficam abertas (keep-alive) e são
+# reaproveitadas entre imagens e entre requisições.
+async def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+            ttl_dns_cache=300,
+        )
+        _session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": "Mozilla/5.0"})
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch_assets(urls: Iterable[str], deadline: float, max_bytes: int = None) -> Dict[str, dict]:
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}
+
+    session = await get_session()
+    tasks = {
+        url: asyncio.create_task(asset_cache.fetch(session, url, timeout=deadline, max_bytes=max_bytes))
+        for url in unique_urls
+    }
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    assets = {}
+    for url, task in tasks.items():
+        if task not in done:
+            print(f"[AVISO] Prazo de {deadline}s esgotado ao baixar imagem: {url}")
+        elif task.exception() is not None:
+            print(f"[AVISO] Falha ao baixar imagem: {url} | Erro: {str(task.exception())}")
+        else:
+            assets[url] = task.result()
+    return assets
+
+
+# Imagens baixadas no formato do url_fetcher do render_pool. Com prefer_files, entradas
+# que já estão no disco do cache vão como caminho (um worker relê o blob a cada
+# quadro de uma animação em vez de receber os bytes a cada chamada).
+def render_resources(assets: Dict[str, dict], prefer_files: bool = False) -> Dict[str, object]:
+    resources = {}
+    for url, asset in assets.items():
+        path = asset_cache.content_path(asset) if prefer_files else None
+        resources[url] = path or asset["content"]
+    return resources
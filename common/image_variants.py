@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import io
+import math
+import os
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from common.asset_cache import ASSET_CACHE_FOLDER
+from common.governor import governor
+from common.http_pool import render_resources
+from common.output_cache import OutputCache
+from common.singleflight import SingleFlight
+from common.svg_metadata import parse_length, parse_view_box
+
+IMAGE_VARIANTS = os.getenv("IMAGE_VARIANTS", "true").lower() == "true"
+# Uma pasta por serviço (dentro da pasta do asset_cache do serviço): cada OutputCache
+# só conhece os próprios acessos ao decidir o que remover
+IMAGE_VARIANTS_FOLDER = os.getenv("IMAGE_VARIANTS_FOLDER", os.path.join(ASSET_CACHE_FOLDER, "variants"))
+IMAGE_VARIANTS_CACHE_BYTES = int(os.getenv("IMAGE_VARIANTS_CACHE_MB", "512")) * 1024 * 1024
+IMAGE_VARIANT_MAX_SCALE = float(os.getenv("IMAGE_VARIANT_MAX_SCALE", "0.8"))  # reduções menores não compensam
+IMAGE_VARIANT_PNG_COMPRESSION = 1  # arquivo local: decodificar rápido importa mais que o tamanho
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+# Caixa de um slot de imagem em pixels de saída: (largura, altura, cobre o slot)
+SlotBox = Tuple[float, float, bool]
+
+
+# Tamanho em pixels de saída de cada slot de imagem remota (URL -> caixas). Slots sem
+# width/height ou com escala desconhecida (transform, pattern, <use>...) deixam a URL
+# de fora: a imagem é usada no tamanho original.
+def image_targets(slots: List[dict], view_box: Optional[str], dimensions: Tuple[int, int],
+                  scale: float) -> Dict[str, List[SlotBox]]:
+    canvas = parse_view_box(view_box) or dimensions
+    if min(canvas) <= 0 or min(dimensions) <= 0:
+        return {}
+    # Escala uniforme viewBox -> pixels; o maior eixo vale tanto para "meet" quanto "slice"
+    factor = scale * max(dimensions[0] / canvas[0], dimensions[1] / canvas[1])
+
+    boxes = {}
+    for slot in slots:
+        url = slot.get("href") or ""
+        if not url.startswith("http") or (url in boxes and boxes[url] is None):
+            continue
+        try:
+            if not slot.get("fixed"):
+                raise ValueError("escala desconhecida")
+            width = parse_length(slot.get("width"), canvas[0]) * factor
+            height = parse_length(slot.get("height"), canvas[1]) * factor
+        except (AttributeError, ValueError):
+            boxes[url] = None
+            continue
+        if width <= 0 or height <= 0:
+            continue  # slot vazio não desenha nada
+        aspect = (slot.get("preserveAspectRatio") or "").strip()
+        cover = aspect.startswith("none") or "slice" in aspect
+        boxes.setdefault(url, []).append((width, height, cover))
+    return {url: url_boxes for url, url_boxes in boxes.items() if url_boxes}
+
+
+# Formato e tamanho exibido (já com a orientação EXIF) lidos só do cabeçalho. O cairosvg
+# aplica a orientação EXIF em tudo que não é PNG (PNGs vão direto para o cairo).
+def _probe(content: bytes) -> Optional[Tuple[str, Tuple[int, int]]]:
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            width, height = image.size
+            rotated = image.format != "PNG" and image.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS
+            return image.format, ((height, width) if rotated else (width, height))
+    except Exception:
+        return None  # SVG, formato desconhecido ou arquivo corrompido: fica o original
+
+
+def _scale_for(size: Tuple[int, int], boxes: List[SlotBox]) -> float:
+    width, height = size
+    scales = [(max if cover else min)(box_w / width, box_h / height) for box_w, box_h, cover in boxes]
+    return max(scales) if scales else 1.0
+
+
+# Decodifica uma vez (JPEG já reduzido na própria decodificação), aplica a orientação,
+# reduz e grava PNG sem EXIF/ICC/texto.
+def _transcode(content: bytes, size: Tuple[int, int]) -> bytes:
+    with Image.open(io.BytesIO(content)) as source:
+        image = source
+        if source.format != "PNG":
+            rotated = source.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS
+            source.draft("RGB", (size[1], size[0]) if rotated else size)
+            image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ("RGBA", "RGBa", "LA", "La", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    output = io.BytesIO()
+    image.save(output, "PNG", compress_level=IMAGE_VARIANT_PNG_COMPRESSION)
+    return output.getvalue()
+
+
+# Versões das imagens remotas já no tamanho em que serão desenhadas (tamanho do slot x
+# escala de saída), em PNG: o cairosvg passa PNG direto ao cairo, enquanto JPEG/WebP/GIF
+# seriam decodificados pelo Pillow e recodificados a cada renderização (a cada quadro,
+# numa animação). Assim memória e tempo de render acompanham o tamanho da saída, não o
+# do arquivo original. As variantes ficam em disco por (URL, conteúdo, tamanho), num
+# OutputCache próprio, e seguem para o render_pool como caminho de arquivo.
+class ImageVariants:
+
+    def __init__(self, folder: str = IMAGE_VARIANTS_FOLDER, max_bytes: int = IMAGE_VARIANTS_CACHE_BYTES,
+                 enabled: bool = IMAGE_VARIANTS):
+        self.folder = folder
+        self.enabled = enabled
+        self.cache = OutputCache("image_variants", [folder], (".png",), max_bytes)
+        self._flight = SingleFlight("image_variants")
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+        self.kept_original = 0
+        self.failed = 0
+        self.source_pixels = 0
+        self.variant_pixels = 0
+
+    def start(self):
+        self.cache.start()
+
+    async def stop(self):
+        await self.cache.stop()
+
+    # Mesmo formato de http_pool.render_resources, com as variantes na frente dos
+    # originais; URLs sem variante (ou se algo falhar) usam o original.
+    async def resources(self, assets: Dict[str, dict], targets: Dict[str, List[SlotBox]] = None,
+                        prefer_files: bool = False) -> Dict[str, object]:
+        resources = render_resources(assets, prefer_files)
+        if not self.enabled:
+            return resources
+        urls = list(assets)
+        variants = await asyncio.gather(*[self.variant(assets[url], (targets or {}).get(url)) for url in urls])
+        for url, variant in zip(urls, variants):
+            if isinstance(variant, str):
+                resources[url] = (variant, resources[url])  # o original, se o arquivo sumir
+            elif variant is not None:
+                resources[url] = variant
+        return resources
+
+    # Caminho (ou bytes, sem disco) da variante de `asset` para as caixas dadas; None
+    # quando o original já serve (PNG que não precisa ser reduzido).
+    async def variant(self, asset: dict, boxes: List[SlotBox] = None):
+        probe = _probe(asset["content"])
+        if probe is None:
+            return self._count("kept_original")
+        image_format, source_size = probe
+        scale = _scale_for(source_size, boxes or [])
+        if scale > IMAGE_VARIANT_MAX_SCALE:
+            if image_format == "PNG":
+                return self._count("kept_original")
+            scale = 1.0
+        size = (max(1, math.ceil(source_size[0] * scale)), max(1, math.ceil(source_size[1] * scale)))
+
+        sha = asset.get("sha") or hashlib.sha256(asset["content"]).hexdigest()
+        key = hashlib.sha256(f"{asset['url']}\n{sha}\n{size[0]}x{size[1]}".encode("utf-8")).hexdigest()
+        path = os.path.join(self.folder, f"{key}.png")
+        if self.cache.lookup(path):
+            return self._count("reused", path)
+        return await self._flight.do(key, lambda: self._create(asset, path, source_size, size))
+
+    async def _create(self, asset: dict, path: str, source_size: Tuple[int, int], size: Tuple[int, int]):
+        try:
+            async with governor.slot("rasterize"):
+                data = await asyncio.to_thread(_transcode, asset["content"], size)
+        except Exception as e:
+            print(f"⚠️ Variante de {asset['url']} falhou, usando o original: {str(e)}")
+            return self._count("failed")
+
+        with self._lock:
+            self.created += 1
+            self.source_pixels += source_size[0] * source_size[1]
+            self.variant_pixels += size[0] * size[1]
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Variante de {asset['url']} fora do disco: {str(e)}")
+            _silent_remove(tmp_path)
+            return data
+        self.cache.add(path)
+        return path
+
+    def _count(self, counter: str, result=None):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "created": self.created,
+                "reused": self.reused,
+                "kept_original": self.kept_original,
+                "failed": self.failed,
+                "source_pixels": self.source_pixels,
+                "variant_pixels": self.variant_pixels,
+                "cache": self.cache.stats(),
+            }
+
+
+def _silent_remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+image_variants = ImageVariants()
@@ -0,0 +1,115 @@
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("svg-services")
+except ImportError:  # spans são opcionais: sem opentelemetry, só as métricas
+    _tracer = None
+
+STAGE_SECONDS = Histogram(
+    "svg_stage_seconds", "Duração de cada etapa do pipeline",
+    ["stage"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+STAGE_ERRORS = Counter("svg_stage_errors_total", "Etapas que terminaram com exceção", ["stage"])
+REQUEST_SECONDS = Histogram(
+    "svg_http_request_seconds", "Duração das requisições HTTP",
+    ["method", "route", "status"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+FFMPEG_SPEED = Histogram(
+    "svg_ffmpeg_encode_speed_ratio", "Segundos de vídeo codificados por segundo de relógio (speed= do ffmpeg)",
+    ["profile"], buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+FFMPEG_FPS = Histogram(
+    "svg_ffmpeg_encode_fps", "Quadros codificados por segundo",
+    ["profile"], buckets=(10, 25, 50, 100, 200, 400, 800, 1600),
+)
+
+
+# Cronômetro de etapa: alimenta o histograma, grava em `timings` (o dicionário que
+# já vai na resposta/job) e, com opentelemetry instalado, abre um span com o nome.
+@contextmanager
+def stage(name: str, timings: dict = None):
+    span = _tracer.start_as_current_span(name) if _tracer is not None else None
+    if span is not None:
+        span.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        STAGE_ERRORS.labels(name).inc()
+        if span is not None:
+            span.__exit__(type(e), e, e.__traceback__)
+            span = None
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        if timings is not None:
+            timings[name] = round(elapsed, 3)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+
+# Exporta, a cada coleta, os números que os componentes já expõem em stats() (caches,
+# pool de render, fila de jobs, single-flight, storage) como gauges
+# svg_<componente>_<campo>: acertos/erros, razão de acerto, fila, renders em curso,
+# bytes baixados etc., sem instrumentar os caminhos quentes.
+class StatsCollector:
+
+    def __init__(self, sources: Dict[str, Callable[[], dict]]):
+        self.sources = sources
+
+    def collect(self):
+        for source, get_stats in self.sources.items():
+            try:
+                stats = get_stats()
+            except Exception as e:
+                print(f"[AVISO] Falha ao coletar métricas de {source}: {e}")
+                continue
+            yield from _gauges(f"svg_{source}", stats)
+
+
+def _gauges(prefix: str, stats: dict):
+    for key, value in stats.items():
+        name = f"{prefix}_{_metric_name(key)}"
+        if isinstance(value, dict):
+            yield from _gauges(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauge = GaugeMetricFamily(name, f"{prefix} {key}")
+            gauge.add_metric([], value)
+            yield gauge
+
+
+def _metric_name(key: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', str(key))
+
+
+def register_stats(sources: Dict[str, Callable[[], dict]]):
+    REGISTRY.register(StatsCollector(sources))
+
+
+def instrument_app(app):
+    @app.middleware("http")
+    async def record_request(request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            REQUEST_SECONDS.labels(
+                request.method, getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
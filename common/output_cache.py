@@ -0,0 +1,210 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+OUTPUT_CACHE_MIN_FREE_BYTES = int(os.getenv("OUTPUT_CACHE_MIN_FREE_MB", "1024")) * 1024 * 1024
+OUTPUT_CACHE_INTERVAL_SECONDS = float(os.getenv("OUTPUT_CACHE_INTERVAL_SECONDS", "60"))
+OUTPUT_CACHE_MIN_AGE_SECONDS = float(os.getenv("OUTPUT_CACHE_MIN_AGE_SECONDS", "600"))  # em uso (upload, ffmpeg)
+STALE_TMP_SECONDS = 3600
+
+
+# Arquivos gerados num volume (MP4s, fundos, PNGs) como cache LRU limitado em bytes
+# e em espaço livre no disco. O índice é reconstruído a partir do próprio volume ao
+# iniciar (a ordem de uso vem do mtime, atualizado a cada acerto), então um arquivo
+# deixado por um container anterior é um acerto. A remoção roda numa tarefa de fundo,
+# fora do caminho da requisição; arquivos usados há menos de min_age_seconds ficam.
+class OutputCache:
+
+    def __init__(self, name: str, folders: Iterable[str], suffixes: Iterable[str], max_bytes: int,
+                 min_free_bytes: int = OUTPUT_CACHE_MIN_FREE_BYTES,
+                 min_age_seconds: float = OUTPUT_CACHE_MIN_AGE_SECONDS,
+                 interval_seconds: float = OUTPUT_CACHE_INTERVAL_SECONDS):
+        self.name = name
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.suffixes = tuple(suffixes)
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.min_age_seconds = min_age_seconds
+        self.interval_seconds = interval_seconds
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # caminho -> (tamanho, último uso)
+        self._total_bytes = 0
+        self._task = None
+        self._wakeup = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+        for folder in self.folders:
+            os.makedirs(folder, exist_ok=True)
+        self._load_index()
+
+    def _managed(self, path: str) -> bool:
+        return path.endswith(self.suffixes) and os.path.dirname(os.path.abspath(path)) in self.folders
+
+    def _load_index(self):
+        now = time.time()
+        entries = []
+        for folder in self.folders:
+            try:
+                scanned = list(os.scandir(folder))
+            except OSError as e:
+                print(f"⚠️ Cache {self.name}: falha ao listar {folder}: {str(e)}")
+                continue
+            for entry in scanned:
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(".tmp"):
+                    if now - stat.st_mtime > STALE_TMP_SECONDS:
+                        _silent_remove(entry.path)
+                elif entry.name.endswith(self.suffixes):
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+
+        with self._lock:
+            for mtime, path, size in sorted(entries):
+                self._index[path] = (size, mtime)
+                self._total_bytes += size
+        print(f"🗂️ Cache {self.name}: {len(entries)} arquivos, {self._total_bytes / (1024 * 1024):.1f}MB")
+
+    def _put(self, path: str, size: int, used_at: float):
+        old = self._index.pop(path, None)
+        if old is not None:
+            self._total_bytes -= old[0]
+        self._index[path] = (size, used_at)
+        self._total_bytes += size
+
+    # Caminho do arquivo se ele existe (e marca o uso), senão None. Arquivos gravados
+    # por outro processo no mesmo volume entram no índice aqui.
+    def lookup(self, path: str):
+        path = os.path.abspath(path)
+        now = time.time()
+        try:
+            size = os.path.getsize(path)
+            os.utime(path, (now, now))
+        except OSError:
+            with self._lock:
+                old = self._index.pop(path, None)
+                if old is not None:
+                    self._total_bytes -= old[0]
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._put(path, size, now)
+            self.hits += 1
+        return path
+
+    # Registra um arquivo recém-gravado; passando do limite, acorda a limpeza.
+    def add(self, path: str):
+        path = os.path.abspath(path)
+        if not self._managed(path):
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            self._put(path, size, time.time())
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.folders[0]).free
+        except OSError:
+            return None
+
+    # Remove os menos usados até caber em max_bytes e deixar min_free_bytes livres
+    def evict(self) -> int:
+        removed = 0
+        now = time.time()
+        free = self._free_bytes()
+        while True:
+            with self._lock:
+                need_bytes = self._total_bytes - self.max_bytes
+                need_free = self.min_free_bytes - free if free is not None else 0
+                if (need_bytes <= 0 and need_free <= 0) or not self._index:
+                    break
+                path, (size, used_at) = next(iter(self._index.items()))
+                if now - used_at < self.min_age_seconds:
+                    break  # o resto é ainda mais recente
+                del self._index[path]
+                self._total_bytes -= size
+                # Outro processo no mesmo volume pode ter usado o arquivo (lookup
+                # atualiza o mtime): o mtime atual decide, não o uso visto aqui
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue  # já removido
+                if now - mtime < self.min_age_seconds:
+                    self._put(path, size, mtime)
+                    continue
+            _silent_remove(path)
+            removed += 1
+            if free is not None:
+                free += size
+            with self._lock:
+                self.evictions += 1
+                self.evicted_bytes += size
+        if removed:
+            print(f"🧹 Cache {self.name}: {removed} arquivos removidos")
+        return removed
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.evict)
+            except Exception as e:
+                print(f"⚠️ Cache {self.name}: falha na limpeza: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "free_bytes": self._free_bytes(),
+                "min_free_bytes": self.min_free_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+def _silent_remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,180 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Union
+from urllib.parse import urlparse
+
+import cairosvg
+import cairosvg.url
+
+RENDER_POOL_WORKERS = int(os.getenv("RENDER_POOL_WORKERS", str(os.cpu_count() or 1)))
+RENDER_POOL_QUEUE_SIZE = int(os.getenv("RENDER_POOL_QUEUE_SIZE", "8"))  # renders aguardando além dos workers
+# Ordem dos bytes do ARGB32 nativo do cairo (pixel de 32 bits na ordem da máquina)
+FRAME_PIX_FMT = "bgra" if sys.byteorder == "little" else "argb"
+
+
+class RenderPoolBusy(RuntimeError):
+
+    def __init__(self, message: str, status_code: int = 429):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+EMPTY_RESOURCE = b'<svg width="1" height="1"></svg>'
+
+
+# url_fetcher do cairosvg para os hrefs originais: as imagens já baixadas chegam em
+# `resources` (URL -> bytes, caminho de um blob do cache de imagens ou uma tupla
+# dessas alternativas) e são lidas
+# direto, sem data URI em base64 no SVG. data: URIs presentes no SVG continuam
+# funcionando; qualquer outra URL vira um recurso vazio (o worker nunca acessa a rede
+# ou o disco por conta própria).
+def resource_fetcher(resources: Dict[str, Union[bytes, str, tuple]]):
+    resources = {**{urlparse(url).geturl(): value for url, value in resources.items()}, **resources}
+
+    def fetch(url: str, resource_type: str) -> bytes:
+        value = resources.get(url)
+        # Uma tupla lista alternativas em ordem: o arquivo de uma variante pode ser
+        # removido pela limpeza de cache entre a escolha e o render
+        for candidate in value if isinstance(value, tuple) else (value,):
+            if isinstance(candidate, str):
+                try:
+                    with open(candidate, "rb") as f:
+                        return f.read()
+                except OSError:
+                    continue
+            if candidate is not None:
+                return candidate
+        if url.startswith("data:"):
+            return cairosvg.url.fetch(url, resource_type)
+        return EMPTY_RESOURCE
+
+    return fetch
+
+
+# Executado dentro dos processos do pool: precisa ser uma função de módulo (picklable).
+def render_svg(svg_bytes: bytes, output_width: int = None, output_height: int = None,
+               scale: float = 1.0, unsafe: bool = False, write_to: str = None,
+               resources: Dict[str, Union[bytes, str, tuple]] = None):
+    options = {"url_fetcher": resource_fetcher(resources)} if resources is not None else {}
+    return cairosvg.svg2png(
+        bytestring=svg_bytes,
+        write_to=write_to,
+        output_width=output_width,
+        output_height=output_height,
+        scale=scale,
+        unsafe=unsafe,
+        **options
+    )
+
+
+# Quadro cru para o pipe do ffmpeg (-f rawvideo -pix_fmt FRAME_PIX_FMT): o buffer
+# ARGB32 da superfície do cairo, sem codificar/decodificar PNG. O alfa é
+# pré-multiplicado, ou seja, áreas transparentes saem compostas sobre preto.
+def render_svg_frame(svg_bytes: bytes, output_width: int, output_height: int, unsafe: bool = False,
+                     resources: Dict[str, Union[bytes, str, tuple]] = None) -> bytes:
+    from cairosvg.parser import Tree
+    from cairosvg.surface import PNGSurface
+
+    options = {"url_fetcher": resource_fetcher(resources)} if resources is not None else {}
+    surface = PNGSurface(Tree(bytestring=svg_bytes, unsafe=unsafe, **options), None, 96,
+                         output_width=output_width, output_height=output_height)
+    image = surface.cairo
+    image.flush()
+    width, height, stride = image.get_width(), image.get_height(), image.get_stride()
+    if (width, height) != (output_width, output_height):
+        raise ValueError(f"Quadro com tamanho inesperado: {width}x{height}")
+    data = bytes(image.get_data())
+    if stride == width * 4:
+        return data
+    return b"".join(data[row * stride:row * stride + width * 4] for row in range(height))
+
+
+# Pool de processos para a rasterização (CPU-bound) com fila limitada: quando já há
+# workers + queue_size renders em andamento, novas requisições são recusadas com 429
+# em vez de se acumularem e travarem o event loop.
+class RenderPool:
+
+    def __init__(self, workers: int = RENDER_POOL_WORKERS, queue_size: int = RENDER_POOL_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self._executor = None
+        self._released = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _full(self) -> bool:
+        return self.in_flight >= self.workers + self.queue_size
+
+    # wait=True (quadros de uma animação já aceita): aguarda uma vaga em vez de
+    # recusar, para um render longo não falhar no meio.
+    async def render(self, fn, *args, wait: bool = False):
+        while self._full():
+            if not wait:
+                self.rejected += 1
+                raise RenderPoolBusy("Fila de renderização cheia, tente novamente em instantes.", status_code=429)
+            if self._released is None:
+                self._released = asyncio.Event()
+            await self._released.wait()
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._executor = None
+            raise RenderPoolBusy("Pool de renderização reiniciando, tente novamente.", status_code=503)
+
+        # A vaga só volta quando o worker termina: cancelar quem espera (prazo estourado)
+        # não interrompe um render que já começou, só um que ainda estava na fila
+        self.in_flight += 1
+        future.add_done_callback(lambda _: _call_soon(loop, self._release))
+        try:
+            result = await asyncio.wrap_future(future)
+            self.completed += 1
+            return result
+        except BrokenProcessPool:
+            self._executor = None
+            raise RenderPoolBusy("Pool de renderização reiniciando, tente novamente.", status_code=503)
+
+    def _release(self):
+        self.in_flight -= 1
+        if self._released is not None:
+            self._released.set()
+            self._released = None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback):
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass  # loop já encerrado (shutdown)
+
+
+render_pool = RenderPool()
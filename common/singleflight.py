@@ -0,0 +1,41 @@
+import asyncio
+
+
+# Requisições idênticas simultâneas (mesma chave) aguardam uma única execução em
+# andamento e recebem o mesmo resultado. A execução roda como task própria, então
+# o cancelamento de quem a iniciou não derruba os demais que estão esperando.
+class SingleFlight:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executions = 0
+        self.coalesced = 0
+        self._calls = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+            print(f"🔗 {self.name}: requisição idêntica aguardando execução em andamento")
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            self._calls.pop(key)
+        if not task.cancelled():
+            task.exception()  # marca a exceção como consumida mesmo sem ninguém aguardando
+
+    def stats(self) -> dict:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
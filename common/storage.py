@@ -0,0 +1,251 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+from typing import Optional
+from urllib.parse import quote
+
+import aiohttp
+
+from common.governor import governor
+from common.http_pool import get_session
+
+STORAGE_URL = os.getenv("STORAGE_URL") or os.getenv("SUPABASE_URL")  # STORAGE_URL aponta para um servidor local nos testes
+STORAGE_KEY = os.getenv("SUPABASE_KEY")
+STORAGE_RETRIES = int(os.getenv("STORAGE_RETRIES", "4"))
+STORAGE_BACKOFF_SECONDS = float(os.getenv("STORAGE_BACKOFF_SECONDS", "0.5"))
+STORAGE_TIMEOUT_SECONDS = float(os.getenv("STORAGE_TIMEOUT_SECONDS", "120"))
+STORAGE_TUS_THRESHOLD_MB = int(os.getenv("STORAGE_TUS_THRESHOLD_MB", "6"))  # acima disso, upload resumível
+TUS_CHUNK_BYTES = 6 * 1024 * 1024  # o Supabase exige blocos de exatamente 6MB (exceto o último)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class StorageError(RuntimeError):
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _Retryable(Exception):
+    pass
+
+
+# Cliente assíncrono do Storage do Supabase (API REST + TUS) sobre a sessão HTTP
+# compartilhada: uploads concorrentes limitados (estágio "upload" do governador), retry com backoff exponencial,
+# upload resumível para arquivos grandes e consulta do objeto antes do envio. Cada
+# objeto leva o sha256 dos bytes nos metadados do usuário (x-metadata / metadata do
+# TUS); se o objeto com o mesmo nome já tem o mesmo sha256, o upload é pulado (um
+# re-render não falha mais com "Duplicate"). Conteúdo diferente, ou objeto sem o
+# sha256 (enviado antes disso), é sobrescrito com x-upsert.
+class SupabaseStorage:
+
+    def __init__(self, bucket: str, url: str = STORAGE_URL, key: str = STORAGE_KEY,
+                 retries: int = STORAGE_RETRIES):
+        self.bucket = bucket
+        self.url = (url or "").rstrip("/")
+        self.key = key
+        self.retries = max(0, retries)
+        self.uploads = 0
+        self.deduplicated = 0
+        self.resumable_uploads = 0
+        self.retried = 0
+        self.failures = 0
+        self.bytes_uploaded = 0
+
+    def _headers(self, **extra) -> dict:
+        return {"Authorization": f"Bearer {self.key}", "apikey": self.key or "", **extra}
+
+    def _object_path(self, path: str) -> str:
+        return f"{quote(self.bucket)}/{quote(path)}"
+
+    def public_url(self, path: str) -> str:
+        return f"{self.url}/storage/v1/object/public/{self._object_path(path)}"
+
+    async def upload_bytes(self, path: str, data: bytes, content_type: str) -> str:
+        return await self._upload(path, len(data), content_type, data=data)
+
+    async def upload_file(self, file_path: str, path: str, content_type: str) -> str:
+        return await self._upload(path, os.path.getsize(file_path), content_type, file_path=file_path)
+
+    async def _upload(self, path: str, size: int, content_type: str, data: bytes = None, file_path: str = None) -> str:
+        sha = hashlib.sha256(data).hexdigest() if data is not None else \
+            await asyncio.to_thread(_sha256_file, file_path)
+        async with governor.slot("upload"):
+            try:
+                if await self._retry(lambda: self._exists(path, sha)):
+                    self.deduplicated += 1
+                    return self.public_url(path)
+
+                if size > STORAGE_TUS_THRESHOLD_MB * 1024 * 1024:
+                    await self._upload_resumable(path, size, content_type, sha, data, file_path)
+                    self.resumable_uploads += 1
+                else:
+                    if data is None:
+                        data = await asyncio.to_thread(_read_file, file_path)
+                    await self._retry(lambda: self._post_object(path, data, content_type, sha))
+            except Exception:
+                self.failures += 1
+                raise
+
+            self.uploads += 1
+            self.bytes_uploaded += size
+            return self.public_url(path)
+
+    async def _retry(self, attempt):
+        for retry in range(self.retries + 1):
+            try:
+                return await attempt()
+            except (_Retryable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if retry == self.retries:
+                    raise StorageError(f"Falha no upload após {retry + 1} tentativas: {str(e)}")
+                self.retried += 1
+                await _backoff(retry)
+
+    async def _request(self, method: str, url: str, **kwargs) -> aiohttp.ClientResponse:
+        session = await get_session()
+        timeout = aiohttp.ClientTimeout(total=STORAGE_TIMEOUT_SECONDS)
+        response = await session.request(method, url, timeout=timeout, **kwargs)
+        if response.status in RETRYABLE_STATUS:
+            body = await response.text()
+            response.release()
+            raise _Retryable(f"HTTP {response.status}: {body[:200]}")
+        return response
+
+    async def _raise_for_status(self, response: aiohttp.ClientResponse, action: str):
+        if response.status >= 400:
+            body = await response.text()
+            response.release()
+            raise StorageError(f"Erro no Storage ({action}): HTTP {response.status}: {body[:200]}", response.status)
+
+    # O Storage responde 400/404 para objeto inexistente; qualquer status diferente de
+    # 200 conta como "não existe" e o upload segue
+    async def _exists(self, path: str, sha: str) -> bool:
+        response = await self._request(
+            "GET", f"{self.url}/storage/v1/object/info/authenticated/{self._object_path(path)}", headers=self._headers()
+        )
+        async with response:
+            if response.status != 200:
+                return False
+            info = await response.json(content_type=None)
+        metadata = info.get("user_metadata") or info.get("metadata") or {}
+        return metadata.get("sha256") == sha
+
+    # x-upsert: se outro processo enviou o mesmo nome entre o HEAD e o POST, é o
+    # mesmo SVG renderizado e sobrescrever é inofensivo
+    async def _post_object(self, path: str, data: bytes, content_type: str, sha: str):
+        response = await self._request(
+            "POST", f"{self.url}/storage/v1/object/{self._object_path(path)}",
+            data=data, headers=self._headers(**{
+                "Content-Type": content_type,
+                "x-upsert": "true",
+                "x-metadata": base64.b64encode(_user_metadata(sha).encode()).decode(),
+            })
+        )
+        async with response:
+            await self._raise_for_status(response, "upload")
+
+    # Protocolo TUS: cria o upload e envia blocos de 6MB; depois de uma falha, o HEAD
+    # no upload devolve o Upload-Offset aceito e o envio continua dali.
+    async def _upload_resumable(self, path: str, size: int, content_type: str, sha: str,
+                                data: bytes = None, file_path: str = None):
+        metadata = {
+            "bucketName": self.bucket,
+            "objectName": path,
+            "contentType": content_type,
+            "cacheControl": "3600",
+            "metadata": _user_metadata(sha),
+        }
+        upload_metadata = ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in metadata.items())
+
+        async def create() -> str:
+            response = await self._request(
+                "POST", f"{self.url}/storage/v1/upload/resumable",
+                headers=self._headers(**{
+                    "Tus-Resumable": "1.0.0",
+                    "Upload-Length": str(size),
+                    "Upload-Metadata": upload_metadata,
+                    "x-upsert": "true",
+                })
+            )
+            async with response:
+                await self._raise_for_status(response, "criação do upload resumível")
+                location = response.headers.get("Location")
+            if not location:
+                raise StorageError("Upload resumível sem Location na resposta")
+            return location if location.startswith("http") else f"{self.url}{location}"
+
+        upload_url = await self._retry(create)
+        offset = 0
+        failures = 0
+        while offset < size:
+            chunk = data[offset:offset + TUS_CHUNK_BYTES] if data is not None else \
+                await asyncio.to_thread(_read_file, file_path, offset, TUS_CHUNK_BYTES)
+            try:
+                offset = await self._patch_chunk(upload_url, offset, chunk)
+                failures = 0
+            except (_Retryable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if failures == self.retries:
+                    raise StorageError(f"Falha no upload resumível em {offset} bytes: {str(e)}")
+                self.retried += 1
+                await _backoff(failures)
+                failures += 1
+                offset = await self._retry(lambda: self._upload_offset(upload_url))
+
+    async def _patch_chunk(self, upload_url: str, offset: int, chunk: bytes) -> int:
+        response = await self._request(
+            "PATCH", upload_url, data=chunk,
+            headers=self._headers(**{
+                "Tus-Resumable": "1.0.0",
+                "Upload-Offset": str(offset),
+                "Content-Type": "application/offset+octet-stream",
+            })
+        )
+        async with response:
+            if response.status == 409:  # offset divergente: consulta o servidor e continua
+                raise _Retryable("Upload-Offset divergente")
+            await self._raise_for_status(response, "envio de bloco")
+            return int(response.headers.get("Upload-Offset", offset + len(chunk)))
+
+    async def _upload_offset(self, upload_url: str) -> int:
+        response = await self._request("HEAD", upload_url, headers=self._headers(**{"Tus-Resumable": "1.0.0"}))
+        async with response:
+            await self._raise_for_status(response, "consulta do upload resumível")
+            return int(response.headers["Upload-Offset"])
+
+    def stats(self) -> dict:
+        return {
+            "bucket": self.bucket,
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "resumable_uploads": self.resumable_uploads,
+            "retried": self.retried,
+            "failures": self.failures,
+            "bytes_uploaded": self.bytes_uploaded,
+        }
+
+
+async def _backoff(retry: int):
+    delay = STORAGE_BACKOFF_SECONDS * (2 ** retry)
+    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+
+def _user_metadata(sha: str) -> str:
+    return json.dumps({"sha256": sha})
+
+
+def _sha256_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_file(file_path: str, offset: int = 0, size: Optional[int] = None) -> bytes:
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        return f.read() if size is None else f.read(size)
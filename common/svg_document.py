@@ -0,0 +1,134 @@
+import re
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree as ET
+
+from common.svg_hashing import XLINK_HREF
+from common.svg_metadata import (ANIMATION_TAGS, VIDEO_URL_ATTRIBUTES, is_video_area, parse_dimensions,
+                                 tree_cache_keys, tree_image_slots)
+
+
+# SVG analisado uma única vez por requisição: a árvore guarda só as referências
+# (URLs) das imagens, e os slots de imagem, áreas de vídeo e atributos da raiz são
+# indexados numa única passada. O base64 só aparece na serialização final, emendado
+# no texto já serializado, sem voltar à árvore nem ser reparseado.
+class SVGDocument:
+
+    def __init__(self, svg: str):
+        self.source = svg
+        try:
+            self.root = ET.fromstring(svg)
+        except ET.ParseError as e:
+            raise ValueError(f"SVG inválido: {str(e)}")
+
+        self._image_refs = []
+        self.video_areas = []
+        self.animations = []
+        self._video_candidates = {}
+        self._keys = {}
+        for elem in self.root.iter():
+            if not isinstance(elem.tag, str):
+                continue
+            local_name = elem.tag.rsplit('}', 1)[-1]
+            if local_name == 'image':
+                attr = XLINK_HREF if elem.get(XLINK_HREF) else 'href'
+                if elem.get(attr):
+                    self._image_refs.append((elem, attr))
+            elif local_name in ANIMATION_TAGS:
+                self.animations.append(elem)
+            if is_video_area(elem):
+                self.video_areas.append(elem)
+
+            element_id = elem.get("id", "")
+            if element_id == "video-area" and elem is not self.root:
+                self._video_candidates.setdefault("id", elem)
+            if "video" in element_id.lower():
+                self._video_candidates.setdefault("partial_id", elem)
+            if any(elem.get(name) for name in VIDEO_URL_ATTRIBUTES):
+                self._video_candidates.setdefault("attribute", elem)
+
+    def get(self, key: str, default: str = None) -> Optional[str]:
+        return self.root.get(key, default)
+
+    def image_hrefs(self) -> List[str]:
+        return [elem.get(attr) for elem, attr in self._image_refs]
+
+    def image_urls(self) -> List[str]:
+        return [href for href in self.image_hrefs() if href.startswith('http')]
+
+    def image_slots(self) -> List[dict]:
+        return tree_image_slots(self.root)
+
+    def dimensions(self, fallback: Tuple[int, int]) -> Tuple[int, int]:
+        return parse_dimensions(self.get("width"), self.get("height"), self.get("viewBox"), fallback)
+
+    # Elemento de vídeo principal, na ordem de preferência histórica: id="video-area",
+    # qualquer id contendo "video", qualquer elemento com URL de vídeo.
+    def video_element(self):
+        for kind in ("id", "partial_id", "attribute"):
+            if kind in self._video_candidates:
+                return self._video_candidates[kind]
+        return None
+
+    @contextmanager
+    def _patched(self, changes: list):
+        saved = {}
+        for elem, attr, value in changes:
+            saved.setdefault(id(elem), (elem, dict(elem.attrib)))
+            if value is None:
+                elem.attrib.pop(attr, None)
+            else:
+                elem.set(attr, value)
+        try:
+            yield
+        finally:
+            # Restaura o dicionário inteiro para manter a ordem dos atributos
+            for elem, attrib in saved.values():
+                elem.attrib.clear()
+                elem.attrib.update(attrib)
+
+    def _tostring(self) -> str:
+        return ET.tostring(self.root, encoding='utf-8', method='xml').decode('utf-8')
+
+    # Chave canônica, a mesma de svg_metadata.extract_metadata: hrefs remotos viram
+    # um marcador (a chave não depende de aspas, espaços ou de as imagens já terem sido
+    # embutidas) e as URLs entram em ordem. Com drop_video_urls, é a chave do template
+    # visual (mesmo fundo para vídeos de origem diferentes).
+    def cache_key(self, drop_video_urls: bool = False) -> str:
+        if not self._keys:
+            self._keys = tree_cache_keys(self.root, self.image_urls())
+        return self._keys[drop_video_urls]
+
+    def template_key(self) -> str:
+        return self.cache_key(drop_video_urls=True)
+
+    # Serializa trocando os hrefs presentes em `embedded` (URL -> data URI). Na árvore
+    # entra só um marcador curto; o conteúdo é emendado no texto final de uma vez.
+    # `resolve_href` converte o valor do atributo na chave de `embedded` e `transform`
+    # é aplicado ao texto antes da emenda (usados pelos templates). `patches`
+    # (elemento, atributo, valor) altera atributos só nesta serialização (quadros de
+    # animação) e sempre serializa a árvore.
+    def serialize(self, embedded: Dict[str, str] = None,
+                  resolve_href: Callable[[str], str] = None,
+                  transform: Callable[[str], str] = None,
+                  patches: list = None) -> str:
+        embedded = embedded or {}
+        prefix = f"urn:svg-document:{uuid.uuid4().hex}:"
+        values = []
+        changes = list(patches or [])
+        for elem, attr in self._image_refs:
+            href = elem.get(attr)
+            value = embedded.get(resolve_href(href) if resolve_href else href)
+            if value:
+                changes.append((elem, attr, f"{prefix}{len(values)}"))
+                values.append(value)
+
+        if not changes and patches is None:
+            return transform(self.source) if transform else self.source
+
+        with self._patched(changes):
+            text = self._tostring()
+        if transform:
+            text = transform(text)
+        return re.sub(re.escape(prefix) + r'(\d+)', lambda match: values[int(match.group(1))], text)
@@ -0,0 +1,15 @@
+import hashlib
+from xml.etree import ElementTree as ET
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+XLINK_HREF = f'{{{XLINK_NS}}}href'
+
+# Serializa como <svg xmlns=...>/xlink:href em vez de ns0:/ns1:
+ET.register_namespace('', SVG_NS)
+ET.register_namespace('xlink', XLINK_NS)
+
+
+def hash_svg(svg: str) -> str:
+    return hashlib.sha256(svg.encode("utf-8")).hexdigest()
+
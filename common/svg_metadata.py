@@ -0,0 +1,272 @@
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree as ET
+
+from common.svg_hashing import XLINK_HREF
+
+VIDEO_URL_ATTRIBUTES = ("video_url", "data-video-url")
+ANIMATION_TAGS = {"animate", "set", "animateTransform", "animateColor", "animateMotion"}
+FEED_CHUNK_SIZE = 64 * 1024
+# Conteúdo dentro destes elementos (ou sob um transform que não seja só translate) não
+# é desenhado no tamanho dos atributos: as imagens ali não têm tamanho final conhecido.
+RESCALING_CONTAINERS = {"svg", "symbol", "pattern", "defs", "mask", "clipPath", "marker", "use"}
+_TRANSLATE_ONLY = re.compile(r'^\s*(?:translate\([^)]*\)[\s,]*)*$')
+
+# Unidades absolutas em px (CSS: 96 px por polegada); em/ex com a fonte padrão de 16px
+LENGTH_UNITS = {"": 1.0, "px": 1.0, "pt": 96 / 72, "pc": 16.0, "mm": 96 / 25.4, "cm": 96 / 2.54, "in": 96.0,
+                "em": 16.0, "ex": 8.0}
+_LENGTH = re.compile(r'^([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-zA-Z]*|%)$')
+
+
+# Comprimento SVG em px; porcentagens precisam da referência (largura/altura da viewBox)
+def parse_length(value: str, reference: float = None) -> float:
+    match = _LENGTH.match(value.strip().replace(",", "."))
+    if not match:
+        raise ValueError(f"Comprimento inválido: {value}")
+    number, unit = float(match.group(1)), match.group(2).lower()
+    if unit == "%":
+        if reference is None:
+            raise ValueError(f"Porcentagem sem referência: {value}")
+        return number * reference / 100
+    if unit not in LENGTH_UNITS:
+        raise ValueError(f"Unidade desconhecida: {value}")
+    return number * LENGTH_UNITS[unit]
+
+
+def parse_view_box(view_box: Optional[str]) -> Optional[Tuple[float, float]]:
+    try:
+        values = view_box.replace(",", " ").split()
+        width, height = float(values[2]), float(values[3])
+    except (AttributeError, ValueError, IndexError):
+        return None
+    return (width, height) if width > 0 and height > 0 else None
+
+
+# width/height da raiz (com unidades ou % da viewBox); faltando um dos dois, a
+# proporção vem da viewBox; sem nada utilizável, `fallback`.
+def parse_dimensions(width: Optional[str], height: Optional[str], view_box: Optional[str],
+                     fallback: Tuple[int, int]) -> Tuple[int, int]:
+    box = parse_view_box(view_box)
+
+    def length(value, axis):
+        try:
+            return parse_length(value, box[axis] if box else None)
+        except (AttributeError, ValueError):
+            return None
+
+    w, h = length(width, 0), length(height, 1)
+    if w and h:
+        return int(w), int(h)
+    if box is None:
+        return fallback
+    if w:
+        return int(w), int(w * box[1] / box[0])
+    if h:
+        return int(h * box[0] / box[1]), int(h)
+    return int(box[0]), int(box[1])
+
+
+def ensure_namespaces(svg: str) -> str:
+    if 'xmlns:xlink' not in svg:
+        svg = re.sub(r'<svg\b', r'<svg xmlns:xlink="http://www.w3.org/1999/xlink"', svg, count=1)
+    if 'xmlns="' not in svg:
+        svg = re.sub(r'<svg\b', r'<svg xmlns="http://www.w3.org/2000/svg"', svg, count=1)
+    return svg
+
+
+VIDEO_AREA_ID = re.compile(r"video-area-\d+")  # áreas extras: video-area-2, video-area-3...
+
+
+def is_video_area(elem) -> bool:
+    element_id = elem.get("id", "")
+    return element_id == "video-area" or VIDEO_AREA_ID.fullmatch(element_id) is not None
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _image_href_attr(elem) -> Optional[str]:
+    attr = XLINK_HREF if elem.get(XLINK_HREF) else 'href'
+    return attr if elem.get(attr) else None
+
+
+def _rescales(elem, is_root: bool) -> bool:
+    if not is_root and _local_name(elem.tag) in RESCALING_CONTAINERS:
+        return True
+    transform = elem.get("transform")
+    return bool(transform) and not _TRANSLATE_ONLY.match(transform)
+
+
+# Geometria de um <image>: "fixed" indica que ele é desenhado no tamanho dos próprios
+# atributos (sem transform/viewport acima que mude a escala).
+def _image_slot(elem, attr: str, rescaled: bool) -> dict:
+    return {
+        "href": elem.get(attr),
+        "width": elem.get("width"),
+        "height": elem.get("height"),
+        "preserveAspectRatio": elem.get("preserveAspectRatio"),
+        "fixed": not rescaled,
+    }
+
+
+def tree_image_slots(root) -> List[dict]:
+    slots = []
+    stack = [(root, False)]
+    while stack:
+        elem, rescaled = stack.pop()
+        if not isinstance(elem.tag, str):
+            continue
+        rescaled = rescaled or _rescales(elem, elem is root)
+        if _local_name(elem.tag) == 'image':
+            attr = _image_href_attr(elem)
+            if attr:
+                slots.append(_image_slot(elem, attr, rescaled))
+        stack.extend((child, rescaled) for child in reversed(elem))
+    return slots
+
+
+# Registro canônico de um elemento para a chave de cache, emitido em pós-ordem (filhos
+# antes do pai, com os "tails" dos filhos no registro do pai): a sequência identifica a
+# árvore e pode ser produzida tanto em streaming quanto de uma árvore já montada. Hrefs
+# remotos de <image> viram um marcador (as URLs entram no fim da chave, em ordem).
+def _element_record(elem, child_tails: List[str], drop_video_urls: bool) -> bytes:
+    attrib = dict(elem.attrib)
+    if _local_name(elem.tag) == 'image':
+        attr = _image_href_attr(elem)
+        if attr and attrib[attr].startswith('http'):
+            attrib[attr] = 'NORMALIZED'
+    if drop_video_urls:
+        for name in VIDEO_URL_ATTRIBUTES:
+            attrib.pop(name, None)
+    record = [elem.tag, sorted(attrib.items()), elem.text or "", child_tails]
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class _KeyBuilder:
+
+    def __init__(self):
+        self._hashers = {False: hashlib.sha256(), True: hashlib.sha256()}
+
+    def add(self, elem):
+        tails = [child.tail or "" for child in elem]
+        for drop_video_urls, hasher in self._hashers.items():
+            hasher.update(_element_record(elem, tails, drop_video_urls))
+
+    def keys(self, image_urls: List[str]) -> Dict[bool, str]:
+        suffix = "\n".join(image_urls).encode("utf-8")
+        keys = {}
+        for drop_video_urls, hasher in self._hashers.items():
+            hasher.update(b"\0" + suffix)
+            keys[drop_video_urls] = hasher.hexdigest()
+        return keys
+
+
+# Mesmas chaves de `extract_metadata`, a partir de uma árvore já analisada
+def tree_cache_keys(root, image_urls: List[str]) -> Dict[bool, str]:
+    builder = _KeyBuilder()
+    stack = [(root, False)]
+    while stack:
+        elem, visited = stack.pop()
+        if visited:
+            builder.add(elem)
+            continue
+        stack.append((elem, True))
+        stack.extend((child, False) for child in reversed(elem))
+    return builder.keys(image_urls)
+
+
+# Metadados de um SVG lidos numa única passada em streaming sobre o texto original:
+# cada elemento é descartado ao fechar, então a árvore nunca existe inteira na memória.
+# Basta para a chave de cache, dimensões, URLs das imagens e áreas de vídeo; a árvore
+# (SVGDocument) só é montada quando é preciso serializar ou renderizar.
+class SVGMetadata:
+
+    def __init__(self, source: str, root_attrs: dict, image_slots: List[dict], video_areas: List[dict],
+                 video_element: Optional[dict], has_animations: bool, keys: Dict[bool, str]):
+        self.source = source
+        self.root_attrs = root_attrs
+        self.image_slots = image_slots
+        self.image_hrefs = [slot["href"] for slot in image_slots]
+        self.video_areas = video_areas
+        self.video_element = video_element
+        self.has_animations = has_animations
+        self._keys = keys
+
+    def get(self, key: str, default: str = None) -> Optional[str]:
+        return self.root_attrs.get(key, default)
+
+    def image_urls(self) -> List[str]:
+        return [href for href in self.image_hrefs if href.startswith('http')]
+
+    def dimensions(self, fallback: Tuple[int, int]) -> Tuple[int, int]:
+        return parse_dimensions(self.get("width"), self.get("height"), self.get("viewBox"), fallback)
+
+    def cache_key(self, drop_video_urls: bool = False) -> str:
+        return self._keys[drop_video_urls]
+
+    def template_key(self) -> str:
+        return self.cache_key(drop_video_urls=True)
+
+
+def extract_metadata(svg: str) -> SVGMetadata:
+    parser = ET.XMLPullParser(events=("start", "end"))
+    builder = _KeyBuilder()
+    root_attrs = None
+    root = None
+    image_slots = []
+    rescaled = []  # por elemento aberto: se há mudança de escala até ele
+    video_areas = []
+    candidates = {}
+    has_animations = False
+
+    def handle(events):
+        nonlocal root_attrs, root, has_animations
+        for event, elem in events:
+            if event == "end":
+                rescaled.pop()
+                builder.add(elem)
+                # Os filhos já entraram na chave: libera a subárvore
+                for child in elem:
+                    child.attrib.clear()
+                del elem[:]
+                continue
+
+            if root is None:
+                root, root_attrs = elem, dict(elem.attrib)
+            rescaled.append((rescaled[-1] if rescaled else False) or _rescales(elem, elem is root))
+            local_name = _local_name(elem.tag)
+            if local_name == 'image':
+                attr = _image_href_attr(elem)
+                if attr:
+                    image_slots.append(_image_slot(elem, attr, rescaled[-1]))
+            elif local_name in ANIMATION_TAGS:
+                has_animations = True
+            if is_video_area(elem):
+                video_areas.append(dict(elem.attrib))
+
+            element_id = elem.get("id", "")
+            if element_id == "video-area" and elem is not root:
+                candidates.setdefault("id", dict(elem.attrib))
+            if "video" in element_id.lower():
+                candidates.setdefault("partial_id", dict(elem.attrib))
+            if any(elem.get(name) for name in VIDEO_URL_ATTRIBUTES):
+                candidates.setdefault("attribute", dict(elem.attrib))
+
+    try:
+        for start in range(0, len(svg), FEED_CHUNK_SIZE):
+            parser.feed(svg[start:start + FEED_CHUNK_SIZE])
+            handle(parser.read_events())
+        parser.close()
+        handle(parser.read_events())
+    except ET.ParseError as e:
+        raise ValueError(f"SVG inválido: {str(e)}")
+    if root is None:
+        raise ValueError("SVG inválido: documento vazio")
+
+    # Ordem de preferência histórica do elemento de vídeo principal
+    video_element = next((candidates[kind] for kind in ("id", "partial_id", "attribute") if kind in candidates), None)
+    urls = [slot["href"] for slot in image_slots if slot["href"].startswith('http')]
+    return SVGMetadata(svg, root_attrs, image_slots, video_areas, video_element, has_animations, builder.keys(urls))
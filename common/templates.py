@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from common.svg_document import SVGDocument
+from common.svg_metadata import VIDEO_URL_ATTRIBUTES, ensure_namespaces, parse_dimensions
+from common.svg_hashing import hash_svg
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*([A-Za-z_][\w.-]*)\s*\}\}')
+_XML_ATTR_ENTITIES = {'"': '&quot;', "'": '&apos;'}
+
+
+def _split(value: str) -> list:
+    return PLACEHOLDER_PATTERN.split(value or "")
+
+
+def _join(parts: list, variables: Dict[str, str], escape_xml: bool) -> str:
+    out = list(parts)
+    for i in range(1, len(out), 2):
+        value = str(variables[out[i]])
+        out[i] = escape(value, _XML_ATTR_ENTITIES) if escape_xml else value
+    return "".join(out)
+
+
+# SVG com marcadores {{nome}} analisado uma única vez no cadastro: o texto fica
+# pré-dividido em trechos fixos + variáveis, e dimensões, áreas de vídeo e slots de
+# imagem ficam guardados. Renderizar é só substituição, sem varrer/parsear o SVG.
+class SVGTemplate:
+
+    def __init__(self, svg: str, name: str = None):
+        self.id = hash_svg(svg)[:32]
+        self.name = name
+        self.svg = svg
+        self._parts = _split(svg)
+        self.variables = sorted(set(self._parts[1::2]))
+
+        try:
+            self.document = SVGDocument(svg)
+        except ValueError as e:
+            raise ValueError(f"Template {str(e)}")
+
+        self._root_attrs = {key: _split(self.document.get(key)) for key in ("width", "height", "viewBox")}
+        self._image_slots = [_split(href) for href in self.document.image_hrefs()]
+        self._image_geometry = [
+            {key: value if key == "fixed" else _split(value) for key, value in slot.items() if value is not None}
+            for slot in self.document.image_slots()
+        ]
+        self._video_areas = [
+            {key: _split(value) for key, value in elem.attrib.items()}
+            for elem in self.document.video_areas
+        ]
+        # Variáveis que só aparecem em URLs de vídeo não mudam o fundo renderizado
+        video_url_uses = Counter(
+            name for elem in self.document.root.iter() for attr in VIDEO_URL_ATTRIBUTES
+            for name in _split(elem.get(attr))[1::2]
+        )
+        uses = Counter(self._parts[1::2])
+        self._video_url_variables = {name for name, count in video_url_uses.items() if count == uses[name]}
+
+    def _check(self, variables: Dict[str, str]):
+        missing = [name for name in self.variables if name not in variables]
+        if missing:
+            raise ValueError(f"Variáveis ausentes para o template {self.id}: {', '.join(missing)}")
+
+    # Com `embedded` (URL -> data URI), os slots de imagem são trocados na serialização
+    # da árvore já analisada, sem parsear o SVG renderizado.
+    def render(self, variables: Dict[str, str], embedded: Dict[str, str] = None) -> str:
+        self._check(variables)
+        if not embedded:
+            return _join(self._parts, variables, escape_xml=True)
+        return self.document.serialize(
+            embedded,
+            resolve_href=lambda href: _join(_split(href), variables, escape_xml=False),
+            transform=lambda text: _join(_split(text), variables, escape_xml=True),
+        )
+
+    def cache_key(self, variables: Dict[str, str], drop_video_urls: bool = False) -> str:
+        used = {
+            name: str(variables[name]) for name in self.variables
+            if not (drop_video_urls and name in self._video_url_variables)
+        }
+        return hash_svg(f"{self.id}\n{json.dumps(used, sort_keys=True)}")
+
+    # Como SVGDocument.template_key: a mesma chave para qualquer vídeo
+    def template_key(self, variables: Dict[str, str]) -> str:
+        return self.cache_key(variables, drop_video_urls=True)
+
+    def image_urls(self, variables: Dict[str, str]) -> List[str]:
+        urls = [_join(parts, variables, escape_xml=False) for parts in self._image_slots]
+        return [url for url in urls if url.startswith("http")]
+
+    def image_slots(self, variables: Dict[str, str]) -> List[dict]:
+        return [
+            {key: value if key == "fixed" else _join(value, variables, escape_xml=False)
+             for key, value in slot.items()}
+            for slot in self._image_geometry
+        ]
+
+    def root_attribute(self, key: str, variables: Dict[str, str]) -> Optional[str]:
+        parts = self._root_attrs.get(key)
+        value = _join(parts, variables, escape_xml=False) if parts else ""
+        return value or None
+
+    def dimensions(self, variables: Dict[str, str], fallback: Tuple[int, int]) -> Tuple[int, int]:
+        return parse_dimensions(
+            self.root_attribute("width", variables),
+            self.root_attribute("height", variables),
+            self.root_attribute("viewBox", variables),
+            fallback,
+        )
+
+    def video_areas(self, variables: Dict[str, str]) -> List[dict]:
+        return [
+            {key: _join(parts, variables, escape_xml=False) for key, parts in area.items()}
+            for area in self._video_areas
+        ]
+
+    def describe(self) -> dict:
+        empty = {name: "" for name in self.variables}
+        return {
+            "id": self.id,
+            "name": self.name,
+            "variables": self.variables,
+            "width": self.root_attribute("width", empty),
+            "height": self.root_attribute("height", empty),
+            "viewBox": self.root_attribute("viewBox", empty),
+            "image_slots": ["".join(f"{{{{{p}}}}}" if i % 2 else p for i, p in enumerate(parts)) for parts in self._image_slots],
+            "video_areas": len(self._video_areas),
+        }
+
+
+# Templates ficam em memória (já analisados) e em disco (<id>.svg + <id>.json),
+# para serem recarregados depois de um reinício sem novo POST.
+class TemplateRegistry:
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._templates = {}
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(folder, exist_ok=True)
+        except OSError as e:
+            print(f"[AVISO] Templates não serão persistidos ({folder}): {e}")
+
+    # Os dois serviços cadastram o SVG já normalizado (namespaces), então o mesmo
+    # template tem o mesmo id em qualquer um deles
+    def add(self, svg: str, name: str = None) -> SVGTemplate:
+        svg = ensure_namespaces(svg)
+        template = SVGTemplate(svg, name)
+        with self._lock:
+            self._templates[template.id] = template
+        try:
+            with open(os.path.join(self.folder, f"{template.id}.svg"), "w", encoding="utf-8") as f:
+                f.write(svg)
+            with open(os.path.join(self.folder, f"{template.id}.json"), "w", encoding="utf-8") as f:
+                json.dump({"name": name}, f)
+        except OSError as e:
+            print(f"[AVISO] Falha ao persistir template {template.id}: {e}")
+        return template
+
+    def get(self, template_id: str) -> Optional[SVGTemplate]:
+        template = self._templates.get(template_id)
+        if template is not None or not re.fullmatch(r'[0-9a-f]{32}', template_id):
+            return template
+
+        try:
+            with open(os.path.join(self.folder, f"{template_id}.svg"), "r", encoding="utf-8") as f:
+                svg = f.read()
+            name = None
+            meta_path = os.path.join(self.folder, f"{template_id}.json")
+            if os.path.isfile(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    name = json.load(f).get("name")
+        except OSError:
+            return None
+
+        template = SVGTemplate(svg, name)
+        with self._lock:
+            self._templates[template.id] = template
+        return template
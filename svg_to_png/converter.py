@@ -1,164 +1,306 @@
 import base64
 import re
-import requests
 import os
 import mimetypes
-import cairosvg
-import time
-from io import BytesIO
-from typing import List, Dict, Tuple
-import hashlib
-from functools import lru_cache
-from supabase import create_client
+import asyncio
+from typing import Callable, List, Dict, Tuple
 from dotenv import load_dotenv
+from common.http_pool import fetch_assets
+from common.image_variants import image_targets, image_variants
+from common.governor import governor, raster_bytes
+from common.metrics import stage
+from common.render_pool import RenderPoolBusy, render_pool, render_svg
+from common.output_cache import OutputCache
+from common.result_cache import ResultCache
+from common.singleflight import SingleFlight
+from common.storage import SupabaseStorage
+from common.svg_document import SVGDocument
+from common.svg_metadata import SVGMetadata, ensure_namespaces, extract_metadata
+from common.templates import SVGTemplate, TemplateRegistry
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
+STORAGE_URL = os.getenv("STORAGE_URL") or SUPABASE_URL  # stand-in local dos benchmarks
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_IMAGES_BUCKET", "posts_images")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+storage = SupabaseStorage(SUPABASE_BUCKET, STORAGE_URL, SUPABASE_KEY)
 
-def upload_png_to_supabase(file_path: str, filename: str) -> str:
-    with open(file_path, "rb") as f:
-        supabase.storage.from_(SUPABASE_BUCKET).upload(
-            path=filename,
-            file=f,
-            file_options={"content-type": "image/png"}
-        )
-    public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(filename)
-    return public_url
+async def upload_png_to_supabase(png_bytes: bytes, filename: str) -> str:
+    return await storage.upload_bytes(filename, png_bytes, "image/png")
 
-_svg_png_cache = {}
-MAX_CACHE_SIZE = 100
-TIMEOUT_SECONDS = 10  
+FETCH_DEADLINE_SECONDS = 10  
 SCALE_FACTOR = 1.0   
 FALLBACK_SIZE = (1080, 1350)  
 CACHE_FOLDER = "/app/generated_cache"
+BATCH_MAX_SLIDES = int(os.getenv("BATCH_MAX_SLIDES", "50"))
+BATCH_RENDER_CONCURRENCY = int(os.getenv("BATCH_RENDER_CONCURRENCY", str(render_pool.workers)))  # slides de um lote no pool ao mesmo tempo
+PNG_DISK_CACHE = os.getenv("PNG_DISK_CACHE", "false").lower() == "true"  # camada opcional em disco
+PNG_OUTPUT_CACHE_BYTES = int(os.getenv("PNG_OUTPUT_CACHE_MB", "1024")) * 1024 * 1024
+PNG_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))  # ponta a ponta, por slide
 os.makedirs(CACHE_FOLDER, exist_ok=True)
 
-def convert_svg_images_to_base64_and_save(svg_content: str, output_folder: str) -> List[Dict[str, str]]:
+# PNGs da camada em disco; results.sqlite3 e templates/ não são arquivos de saída
+output_cache = OutputCache("generated_cache", [CACHE_FOLDER], (".png",), PNG_OUTPUT_CACHE_BYTES)
+
+_svg_png_cache = ResultCache(os.path.join(CACHE_FOLDER, "results.sqlite3"))
+_png_flight = SingleFlight("svg_to_png")
+template_registry = TemplateRegistry(os.path.join(CACHE_FOLDER, "templates"))
+
+async def convert_svg_images_to_base64_and_save(svg_content: str, output_folder: str,
+                                                embed_images: bool = False) -> List[Dict[str, str]]:
     os.makedirs(output_folder, exist_ok=True)
 
     svg_elements = re.findall(r'(<svg[\s\S]*?</svg>)', svg_content)
     if not svg_elements:
         return []
-    
+
+    slides = _prepare_slides([(0, idx, svg) for idx, svg in enumerate(svg_elements)])
+    results = await _convert_slides(slides, output_folder, embed_images)
+
     processed_files = []
+    for result in results:
+        if result["status"] == "ok":
+            processed_files.append({"svg": result["svg"], "png": result["png"]})
+        elif result.get("retryable"):
+            raise RenderPoolBusy(result["error"], status_code=result["status_code"])
+        else:
+            print(f"[ERRO] Falha no SVG #{result['slide']+1}: {result['error']}")
 
-    for idx, svg in enumerate(svg_elements):
-        try:
-            processed_svg = _process_svg_images(svg)
-            processed_svg = _ensure_xlink_namespace(processed_svg)
-
-            svg_hash = hash_svg(processed_svg)
-            cached = _svg_png_cache.get(svg_hash)
-            if cached and time.time() - cached["timestamp"] <= 600:  # 10 minutos
-                png_path = cached["path"]
-            else:
-                png_path = _save_svg_and_convert(processed_svg, svg_hash, output_folder)
-                _svg_png_cache[svg_hash] = {
-                    "url": png_path,  
-                    "timestamp": time.time()
-                }
-
-                if len(_svg_png_cache) > MAX_CACHE_SIZE:
-                    _svg_png_cache.pop(next(iter(_svg_png_cache)))
-
-            processed_files.append({"svg": processed_svg, "png": _svg_png_cache[svg_hash]["url"]})
-        except Exception as e:
-            print(f"[ERRO] Falha no SVG #{idx+1}: {str(e)}")
-            continue
-    
-    # Clean up expired cache entries before returning
-    purge_expired_cache()
     return processed_files
 
-def _process_svg_images(svg: str) -> str:
-    pattern = r'(<image\b[\s\S]*?(?:xlink:href|href)\s*=\s*["\'])(https?://[^"\']+)(["\'])'
+# Lote de documentos (cada um pode ser um carrossel com vários <svg>): as imagens de
+# todos os slides são baixadas juntas, os slides são rasterizados em paralelo no pool
+# e enviados ao Supabase conforme ficam prontos. O resultado é por slide, com falhas
+# parciais reportadas em vez de descartadas.
+async def convert_svg_batch(documents: List[str], output_folder: str, embed_images: bool = False) -> List[dict]:
+    os.makedirs(output_folder, exist_ok=True)
 
-    def replace_with_base64(match: re.Match) -> str:
-        prefix, url, suffix = match.groups()
+    entries = []
+    for document_idx, svg_content in enumerate(documents):
+        svg_elements = re.findall(r'(<svg[\s\S]*?</svg>)', svg_content or "")
+        if not svg_elements:
+            entries.append((document_idx, 0, None))
+        entries.extend((document_idx, idx, svg) for idx, svg in enumerate(svg_elements))
+
+    if len(entries) > BATCH_MAX_SLIDES:
+        raise ValueError(f"O lote excede o limite de {BATCH_MAX_SLIDES} slides.")
+
+    return await _convert_slides(_prepare_slides(entries), output_folder, embed_images)
+
+# Lê os metadados de cada <svg> numa passada em streaming e consulta o cache de
+# resultados antes de qualquer download, com a chave do SVG normalizado + URLs das
+# imagens. A árvore (SVGDocument) só é montada para os slides que serão renderizados.
+def _prepare_slides(entries: List[Tuple[int, int, str]]) -> List[dict]:
+    slides = []
+    for document_idx, idx, svg in entries:
+        slide = {"document": document_idx, "slide": idx}
+        if svg is None:
+            slide["error"] = "Nenhum <svg> encontrado no documento."
+        else:
+            try:
+                slide["metadata"] = extract_metadata(ensure_namespaces(svg))
+                slide["svg_hash"] = slide["metadata"].cache_key()
+                slide["cached_url"] = _svg_png_cache.get(slide["svg_hash"])
+            except ValueError as e:
+                slide["error"] = str(e)
+        slides.append(slide)
+    return slides
+
+async def _convert_slides(slides: List[dict], output_folder: str, embed_images: bool = False) -> List[dict]:
+    # Todas as imagens dos slides sem cache (e que não estão sendo renderizados por
+    # outra requisição idêntica) são baixadas juntas, sob um único prazo; com
+    # embed_images, também as dos demais, para a resposta
+    image_urls = [
+        url for slide in slides
+        if "metadata" in slide
+        and (embed_images or not (slide["cached_url"] or _png_flight.in_flight(slide["svg_hash"])))
+        for url in slide["metadata"].image_urls()
+    ]
+    deadline_at = asyncio.get_running_loop().time() + PNG_DEADLINE_SECONDS
+    with stage("fetch_images"):
+        assets = await fetch_assets(image_urls, deadline=FETCH_DEADLINE_SECONDS)
+    attempted_urls = set(image_urls)
+
+    # Limita quantos slides deste lote ocupam o pool ao mesmo tempo, para um carrossel
+    # grande não estourar a fila (429) sozinho; uploads ficam fora do limite.
+    render_slots = asyncio.Semaphore(BATCH_RENDER_CONCURRENCY)
+
+    async def convert(slide: dict) -> dict:
+        result = {"document": slide["document"], "slide": slide["slide"]}
+        if "error" in slide:
+            return {**result, "status": "error", "error": slide["error"]}
+
+        metadata, svg_hash = slide["metadata"], slide["svg_hash"]
+        image_urls = metadata.image_urls()
         try:
-            response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=TIMEOUT_SECONDS)
-            response.raise_for_status()
+            # Um slide que estoura o prazo do lote falha sozinho (retryable), sem derrubar os demais
+            async with governor.deadline(at=deadline_at):
+                dimensions = metadata.dimensions(FALLBACK_SIZE)
+                png_url = slide["cached_url"] or await _png_flight.do(svg_hash, lambda: _render_and_upload(
+                    metadata.source, svg_hash, image_urls, dimensions,
+                    image_targets(metadata.image_slots, metadata.get("viewBox"), dimensions, SCALE_FACTOR),
+                    assets, attempted_urls, output_folder, render_slots
+                ))
+                svg = await _response_svg(
+                    metadata.source, image_urls, lambda embedded: SVGDocument(metadata.source).serialize(embedded),
+                    assets, attempted_urls, embed_images
+                )
+            return {**result, "status": "ok", "svg": svg, "png": png_url, "cached": bool(slide["cached_url"])}
+        except RenderPoolBusy as e:
+            return {**result, "status": "error", "error": str(e), "retryable": True, "status_code": e.status_code}
         except Exception as e:
-            print(f"[AVISO] Falha ao baixar imagem: {url} | Erro: {str(e)}")
-            return match.group(0)
+            return {**result, "status": "error", "error": str(e)}
+
+    return list(await asyncio.gather(*[convert(slide) for slide in slides]))
+
+# O SVG é renderizado com os hrefs originais: as imagens chegam ao cairosvg pelo
+# url_fetcher do render_pool, sem data URIs em base64, já reduzidas ao tamanho dos
+# slots (`targets`, de image_targets).
+async def _render_and_upload(svg: str, svg_hash: str, image_urls: List[str], dimensions: Tuple[int, int],
+                             targets: Dict[str, list], assets: Dict[str, dict], attempted_urls: set,
+                             output_folder: str, render_slots: asyncio.Semaphore = None) -> str:
+    # Outra requisição pode ter concluído o mesmo SVG entre a consulta ao cache e aqui
+    cached_url = _svg_png_cache.get(svg_hash)
+    if cached_url:
+        return cached_url
+
+    # Roda no single-flight: reaplica o prazo de quem iniciou para cancelar as etapas
+    async with governor.deadline():
+        assets = await _with_missing_assets(image_urls, assets, attempted_urls)
+        with stage("process_images"):
+            resources = await image_variants.resources({url: assets[url] for url in image_urls if url in assets}, targets)
+        png_url = await _save_svg_and_convert(svg, svg_hash, output_folder, dimensions, resources, render_slots)
+    _svg_png_cache.set(svg_hash, png_url)
+    return png_url
 
-        mime_type = _get_mime_type(response, url)
-        base64_data = base64.b64encode(response.content).decode("utf-8")
-        return f'{prefix}data:{mime_type};base64,{base64_data}{suffix}'
+async def _with_missing_assets(image_urls: List[str], assets: Dict[str, dict], attempted_urls: set) -> Dict[str, dict]:
+    missing_urls = [url for url in image_urls if url not in attempted_urls]
+    if not missing_urls:
+        return assets
+    with stage("fetch_images"):
+        return {**assets, **await fetch_assets(missing_urls, deadline=FETCH_DEADLINE_SECONDS)}
+
+# O campo "svg" da resposta é o SVG original (URLs das imagens), a não ser que o
+# chamador peça a forma com as imagens embutidas; `embed` recebe {URL: data URI}.
+async def _response_svg(svg: str, image_urls: List[str], embed: Callable[[Dict[str, str]], str],
+                        assets: Dict[str, dict], attempted_urls: set, embed_images: bool) -> str:
+    if not embed_images or not image_urls:
+        return svg
+    assets = await _with_missing_assets(image_urls, assets, attempted_urls)
+    with stage("process_images"):
+        return embed(_data_uris(image_urls, assets))
+
+# Templates já vêm analisados: a chave de cache, as URLs das imagens e as dimensões
+# saem do registro, sem varrer o SVG renderizado.
+async def convert_template_to_png(template: SVGTemplate, variables: Dict[str, str], output_folder: str,
+                                 embed_images: bool = False) -> Dict[str, str]:
+    os.makedirs(output_folder, exist_ok=True)
 
-    return re.sub(pattern, replace_with_base64, svg, flags=re.IGNORECASE)
+    svg = template.render(variables)
+    svg_hash = template.cache_key(variables)
+    image_urls = template.image_urls(variables)
+    dimensions = template.dimensions(variables, FALLBACK_SIZE)
+    targets = image_targets(template.image_slots(variables), template.root_attribute("viewBox", variables),
+                            dimensions, SCALE_FACTOR)
+    async with governor.deadline(PNG_DEADLINE_SECONDS):
+        png_url = _svg_png_cache.get(svg_hash) or await _png_flight.do(svg_hash, lambda: _render_and_upload(
+            svg, svg_hash, image_urls, dimensions, targets, {}, set(), output_folder
+        ))
+        svg = await _response_svg(
+            svg, image_urls, lambda embedded: template.render(variables, embedded), {}, set(), embed_images
+        )
+    return {"svg": svg, "png": png_url}
 
-def _get_mime_type(response: requests.Response, url: str) -> str:
-    mime_type = response.headers.get("Content-Type", "")
+async def convert_svg_to_png_bytes(svg_content: str, output_folder: str) -> bytes:
+    svg_elements = re.findall(r'(<svg[\s\S]*?</svg>)', svg_content)
+    if len(svg_elements) != 1:
+        raise ValueError("O modo inline aceita exatamente um <svg> por requisição.")
+
+    metadata = extract_metadata(ensure_namespaces(svg_elements[0]))
+    svg_hash = metadata.cache_key()
+    async with governor.deadline(PNG_DEADLINE_SECONDS):
+        return await _png_flight.do(f"inline:{svg_hash}", lambda: _render_inline(metadata, svg_hash, output_folder))
+
+async def _render_inline(metadata: SVGMetadata, svg_hash: str, output_folder: str) -> bytes:
+    png_bytes = _read_png_from_disk(svg_hash, output_folder)
+    if png_bytes is not None:
+        return png_bytes
+
+    async with governor.deadline():
+        with stage("fetch_images"):
+            assets = await fetch_assets(metadata.image_urls(), deadline=FETCH_DEADLINE_SECONDS)
+        dimensions = metadata.dimensions(FALLBACK_SIZE)
+        with stage("process_images"):
+            resources = await image_variants.resources(
+                assets, image_targets(metadata.image_slots, metadata.get("viewBox"), dimensions, SCALE_FACTOR)
+            )
+        return await _render_png(metadata.source, svg_hash, output_folder, dimensions, resources)
+
+def _data_uris(image_urls: List[str], assets: Dict[str, dict]) -> Dict[str, str]:
+    embedded = {}
+    for url in dict.fromkeys(image_urls):
+        asset = assets.get(url)
+        if asset is not None:
+            mime_type = _get_mime_type(asset["content_type"], url)
+            embedded[url] = f'data:{mime_type};base64,{base64.b64encode(asset["content"]).decode("utf-8")}'
+    return embedded
+
+def _get_mime_type(content_type: str, url: str) -> str:
+    mime_type = content_type
     if not mime_type:
         mime_type, _ = mimetypes.guess_type(url.split("?")[0])
     return (mime_type or "image/png").split(';')[0]
 
-def _ensure_xlink_namespace(svg: str) -> str:
-    if 'xmlns:xlink' not in svg:
-        svg = re.sub(r'<svg\b', r'<svg xmlns:xlink="http://www.w3.org/1999/xlink"', svg, count=1)
-    if 'xmlns="' not in svg:
-        svg = re.sub(r'<svg\b', r'<svg xmlns="http://www.w3.org/2000/svg"', svg, count=1)
-    return svg
-
-
-def _save_svg_and_convert(processed_svg: str, svg_hash: str, output_folder: str) ->  str:
-    png_filename = f"{svg_hash}.png"
-    png_path = os.path.join(output_folder, png_filename)
-
-    width, height = _extract_svg_dimensions(processed_svg)
-
-    cairosvg.svg2png(
-        file_obj=BytesIO(processed_svg.encode()),
-        write_to=png_path,
-        output_width=width,
-        output_height=height,
-        scale=SCALE_FACTOR,
-        unsafe=True
-    )
-
-    png_path = f"generated_images/{svg_hash}/converted_1.png"
-    png_url = upload_png_to_supabase(png_path, f"{svg_hash}.png")
-
-    return png_url
-
-
-
-
-def _extract_svg_dimensions(svg: str) -> Tuple[int, int]:
-    width_match = re.search(r'width\s*=\s*["\']([\d.]+)(?:px)?["\']', svg, re.IGNORECASE)
-    height_match = re.search(r'height\s*=\s*["\']([\d.]+)(?:px)?["\']', svg, re.IGNORECASE)
-
-    if width_match and height_match:
-        return int(float(width_match.group(1))), int(float(height_match.group(1)))
-
-    viewbox_match = re.search(r'viewBox\s*=\s*["\']\s*[\d.]+\s+[\d.]+\s+([\d.]+)\s+([\d.]+)\s*["\']', svg)
-    if viewbox_match:
-        return int(float(viewbox_match.group(1))), int(float(viewbox_match.group(2)))
-
-    print("[INFO] Dimensões não detectadas, usando fallback.")
-    return FALLBACK_SIZE
-
-def hash_svg(svg: str) -> str:
-    return hashlib.sha256(svg.encode("utf-8")).hexdigest()
-
-def cleanup_cache_folder(path=CACHE_FOLDER, max_files=200):
-    files = sorted(os.listdir(path), key=lambda x: os.path.getctime(os.path.join(path, x)))
-    while len(files) > max_files:
-        os.remove(os.path.join(path, files.pop(0)))
-
-def purge_expired_cache(ttl=600):
-    now = time.time()
-    expired_keys = [k for k, v in _svg_png_cache.items() if now - v["timestamp"] > ttl]
-
-    for key in expired_keys:
-        try:
-            pass
-        except Exception as e:
-            print(f"[AVISO] Falha ao remover PNG expirado: {e}")
-        _svg_png_cache.pop(key)
\ No newline at end of file
+async def _save_svg_and_convert(svg: str, svg_hash: str, output_folder: str, dimensions: Tuple[int, int],
+                                resources: Dict[str, object], render_slots: asyncio.Semaphore = None) ->  str:
+    if render_slots is None:
+        png_bytes = await _render_png(svg, svg_hash, output_folder, dimensions, resources)
+    else:
+        async with render_slots:
+            png_bytes = await _render_png(svg, svg_hash, output_folder, dimensions, resources)
+    with stage("upload"):
+        return await upload_png_to_supabase(png_bytes, f"{svg_hash}.png")
+
+async def _render_png(svg: str, svg_hash: str, output_folder: str, dimensions: Tuple[int, int],
+                      resources: Dict[str, object]) -> bytes:
+    width, height = dimensions
+
+    # Admissão pela memória estimada da superfície; a vaga no estágio "rasterize" só
+    # depois de admitido, para uma requisição recusada não ocupar fila. Sem vaga, 429
+    # na hora (como a fila cheia do render_pool), em vez de esperar até o prazo
+    cost = raster_bytes(width * SCALE_FACTOR, height * SCALE_FACTOR)
+    async with governor.admit("svg_to_png", cost), governor.slot("rasterize", wait=False):
+        with stage("render_png"):
+            png_bytes = await render_pool.render(
+                render_svg, svg.encode(), width, height, SCALE_FACTOR, True, None, resources
+            )
+
+    if PNG_DISK_CACHE:
+        _write_png_to_disk(png_bytes, svg_hash, output_folder)
+
+    return png_bytes
+
+def _read_png_from_disk(svg_hash: str, output_folder: str):
+    if not PNG_DISK_CACHE:
+        return None
+    png_path = output_cache.lookup(os.path.join(output_folder, f"{svg_hash}.png"))
+    if png_path is None:
+        return None
+    try:
+        with open(png_path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_png_to_disk(png_bytes: bytes, svg_hash: str, output_folder: str):
+    png_path = os.path.join(output_folder, f"{svg_hash}.png")
+    tmp_path = f"{png_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(png_bytes)
+        os.replace(tmp_path, png_path)
+        output_cache.add(png_path)
+    except OSError as e:
+        print(f"[AVISO] Falha ao gravar PNG no cache em disco: {e}")
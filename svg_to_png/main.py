@@ -1,31 +1,125 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict
-from fastapi.responses import FileResponse
-import os
-from converter import convert_svg_images_to_base64_and_save, CACHE_FOLDER as BASE_OUTPUT
+from typing import List, Dict, Optional
+from fastapi.responses import Response
+from converter import convert_svg_batch, convert_svg_images_to_base64_and_save, convert_svg_to_png_bytes, convert_template_to_png, CACHE_FOLDER as BASE_OUTPUT, _svg_png_cache, _png_flight, output_cache, template_registry, storage
+from common.asset_cache import asset_cache
+from common.governor import governor
+from common.http_pool import close_session
+from common.image_variants import image_variants
+from common.metrics import instrument_app, register_stats
+from common.render_pool import RenderPoolBusy, render_pool
 
 app = FastAPI()
 
+# Mesmas fontes em /status (JSON) e /metrics (Prometheus)
+STATS_SOURCES = {
+    "asset_cache": asset_cache.stats,
+    "result_cache": _svg_png_cache.stats,
+    "render_pool": render_pool.stats,
+    "single_flight": _png_flight.stats,
+    "storage": storage.stats,
+    "output_cache": output_cache.stats,
+    "image_variants": image_variants.stats,
+    "governor": governor.stats,
+}
+register_stats(STATS_SOURCES)
+instrument_app(app)
+
+@app.on_event("startup")
+async def startup():
+    output_cache.start()
+    image_variants.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await output_cache.stop()
+    await image_variants.stop()
+    await close_session()
+    render_pool.shutdown()
+
 class SVGInput(BaseModel):
     svg_content: str
+    inline: bool = False  # devolve o PNG no corpo da resposta em vez de enviar ao Supabase
+    embed_images: bool = False  # "svg" da resposta com as imagens embutidas em base64
+
+class BatchInput(BaseModel):
+    documents: List[str] = []  # cada documento pode conter um ou mais <svg>
+    carousel: Optional[str] = None  # atalho: um único documento com vários <svg>
+    embed_images: bool = False
+
+class TemplateInput(BaseModel):
+    svg_content: str
+    name: Optional[str] = None
+
+class TemplateRenderInput(BaseModel):
+    variables: Dict[str, str] = {}
+    embed_images: bool = False
 
 
 @app.post("/generate-png", summary="Gera PNG a partir de SVG e retorna a URL pública")
-def generate_png(data: SVGInput) -> List[Dict[str, str]]:
+async def generate_png(data: SVGInput) -> List[Dict[str, str]]:
     try:
         output_folder = BASE_OUTPUT
 
-        result = convert_svg_images_to_base64_and_save(data.svg_content, output_folder)
+        if data.inline:
+            png_bytes = await convert_svg_to_png_bytes(data.svg_content, output_folder)
+            return Response(content=png_bytes, media_type="image/png")
+
+        result = await convert_svg_images_to_base64_and_save(data.svg_content, output_folder, data.embed_images)
 
         if not result:
             raise HTTPException(status_code=400, detail="Nenhum SVG válido foi processado.")
 
         return result
 
+    except HTTPException:
+        raise
+    except RenderPoolBusy as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/generate-png/batch", summary="Gera PNGs de vários SVGs/carrosséis em paralelo, com resultado por slide")
+async def generate_png_batch(data: BatchInput):
+    documents = list(data.documents) + ([data.carousel] if data.carousel else [])
+    if not documents:
+        raise HTTPException(status_code=400, detail="Informe 'documents' ou 'carousel'.")
+
+    try:
+        results = await convert_svg_batch(documents, BASE_OUTPUT, data.embed_images)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+@app.post("/templates", summary="Cadastra um SVG com marcadores {{variavel}} para renderizações futuras")
+def create_template(data: TemplateInput):
+    try:
+        template = template_registry.add(data.svg_content, data.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return template.describe()
+
+@app.post("/templates/{template_id}/render", summary="Renderiza um template cadastrado com as variáveis informadas")
+async def render_template(template_id: str, data: TemplateRenderInput) -> Dict[str, str]:
+    template = template_registry.get(template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template não encontrado")
+    try:
+        return await convert_template_to_png(template, data.variables, BASE_OUTPUT, data.embed_images)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RenderPoolBusy as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/status")
 def status():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok", **{name: get_stats() for name, get_stats in STATS_SOURCES.items()}}
\ No newline at end of file
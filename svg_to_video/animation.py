@@ -0,0 +1,381 @@
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Tuple
+
+from common.governor import governor
+from common.render_pool import FRAME_PIX_FMT, render_pool, render_svg_frame
+from common.svg_document import SVGDocument
+from common.svg_hashing import XLINK_HREF, hash_svg
+from common.templates import SVGTemplate
+from encoding_profiles import FFMPEG_THREADS, encoding_args
+
+ANIMATION_DEFAULT_SECONDS = float(os.getenv("ANIMATION_DEFAULT_SECONDS", "5"))
+ANIMATION_MAX_SECONDS = float(os.getenv("ANIMATION_MAX_SECONDS", "60"))
+ANIMATION_FRAME_BUFFER = int(os.getenv("ANIMATION_FRAME_BUFFER", str(render_pool.workers + 2)))  # quadros renderizando/aguardando o pipe
+ANIMATION_FRAME_CACHE_MB = int(os.getenv("ANIMATION_FRAME_CACHE_MB", "256"))
+
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_HEX_COLOR = re.compile(r'^#([0-9a-fA-F]{3}|[0-9a-fA-F]{6})$')
+
+
+def parse_clock(value: str):
+    value = (value or "").strip().split(";")[0].strip()
+    if not value or value == "indefinite":
+        return None
+    match = re.fullmatch(r'([-+]?[\d.]+)\s*(h|min|s|ms)?', value)
+    if match:
+        return float(match.group(1)) * {"h": 3600, "min": 60, "s": 1, "ms": 0.001, None: 1}[match.group(2)]
+    parts = value.split(":")
+    if len(parts) in (2, 3) and all(_NUMBER.fullmatch(part) for part in parts):
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+        return seconds
+    return None  # begin por evento (click etc.) não acontece num render
+
+
+def _format_number(value: float) -> str:
+    return f"{value:.4f}".rstrip("0").rstrip(".") if not float(value).is_integer() else str(int(value))
+
+
+def _hex_to_rgb(value: str) -> tuple:
+    digits = _HEX_COLOR.match(value).group(1)
+    if len(digits) == 3:
+        digits = "".join(c * 2 for c in digits)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+# Interpola dois valores de atributo: números (com unidades, listas, transform,
+# path "d" de mesma estrutura) e cores #rgb; o resto muda de forma discreta.
+def interpolate_value(start: str, end: str, fraction: float) -> str:
+    if fraction <= 0:
+        return start
+    if fraction >= 1:
+        return end
+    if _HEX_COLOR.match(start.strip()) and _HEX_COLOR.match(end.strip()):
+        a, b = _hex_to_rgb(start.strip()), _hex_to_rgb(end.strip())
+        return "#" + "".join(f"{round(x + (y - x) * fraction):02x}" for x, y in zip(a, b))
+    start_numbers, end_numbers = _NUMBER.findall(start), _NUMBER.findall(end)
+    if start_numbers and len(start_numbers) == len(end_numbers) and _NUMBER.sub("", start) == _NUMBER.sub("", end):
+        values = iter(
+            _format_number(float(a) + (float(b) - float(a)) * fraction) for a, b in zip(start_numbers, end_numbers)
+        )
+        return _NUMBER.sub(lambda match: next(values), start)
+    return start
+
+
+# Uma animação SMIL (<animate>, <set>, <animateTransform>, <animateColor>) avaliada
+# num instante: begin/dur/repeatCount/repeatDur/fill, values/from/to/by, keyTimes e
+# calcMode discrete|linear|paced (paced tratado como linear).
+class SMILAnimation:
+
+    def __init__(self, elem, target):
+        self.target = target
+        self.kind = elem.tag.rsplit('}', 1)[-1]
+        self.attribute = "transform" if self.kind == "animateTransform" else elem.get("attributeName")
+        self.transform_type = elem.get("type", "translate")
+        self.additive = elem.get("additive") == "sum"
+        self.fill_freeze = elem.get("fill") == "freeze" or self.kind == "set"
+        self.calc_mode = "discrete" if self.kind == "set" else elem.get("calcMode", "linear")
+        self.begin = parse_clock(elem.get("begin", "0s"))
+        self.dur = parse_clock(elem.get("dur"))
+
+        repeat_count = elem.get("repeatCount")
+        repeat_dur = parse_clock(elem.get("repeatDur"))
+        if repeat_count == "indefinite" or elem.get("repeatDur") == "indefinite":
+            self.active = math.inf
+        elif repeat_dur is not None:
+            self.active = repeat_dur
+        elif self.dur:
+            self.active = self.dur * float(repeat_count or 1)
+        else:
+            self.active = math.inf if self.kind == "set" else 0
+
+        base = target.get(self.attribute, "")
+        if self.kind == "set":
+            self.values = [elem.get("to", "")]
+        elif elem.get("values"):
+            self.values = [value.strip() for value in elem.get("values").split(";") if value.strip()]
+        elif elem.get("from") is not None and elem.get("to") is not None:
+            self.values = [elem.get("from"), elem.get("to")]
+        elif elem.get("to") is not None:
+            self.values = [base or elem.get("to"), elem.get("to")]
+        elif elem.get("by") is not None and elem.get("from") is not None:
+            start = elem.get("from")
+            by = _NUMBER.findall(elem.get("by"))
+            numbers = iter(_format_number(float(a) + float(b)) for a, b in zip(_NUMBER.findall(start), by))
+            self.values = [start, _NUMBER.sub(lambda match: next(numbers, match.group(0)), start)]
+        else:
+            self.values = []
+
+        key_times = elem.get("keyTimes")
+        self.key_times = [float(value) for value in key_times.split(";")] if key_times else None
+        if self.key_times and len(self.key_times) != len(self.values):
+            self.key_times = None
+
+    @property
+    def valid(self) -> bool:
+        return self.attribute is not None and bool(self.values) and self.begin is not None
+
+    # Fim da parte finita da animação (para a duração natural do vídeo)
+    def end(self):
+        if not self.valid or math.isinf(self.active):
+            return None
+        return self.begin + self.active
+
+    def value_at(self, t: float):
+        if not self.valid or t < self.begin:
+            return None
+        local = t - self.begin
+        if local >= self.active:
+            if not self.fill_freeze:
+                return None
+            local = self.active
+        if not self.dur:
+            return self._transform(self.values[-1])
+        # No fim de um ciclo completo (freeze), vale o último valor
+        progress = 1.0 if local >= self.active and (self.active / self.dur).is_integer() else (local % self.dur) / self.dur
+        return self._transform(self._sample(progress))
+
+    def _sample(self, progress: float) -> str:
+        values = self.values
+        if len(values) == 1:
+            return values[0]
+        if self.calc_mode == "discrete":
+            index = min(int(progress * len(values)), len(values) - 1)
+            if self.key_times:
+                index = max(i for i, key_time in enumerate(self.key_times) if key_time <= progress or i == 0)
+            return values[index]
+        key_times = self.key_times or [i / (len(values) - 1) for i in range(len(values))]
+        for i in range(len(values) - 1):
+            if progress <= key_times[i + 1] or i == len(values) - 2:
+                span = key_times[i + 1] - key_times[i]
+                fraction = (progress - key_times[i]) / span if span > 0 else 1.0
+                return interpolate_value(values[i], values[i + 1], min(max(fraction, 0.0), 1.0))
+        return values[-1]
+
+    def _transform(self, value: str) -> str:
+        if self.kind == "animateTransform":
+            return f"{self.transform_type}({value})"
+        return value
+
+
+# Quadros de um SVG com SMIL: as animações são lidas uma vez e removidas da árvore;
+# a cada instante, os valores entram como patches na serialização do documento.
+class SMILTimeline:
+
+    def __init__(self, document: SVGDocument):
+        self.document = document
+        parents = {child: parent for parent in document.root.iter() for child in parent}
+        ids = {elem.get("id"): elem for elem in document.root.iter() if elem.get("id")}
+
+        self.animations = []
+        for elem in document.animations:
+            href = elem.get(XLINK_HREF) or elem.get("href")
+            target = ids.get(href[1:]) if href and href.startswith("#") else parents.get(elem)
+            if elem in parents:
+                parents[elem].remove(elem)
+            if target is not None and elem.tag.rsplit('}', 1)[-1] != "animateMotion":
+                animation = SMILAnimation(elem, target)
+                if animation.valid:
+                    self.animations.append(animation)
+
+    def natural_duration(self):
+        ends = [animation.end() for animation in self.animations]
+        finite = [end for end in ends if end is not None]
+        return max(finite) if finite else None
+
+    def key(self) -> str:
+        return ""
+
+    def frame(self, t: float) -> Tuple[str, callable]:
+        values = {}
+        for animation in self.animations:
+            value = animation.value_at(t)
+            if value is None:
+                continue
+            slot = (id(animation.target), animation.attribute)
+            if animation.additive and animation.attribute == "transform":
+                base = values.get(slot, (animation.target, animation.target.get("transform", "")))[1]
+                value = f"{base} {value}".strip()
+            values[slot] = (animation.target, value)
+
+        patches = [(target, attribute, values[(id(target), attribute)][1])
+                   for (_, attribute), (target, _) in values.items()]
+        svg = self.document.serialize(patches=patches)
+        return hash_svg(svg), lambda: svg
+
+
+# Quadros de um template com linha do tempo de variáveis: [{"time": s, "variables":
+# {...}}]. Entre dois keyframes, valores numéricos (e cores) são interpolados; os
+# demais valem o do keyframe anterior.
+class VariableTimeline:
+
+    def __init__(self, template: SVGTemplate, variables: Dict[str, str], keyframes: List[dict]):
+        if not keyframes:
+            raise ValueError("A linha do tempo precisa de ao menos um keyframe")
+        self.template = template
+        self.variables = variables
+        self.keyframes = sorted(
+            ({"time": float(keyframe["time"]), "variables": {k: str(v) for k, v in keyframe["variables"].items()}}
+             for keyframe in keyframes),
+            key=lambda keyframe: keyframe["time"],
+        )
+        template.render(self.variables_at(0))  # valida as variáveis antes de aceitar o job
+
+    def natural_duration(self):
+        return self.keyframes[-1]["time"] or None
+
+    def key(self) -> str:
+        return hash_svg(json.dumps(self.keyframes, sort_keys=True))
+
+    def variables_at(self, t: float) -> Dict[str, str]:
+        current = dict(self.variables)
+        previous = None
+        for keyframe in self.keyframes:
+            if keyframe["time"] <= t:
+                current.update(keyframe["variables"])
+                previous = keyframe
+                continue
+            if previous is not None:
+                fraction = (t - previous["time"]) / (keyframe["time"] - previous["time"])
+                for name, value in keyframe["variables"].items():
+                    if name in previous["variables"]:
+                        current[name] = interpolate_value(previous["variables"][name], value, fraction)
+            break
+        return current
+
+    def frame(self, t: float) -> Tuple[str, callable]:
+        variables = self.variables_at(t)
+        return self.template.cache_key(variables), lambda: self.template.render(variables)
+
+
+class FrameCache:
+
+    def __init__(self, max_bytes: int = ANIMATION_FRAME_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+
+    def get(self, key: str):
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frames.move_to_end(key)
+            self.hits += 1
+        return frame
+
+    def put(self, key: str, frame: bytes):
+        if key in self._frames or len(frame) > self.max_bytes:
+            return
+        self._frames[key] = frame
+        self._bytes += len(frame)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self._bytes -= len(evicted)
+
+
+def even(value: float) -> int:
+    return max(2, int(value) - int(value) % 2)
+
+
+# Renderiza os quadros em paralelo no pool de processos e os escreve, em ordem, como
+# vídeo cru no stdin do ffmpeg: no máximo ANIMATION_FRAME_BUFFER quadros em memória
+# (renderizando ou aguardando o pipe), e quadros iguais (mesma chave) não são
+# renderizados de novo. As imagens chegam aos workers por `resources` (url_fetcher).
+async def render_animation(timeline, resources: Dict[str, object], width: int, height: int, fps: int,
+                           duration: float, profile: str, output_path: str) -> dict:
+    total_frames = max(1, round(duration * fps))
+    cmd = [
+        'ffmpeg', '-y',
+        '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', FRAME_PIX_FMT, '-s', f'{width}x{height}', '-framerate', str(fps),
+        '-i', 'pipe:0',
+        *encoding_args(profile, audio=False),
+        '-threads', str(FFMPEG_THREADS),  # opção de saída: threads do libx264
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+        '-progress', 'pipe:1', '-nostats',
+        '-f', 'mp4',
+        output_path
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout_task = asyncio.ensure_future(process.stdout.read())
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+
+    # Cada quadro ocupa uma vaga do estágio "rasterize", dividindo o pool com os PNGs
+    async def render_frame(svg_bytes: bytes) -> bytes:
+        async with governor.slot("rasterize"):
+            return await render_pool.render(render_svg_frame, svg_bytes, width, height, False, resources, wait=True)
+
+    cache = FrameCache()
+    pending = deque()
+    rendering = {}
+    rendered = 0
+    start = time.perf_counter()
+
+    def schedule(index: int):
+        nonlocal rendered
+        key, build = timeline.frame(index / fps)
+        frame = cache.get(key)
+        if frame is not None:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(frame)
+        elif key in rendering:
+            future = rendering[key]
+            cache.hits += 1
+        else:
+            future = asyncio.ensure_future(render_frame(build().encode('utf-8')))
+            rendering[key] = future
+            rendered += 1
+        pending.append((key, future))
+
+    try:
+        next_index = 0
+        while next_index < min(total_frames, max(1, ANIMATION_FRAME_BUFFER)):
+            schedule(next_index)
+            next_index += 1
+
+        while pending:
+            key, future = pending.popleft()
+            frame = await future
+            if rendering.get(key) is future:
+                del rendering[key]
+                cache.put(key, frame)
+            process.stdin.write(frame)
+            await process.stdin.drain()
+            if next_index < total_frames:
+                schedule(next_index)
+                next_index += 1
+
+        process.stdin.close()
+        await process.wait()
+    except BaseException:
+        for _, future in pending:
+            future.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    finally:
+        _, stderr = await asyncio.gather(stdout_task, stderr_task, return_exceptions=True)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Erro FFmpeg: {stderr.decode() if isinstance(stderr, bytes) else stderr}")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": total_frames,
+        "rendered_frames": rendered,
+        "reused_frames": total_frames - rendered,
+        "fps": fps,
+        "seconds": round(elapsed, 3),
+        "frames_per_second": round(total_frames / elapsed, 2) if elapsed else None,
+    }
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from converter import SVGVideoConverter
+from encoding_profiles import ENCODING_PROFILES, FFMPEG_THREADS
+from video_cache import probe_video
+from common.http_pool import close_session
+from common.render_pool import render_pool
+
+
+# Codifica o mesmo template com cada perfil e mede fps de codificação e tamanho do
+# MP4. O PNG e o vídeo de origem são preparados uma única vez, então só o ffmpeg
+# entra na medição.
+async def benchmark(svg_content: str, profiles: list, scale: float) -> list:
+    converter = SVGVideoConverter(svg_content)
+    await converter.fetch_images()
+    video_url = converter._extract_video_url()
+
+    results = []
+    try:
+        video_path = await converter._local_video_path(video_url)
+        png_path = await converter._render_svg_to_png(scale=scale)
+        source = converter.video_metadata or await probe_video(video_path)
+
+        for name in profiles:
+            converter.profile = name
+            output_path = os.path.join(tempfile.gettempdir(), f"benchmark-{name}.mp4")
+            converter.temp_files.append(output_path)
+
+            start = time.perf_counter()
+            await converter._ffmpeg_processing(png_path, {video_url: video_path}, output_path)
+            elapsed = time.perf_counter() - start
+
+            output = await probe_video(output_path)
+            frames = output.get("duration", 0) * ENCODING_PROFILES[name]["fps"]
+            results.append({
+                "profile": name,
+                "threads": FFMPEG_THREADS,
+                "seconds": round(elapsed, 3),
+                "encode_fps": round(frames / elapsed, 2) if elapsed else None,
+                "output_bytes": os.path.getsize(output_path),
+                "output_duration": output.get("duration"),
+                "source": source,
+            })
+            print(json.dumps(results[-1]))
+    finally:
+        converter._cleanup_temp_files()
+
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compara os perfis de codificação do svg_to_video")
+    parser.add_argument("template", help="arquivo SVG de referência (com data-video-url)")
+    parser.add_argument("--profiles", nargs="+", default=list(ENCODING_PROFILES), choices=list(ENCODING_PROFILES))
+    parser.add_argument("--scale", type=float, default=1.2)
+    parser.add_argument("--output", help="grava os resultados em JSON neste arquivo")
+    args = parser.parse_args()
+
+    with open(args.template, "r", encoding="utf-8") as f:
+        svg_content = f.read()
+
+    try:
+        results = await benchmark(svg_content, args.profiles, args.scale)
+    finally:
+        await close_session()
+        render_pool.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
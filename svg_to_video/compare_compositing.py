@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+
+from converter import SVGVideoConverter, _video_input_options
+from compositing import build_inputs_and_filter
+from encoding_profiles import ENCODING_PROFILES
+from common.http_pool import close_session
+from common.render_pool import render_pool
+
+
+# Confere se o motor "static-layer" gera os mesmos quadros que o "legacy": os
+# quadros compostos (antes do encoder) de cada motor são comparados via framemd5.
+# O "legacy" só compõe a primeira área e ignora recortes.
+async def frame_hashes(png_path: str, regions: list, video_paths: dict, fps: int, engine: str, seconds: float,
+                       cutout_paths: list = None) -> list:
+    inputs, filter_complex = build_inputs_and_filter(
+        png_path, regions, video_paths, cutout_paths or [None] * len(regions), fps, _video_input_options,
+        engine=engine
+    )
+    cmd = [
+        'ffmpeg', '-loglevel', 'error',
+        *[arg for input_args in inputs for arg in input_args],
+        '-filter_complex', filter_complex,
+        '-an', '-t', str(seconds),
+        '-f', 'framemd5', '-'
+    ]
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"Erro FFmpeg ({engine}): {stderr.decode()}")
+    return [line.split(",")[-1].strip() for line in stdout.decode().splitlines() if line and not line.startswith("#")]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compara os quadros dos motores de composição")
+    parser.add_argument("template", help="arquivo SVG de referência (com data-video-url)")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    with open(args.template, "r", encoding="utf-8") as f:
+        converter = SVGVideoConverter(f.read())
+
+    try:
+        video_url = converter._extract_video_url()
+        regions = converter._get_video_regions(video_url)
+        video_paths = {video_url: await converter._local_video_path(video_url)}
+        png_path = await converter._render_svg_to_png()
+        fps = ENCODING_PROFILES[converter.profile]["fps"]
+
+        legacy = await frame_hashes(png_path, regions[:1], video_paths, fps, "legacy", args.seconds)
+        static = await frame_hashes(png_path, regions[:1], video_paths, fps, "static-layer", args.seconds)
+    finally:
+        converter._cleanup_temp_files()
+        await close_session()
+        render_pool.shutdown()
+
+    mismatches = [i for i, (a, b) in enumerate(zip(legacy, static)) if a != b]
+    print(f"quadros: legacy={len(legacy)} static-layer={len(static)} divergentes={len(mismatches)}")
+    if mismatches or len(legacy) != len(static):
+        print(f"primeiros quadros divergentes: {mismatches[:10]}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+import os
+
+from PIL import Image, ImageChops, ImageDraw
+
+from common.svg_metadata import parse_length
+
+# "static-layer": o PNG de fundo entra como um único quadro, decodificado uma vez e
+# repetido pelo filtro loop; "legacy": o comando original (-loop 1 no PNG, que
+# decodifica a imagem inteira a cada quadro), só com a primeira área de vídeo.
+COMPOSITING_ENGINE = os.getenv("COMPOSITING_ENGINE", "static-layer")
+MASK_SUPERSAMPLING = 4
+
+
+def clean_length(value: str, fallback: str = "0", reference: float = None) -> float:
+    return parse_length(value, reference) if value else float(fallback)
+
+
+# `canvas` (largura, altura do SVG) resolve coordenadas em porcentagem
+def region_from_element(elem, scale: float, default_video_url: str, canvas: tuple = None) -> dict:
+    canvas_width, canvas_height = canvas or (None, None)
+    x = int(clean_length(elem.get("x"), reference=canvas_width) * scale)
+    y = int(clean_length(elem.get("y"), reference=canvas_height) * scale)
+    width = int(clean_length(elem.get("width", "850"), reference=canvas_width) * scale)
+    height = int(clean_length(elem.get("height", "600"), reference=canvas_height) * scale)
+
+    # Como no SVG, rx/ry ausente herda o outro eixo; limitado à metade do lado
+    rx_attr, ry_attr = elem.get("rx"), elem.get("ry")
+    rx = clean_length(rx_attr or ry_attr, reference=canvas_width)
+    ry = clean_length(ry_attr or rx_attr, reference=canvas_height)
+    rx = min(int(rx * scale), width // 2)
+    ry = min(int(ry * scale), height // 2)
+
+    return {
+        "x": x, "y": y, "width": width, "height": height, "rx": rx, "ry": ry,
+        "video_url": elem.get("video_url") or elem.get("data-video-url") or default_video_url,
+    }
+
+
+# Recorte estático com os cantos do fundo (opacos) e o miolo transparente: sobreposto
+# depois do vídeo, "arredonda" os cantos sem aplicar máscara quadro a quadro.
+def make_corner_cutout(background_path: str, region: dict, output_path: str):
+    x, y, width, height = region["x"], region["y"], region["width"], region["height"]
+    rx, ry = region["rx"], region["ry"]
+
+    with Image.open(background_path) as background:
+        cutout = background.convert("RGBA").crop((x, y, x + width, y + height))
+
+    s = MASK_SUPERSAMPLING
+    mask = Image.new("L", (width * s, height * s), 0)
+    draw = ImageDraw.Draw(mask)
+    w, h, cx, cy = width * s, height * s, rx * s, ry * s
+    draw.rectangle((cx, 0, w - cx - 1, h - 1), fill=255)
+    draw.rectangle((0, cy, w - 1, h - cy - 1), fill=255)
+    for left, top in ((0, 0), (w - 2 * cx, 0), (0, h - 2 * cy), (w - 2 * cx, h - 2 * cy)):
+        draw.ellipse((left, top, left + 2 * cx - 1, top + 2 * cy - 1), fill=255)
+    mask = mask.resize((width, height), Image.LANCZOS)
+
+    cutout.putalpha(ImageChops.multiply(cutout.getchannel("A"), ImageChops.invert(mask)))
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    cutout.save(tmp_path, format="PNG")
+    os.replace(tmp_path, output_path)
+
+
+def build_inputs_and_filter(png_path: str, regions: list, video_paths: dict, cutout_paths: list,
+                            fps: int, input_options, engine: str = COMPOSITING_ENGINE):
+    if engine == "legacy":
+        region = regions[0]
+        width, height, x, y = region["width"], region["height"], region["x"], region["y"]
+        inputs = [
+            ['-loop', '1', '-r', str(fps), '-i', png_path],
+            [*input_options(video_paths[region["video_url"]]), '-i', video_paths[region["video_url"]]],
+        ]
+        filter_complex = (
+            f"[1:v]scale={width}:{height}:force_original_aspect_ratio=increase, crop={width}:{height}[vid];"
+            f"[0:v][vid]overlay={x}:{y}:shortest=1"
+        )
+        return inputs, filter_complex
+
+    inputs = [['-framerate', str(fps), '-i', png_path]]
+    video_input_index = {}
+    for region in regions:
+        if region["video_url"] not in video_input_index:
+            video_input_index[region["video_url"]] = len(inputs)
+            video_path = video_paths[region["video_url"]]
+            inputs.append([*input_options(video_path), '-i', video_path])
+
+    filters = [f"[0:v]loop=loop=-1:size=1:start=0,setpts=N/{fps}/TB[bg]"]
+    splits = {}
+    for url, index in video_input_index.items():
+        uses = sum(1 for region in regions if region["video_url"] == url)
+        if uses > 1:
+            labels = [f"src{index}_{i}" for i in range(uses)]
+            filters.append(f"[{index}:v]split={uses}" + "".join(f"[{label}]" for label in labels))
+            splits[url] = labels
+        else:
+            splits[url] = [f"{index}:v"]
+
+    current = "bg"
+    for i, region in enumerate(regions):
+        width, height = region["width"], region["height"]
+        source = splits[region["video_url"]].pop(0)
+        filters.append(f"[{source}]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height}[vid{i}]")
+        filters.append(f"[{current}][vid{i}]overlay={region['x']}:{region['y']}:shortest=1[ov{i}]")
+        current = f"ov{i}"
+
+        cutout_path = cutout_paths[i]
+        if cutout_path:
+            index = len(inputs)
+            inputs.append(['-framerate', str(fps), '-i', cutout_path])
+            filters.append(f"[{index}:v]loop=loop=-1:size=1:start=0,setpts=N/{fps}/TB[cut{i}]")
+            filters.append(f"[{current}][cut{i}]overlay={region['x']}:{region['y']}:shortest=1[cv{i}]")
+            current = f"cv{i}"
+
+    # O último rótulo fica sem nome para ser mapeado automaticamente na saída
+    filter_complex = ";".join(filters)
+    filter_complex = filter_complex[:filter_complex.rindex("[")]
+    return inputs, filter_complex
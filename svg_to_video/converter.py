@@ -1,160 +1,176 @@
-import base64   
-import mimetypes   
 import os   
-import re  
 import shlex
-import subprocess   
 import tempfile   
-import atexit
-from PIL import Image
-import io
 from urllib.parse import urlparse      
-from concurrent.futures import ThreadPoolExecutor
-from xml.etree import ElementTree as ET 
-import cairosvg
 import requests
-from PIL import Image, ImageDraw, ImageFilter
 import hashlib
-import time
 import asyncio
 import aiohttp
-from supabase import create_client
 from dotenv import load_dotenv
+from common.governor import encode_bytes, governor, raster_bytes
+from common.http_pool import fetch_assets, get_session
+from common.image_variants import image_targets, image_variants
+from common.metrics import FFMPEG_FPS, FFMPEG_SPEED, stage
+from common.output_cache import OutputCache
+from common.render_pool import RenderPoolBusy, render_pool, render_svg
+from common.singleflight import SingleFlight
+from common.storage import SupabaseStorage
+from common.svg_document import SVGDocument
+from common.svg_metadata import SVGMetadata, extract_metadata
+from common.templates import SVGTemplate, TemplateRegistry
+from video_cache import probe_video, source_video_cache
+from animation import (ANIMATION_DEFAULT_SECONDS, ANIMATION_FRAME_BUFFER, ANIMATION_FRAME_CACHE_MB,
+                       ANIMATION_MAX_SECONDS, SMILTimeline, VariableTimeline, even, render_animation)
+from compositing import COMPOSITING_ENGINE, build_inputs_and_filter, make_corner_cutout, region_from_element
+from encoding_profiles import ENCODING_PROFILES, FFMPEG_THREADS, LEGACY_PROFILE, encoding_args, resolve_profile
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
+STORAGE_URL = os.getenv("STORAGE_URL") or SUPABASE_URL  # stand-in local dos benchmarks
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "videos")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+storage = SupabaseStorage(SUPABASE_BUCKET, STORAGE_URL, SUPABASE_KEY)
 
-def upload_to_supabase(file_path: str, filename: str) -> str:
-    with open(file_path, "rb") as f:
-        supabase.storage.from_(SUPABASE_BUCKET).upload(
-            path=filename,
-            file=f,
-            file_options={"content-type": "video/mp4"}
-        )
-    public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(filename)
-    return public_url
+async def upload_to_supabase(file_path: str, filename: str) -> str:
+    return await storage.upload_file(file_path, filename, "video/mp4")
 
-_video_cache = {}
-MAX_CACHE_SIZE = 100
-TTL_SECONDS = 600  # 10 minutos
 CACHE_FOLDER = "/app/generated_videos"
+VIDEO_OUTPUT_CACHE_BYTES = int(os.getenv("VIDEO_OUTPUT_CACHE_MB", "10240")) * 1024 * 1024
+MAX_VIDEO_BYTES = 100 * 1024 * 1024  # 100MB
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # 10MB
+IMAGE_FETCH_SECONDS = 10
+VIDEO_STREAMING = os.getenv("VIDEO_STREAMING", "true").lower() == "true"  # ffmpeg lê o vídeo direto da URL
+PROBE_BYTES = 64 * 1024
+OVERLAY_SCALE = 1.5
+BACKGROUND_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "backgrounds")  # PNG de fundo por template
+VIDEO_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "600"))  # ponta a ponta, sem contar a fila de /jobs
 
 os.makedirs(CACHE_FOLDER, exist_ok=True)
+os.makedirs(BACKGROUND_CACHE_FOLDER, exist_ok=True)
 
-def _hash_svg(svg: str) -> str:
-    return hashlib.sha256(svg.encode("utf-8")).hexdigest()
-
-class SVGVideoConverter:
-
-    def __init__(self,svg_content: str):
-        self.svg_content = svg_content
-        self.processed_svg = None
-        self.temp_files = []
-        atexit.register(self._cleanup_temp_files) 
-
-    def _normalize_svg_for_hashing(self, svg: str) -> str:
-        try:
-            namespaces = {
-                'svg': 'http://www.w3.org/2000/svg',
-                'xlink': 'http://www.w3.org/1999/xlink'
-            }
-
-            root = ET.fromstring(svg)
-            image_elements = root.findall('.//svg:image', namespaces)
-
-            for elem in image_elements:
-                if '{{{xlink}}}href'.format(**namespaces) in elem.attrib:
-                    elem.set('{{{xlink}}}href'.format(**namespaces), 'NORMALIZED')
-                elif 'href' in elem.attrib:
-                    elem.set('href', 'NORMALIZED')
+# MP4s finais e fundos renderizados; templates/ e sources/ têm gestão própria
+output_cache = OutputCache("generated_videos", [CACHE_FOLDER, BACKGROUND_CACHE_FOLDER], (".mp4", ".png"),
+                           VIDEO_OUTPUT_CACHE_BYTES)
 
-            return ET.tostring(root, encoding='utf-8', method='xml').decode('utf-8')
+_video_flight = SingleFlight("svg_to_video")
+template_registry = TemplateRegistry(os.path.join(CACHE_FOLDER, "templates"))
 
-        except Exception as e:
-            print(f"Erro ao normalizar SVG para hash: {str(e)}")
-            return svg  # fallback
+async def create_and_upload_video(converter: "SVGVideoConverter") -> str:
+    cache_key = converter.cache_key()
+    return await _video_flight.do(cache_key, lambda: _create_and_upload_video(converter))
 
-    async def embed_images_as_base64(self):
-        try:
-            namespaces = {
-                'svg': 'http://www.w3.org/2000/svg',
-                'xlink': 'http://www.w3.org/1999/xlink'
-            }
+# Roda no single-flight: o prazo vale para a execução compartilhada e, ao estourar,
+# cancela a etapa em andamento (download, render, ffmpeg ou upload)
+async def _create_and_upload_video(converter: "SVGVideoConverter") -> str:
+    async with governor.deadline(VIDEO_DEADLINE_SECONDS):
+        output_path = await converter.create_video()
 
-            root = ET.fromstring(self.svg_content)
+        if not os.path.isfile(output_path):
+            raise RuntimeError(f"Arquivo MP4 não gerado: {output_path}")
 
-            image_elements = root.findall('.//svg:image', namespaces)
-            tasks = [self._replace_image_href_with_base64_async(elem, namespaces) for elem in image_elements]
-            await asyncio.gather(*tasks)
+        with converter._stage("upload"):
+            return await upload_to_supabase(output_path, os.path.basename(output_path))
 
+class SVGVideoConverter:
 
-            self.processed_svg = ET.tostring(root, encoding='utf-8', method='xml').decode('utf-8')
-            return self
-        
-        except Exception as e:
-            raise RuntimeError(f"Erro ao processar SVG: {str(e)}")
-        
-    async def _replace_image_href_with_base64_async(self, elem, namespaces):
-        url = self._get_href_attribute(elem, namespaces)
-        if url and url.startswith('http'):
-            print(f"🔗 Convertendo imagem: {url}")
-            base64_data = await self._url_to_base64_async(url)
-
-            if base64_data and base64_data.startswith("data:image/"):
-                if '{{{xlink}}}href'.format(**namespaces) in elem.attrib:
-                    elem.set('{{{xlink}}}href'.format(**namespaces), base64_data)
-                else:
-                    elem.set('href', base64_data)
-    
-    def _get_href_attribute(self, elem, namespaces):
-        return elem.get('{{{xlink}}}href'.format(**namespaces)) or elem.get('href')
-    
-    async def _url_to_base64_async(self, url: str) -> str:
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10) as response:
-                    if response.status != 200:
-                        print(f"Erro ao baixar imagem: {response.status}")
-                        return None
-                    
-                    if int(response.headers.get('Content-Length', 0)) > 10 * 1024 * 1024:
-                        print(f"Imagem muito grande (>10MB): {url}")
-                        return None
-
-                    content = await response.read()
-                    content_type = response.headers.get('Content-Type', '')
-                    mime_type = content_type.split(';')[0] if ';' in content_type else content_type
-                    if not mime_type.startswith('image/'):
-                        mime_type = mimetypes.guess_type(url)[0] or 'image/jpeg'
-                    
-                    encoded = base64.b64encode(content).decode('utf-8')
-                    return f"data:{mime_type};base64,{encoded}"
+    def __init__(self,svg_content: str, profile: str = None, duration: float = None):
+        self.svg_content = svg_content
+        self.profile = resolve_profile(profile)
+        self.duration = duration
+        self.timeline = None
+        self.resources = None
+        self.assets = {}
+        self.wait_for_resources = False  # jobs aguardam memória livre em vez de receber 429
+        self.temp_files = []
+        self.timings = {}
+        self.video_metadata = {}
+        self._cached_videos = []
+        self._document = None
+        self._metadata = None
+        self._template = None
+        self._variables = None
+
+    # Converter a partir de um template já analisado: dimensões, áreas de vídeo e chave
+    # de cache vêm do registro, então nenhum passo precisa parsear o SVG renderizado.
+    @classmethod
+    def from_template(cls, template: SVGTemplate, variables: dict, profile: str = None,
+                      timeline: list = None, duration: float = None) -> "SVGVideoConverter":
+        converter = cls(template.render(variables), profile, duration)
+        converter._template = template
+        converter._variables = variables
+        if timeline:
+            converter.timeline = VariableTimeline(template, variables, timeline)
+        return converter
+
+    # Chave de cache, URL do vídeo, dimensões e áreas de vídeo vêm de uma passada em
+    # streaming; a árvore só é montada para embutir imagens (e para animações SMIL),
+    # então um acerto de cache não chega a analisar o SVG por completo.
+    @property
+    def metadata(self) -> SVGMetadata:
+        if self._metadata is None:
+            self._metadata = extract_metadata(self.svg_content)
+        return self._metadata
+
+    @property
+    def document(self) -> SVGDocument:
+        if self._document is None:
+            self._document = SVGDocument(self.svg_content)
+        return self._document
+
+    def svg_key(self) -> str:
+        if self._template:
+            return self._template.cache_key(self._variables)
+        return self.metadata.cache_key()
+
+    def cache_key(self) -> str:
+        svg_hash = self.svg_key()
+        if self.is_animation():
+            timeline_key = self.timeline.key() if self.timeline else ""
+            svg_hash = hashlib.sha256(f"{svg_hash}:{self.duration}:{timeline_key}".encode()).hexdigest()
+        return svg_hash if self.profile == LEGACY_PROFILE else f"{svg_hash}-{self.profile}"
+
+    # Sem vídeo de origem: o MP4 vem da própria animação (SMIL no SVG ou linha do
+    # tempo de variáveis do template)
+    def is_animation(self) -> bool:
+        if self.timeline is not None:
+            return True
+        if self._template:
+            # Do template já analisado: a chave de cache não parseia o SVG renderizado
+            document = self._template.document
+            return document.video_element() is None and bool(document.animations)
+        return self.metadata.video_element is None and self.metadata.has_animations
+
+    def _stage(self, name: str):
+        return stage(name, self.timings)
+
+    # Baixa (ou lê do cache) as imagens do SVG uma única vez. O render recebe os bytes
+    # pelo url_fetcher do render_pool com os hrefs originais, sem base64 no SVG. Com
+    # `scale`, as imagens já vão reduzidas ao tamanho dos slots nessa escala de saída.
+    async def fetch_images(self, prefer_files: bool = False, scale: float = None) -> dict:
+        image_urls = self._template.image_urls(self._variables) if self._template else self.metadata.image_urls()
+        for url in dict.fromkeys(image_urls):
+            print(f"🔗 Baixando imagem: {url}")
+        self.assets = await fetch_assets(image_urls, deadline=IMAGE_FETCH_SECONDS, max_bytes=MAX_IMAGE_BYTES)
+        targets = self._image_targets(scale) if scale else None
+        self.resources = await image_variants.resources(self.assets, targets, prefer_files)
+        return self.resources
+
+    def _image_targets(self, scale: float) -> dict:
+        if self._template:
+            slots = self._template.image_slots(self._variables)
+            view_box = self._template.root_attribute("viewBox", self._variables)
+        else:
+            slots, view_box = self.metadata.image_slots, self.metadata.get("viewBox")
+        return image_targets(slots, view_box, self._get_svg_dimensions(), scale)
 
-        except Exception as e:
-            print(f"Erro ao baixar imagem {url}: {str(e)}")
-            return None
-        
     def _extract_video_url(self) -> str: 
-        root = ET.fromstring(self.processed_svg)
-
-        video_rect = root.find(".//*[@id='video-area']")
+        if self._template:
+            for area in self._template.video_areas(self._variables):
+                if area.get("video_url") or area.get("data-video-url"):
+                    return area.get("video_url") or area.get("data-video-url")
 
-        if video_rect is None:
-            for elem in root.iter():
-                id_attr = elem.get("id", "")
-                if "video" in id_attr.lower():
-                    video_rect = elem
-                    break
-
-        if video_rect is None:
-            for elem in root.iter():
-                if elem.get("video_url") or elem.get("data-video-url"):
-                    video_rect = elem
-                    break
+        video_rect = self.metadata.video_element
 
         if video_rect is None:                
             raise RuntimeError("Elemento com id='video-area' ou outro elemento relacionado a vídeo não encontrado no SVG.")
@@ -167,44 +183,174 @@ class SVGVideoConverter:
 
     async def create_video(self, video_url: str = None, output_path: str = "output.mp4", scale: float = 1.2):
         
-        normalized_svg = self._normalize_svg_for_hashing(self.svg_content)
-        svg_hash = _hash_svg(normalized_svg)
-
-        if not self.processed_svg:
-            await self.embed_images_as_base64()
-
+        svg_hash = self.cache_key()
         output_path = os.path.join(CACHE_FOLDER, f"{svg_hash}.mp4")
 
-        cached = _video_cache.get(svg_hash)
-        if cached and time.time() - cached["timestamp"] <= TTL_SECONDS and os.path.isfile(cached["path"]):
+        if output_cache.lookup(output_path):
             print("♻️ Reutilizando vídeo em cache")
-            return cached["path"]
-        
+            return output_path
+
+        if not video_url and self.is_animation():
+            return await self._create_animation(output_path)
+
         try: 
             if not video_url:
                 video_url = self._extract_video_url()
+            regions = self._get_video_regions(video_url)
+            width, height = self._get_svg_dimensions()
+            async with governor.admit("svg_to_video", self._composite_cost(width * scale, height * scale, regions),
+                                      wait=self.wait_for_resources):
+                return await self._create_composite(output_path, scale, regions)
 
-            video_path = self._download_video(video_url)
-
-            png_path = self._render_svg_to_png(scale=scale)
-            await self._ffmpeg_processing(png_path, video_path, output_path)
-
-            print (f"✅ Vídeo finalizado: {output_path}")
+        finally:
+            self._cleanup_temp_files()
 
-            _video_cache[svg_hash] = {
-                "path": output_path,
-                "timestamp": time.time()
-            }
+    # Fundo rasterizado + o encode na resolução de saída + os decoders dos vídeos de
+    # origem na resolução de cada região
+    def _composite_cost(self, width: float, height: float, regions: list) -> int:
+        return (raster_bytes(width, height) + encode_bytes(width, height)
+                + sum(encode_bytes(region["width"], region["height"]) for region in regions))
 
-            self._purge_expired_cache()
+    async def _create_composite(self, output_path: str, scale: float, regions: list) -> str:
+        video_paths = {}
+        with self._stage("download_video"):
+            for url in dict.fromkeys(region["video_url"] for region in regions):
+                video_paths[url] = await self._resolve_video_input(url)
 
-            return output_path
+        with self._stage("render_png"):
+            png_path = await self._render_svg_to_png(scale=scale)
 
+        with self._stage("ffmpeg"):
+            try:
+                await self._ffmpeg_processing(png_path, video_paths, output_path, regions)
+            except RuntimeError as e:
+                streamed = [url for url, path in video_paths.items() if path == url]
+                if not streamed:
+                    raise
+                print(f"⚠️ Leitura direta do vídeo falhou, baixando para arquivo temporário: {str(e)}")
+                for url in streamed:
+                    video_paths[url] = await self._local_video_path(url)
+                await self._ffmpeg_processing(png_path, video_paths, output_path, regions)
+
+        print (f"✅ Vídeo finalizado: {output_path}")
+        output_cache.add(output_path)
+        return output_path
+
+
+    # Quadros renderizados no pool de processos e enviados crus ao ffmpeg; as imagens
+    # são baixadas e embutidas uma vez para todos os quadros.
+    async def _create_animation(self, output_path: str) -> str:
+        timeline = self.timeline or SMILTimeline(SVGDocument(self.svg_content))
+        duration = self.duration or timeline.natural_duration() or ANIMATION_DEFAULT_SECONDS
+        duration = min(float(duration), ANIMATION_MAX_SECONDS)
+        width, height = self._get_svg_dimensions()
+        fps = ENCODING_PROFILES[self.profile]["fps"]
+
+        # Quadros em voo + cache de quadros + encode, todos na resolução do vídeo
+        cost = ANIMATION_FRAME_BUFFER * even(width) * even(height) * 4 + ANIMATION_FRAME_CACHE_MB * 1024 * 1024 \
+            + encode_bytes(width, height)
+        async with governor.admit("svg_to_video", cost, wait=self.wait_for_resources):
+            return await self._render_animation(timeline, duration, width, height, fps, output_path)
+
+    async def _render_animation(self, timeline, duration: float, width: int, height: int, fps: int,
+                                output_path: str) -> str:
+        # Cada quadro relê os arquivos (variantes PNG, decodificadas direto pelo cairo) em
+        # vez de receber os bytes; sem redução, já que a animação pode mudar os slots
+        with self._stage("fetch_images"):
+            resources = await self.fetch_images(prefer_files=True)
+
+        tmp_path = f"{output_path}.{os.getpid()}.{id(self)}.tmp"
+        self.temp_files.append(tmp_path)
+        try:
+            with self._stage("animation"):
+                async with governor.slot("encode"):
+                    result = await render_animation(
+                        timeline, resources, even(width), even(height), fps, duration, self.profile, tmp_path
+                    )
+            os.replace(tmp_path, output_path)
         finally:
             self._cleanup_temp_files()
 
+        print(f"🎞️ Animação: {result['frames']} quadros ({result['rendered_frames']} renderizados, "
+              f"{result['reused_frames']} reaproveitados) em {result['seconds']}s")
+        print(f"✅ Vídeo finalizado: {output_path}")
+        output_cache.add(output_path)
+        return output_path
+
+    # Com VIDEO_STREAMING, o ffmpeg lê o vídeo direto pela URL e a codificação começa
+    # enquanto o download ainda acontece. Só cai para o arquivo temporário quando o MP4
+    # não pode ser lido em sequência (moov no fim e servidor sem suporte a Range). Só a
+    # primeira requisição de uma URL faz streaming: a partir da segunda o vídeo é
+    # baixado para o cache de origem e lido do disco, e uma entrada já em cache (mesmo
+    # vencida) passa pelo acquire, que a revalida com GET condicional.
+    async def _resolve_video_input(self, url: str) -> str:
+        if source_video_cache.enabled and (
+            source_video_cache.lookup(url) is not None or source_video_cache.seen_before(url)
+        ):
+            return await self._local_video_path(url)
+
+        if VIDEO_STREAMING and urlparse(url).scheme in ("http", "https"):
+            try:
+                if await self._probe_streamable(url):
+                    print("📡 Vídeo será lido diretamente pelo FFmpeg")
+                    if ENCODING_PROFILES[self.profile]["audio"] == "copy":
+                        # Só o audio-copy depende do codec de origem; o ffprobe lê o
+                        # começo do arquivo pela própria URL
+                        self.video_metadata = await probe_video(url)
+                    return url
+            except RuntimeError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Falha ao inspecionar vídeo para streaming: {str(e)}")
+
+        return await self._local_video_path(url)
+
+    async def _local_video_path(self, url: str) -> str:
+        if not source_video_cache.enabled:
+            async with governor.slot("download"):
+                return await asyncio.to_thread(self._download_video, url)
+
+        path = await source_video_cache.acquire(url)
+        self._cached_videos.append(url)
+        self.video_metadata = source_video_cache.metadata(url)
+        return path
+
+    async def _probe_streamable(self, url: str) -> bool:
+        session = await get_session()
+        async with governor.slot("download"), session.get(
+            url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}, timeout=aiohttp.ClientTimeout(total=10)
+        ) as response:
+            if response.status not in (200, 206):
+                return False
+
+            content_type = response.headers.get('Content-Type', '')
+            if not content_type.startswith('video/'):
+                raise RuntimeError(f"Falha no Download do vídeo: Tipo de conteúdo inválido: {content_type}")
+
+            supports_range = response.status == 206
+            content_range = response.headers.get('Content-Range', '')
+            if supports_range and '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+                total_size = int(content_range.rsplit('/', 1)[1])
+            else:
+                total_size = int(response.headers.get('Content-Length', 0))
+            if total_size > MAX_VIDEO_BYTES:
+                raise RuntimeError(f"Falha no Download do vídeo: Vídeo muito grande: {total_size / (1024 * 1024):.2f}MB")
+            if not total_size:
+                return False  # tamanho desconhecido: nada limitaria o ffmpeg, usa o download com teto
+
+            # read() pode devolver menos que o pedido: junta até PROBE_BYTES ou o fim
+            head = b""
+            while len(head) < PROBE_BYTES:
+                chunk = await response.content.read(PROBE_BYTES - len(head))
+                if not chunk:
+                    break
+                head += chunk
+
+        boxes = _mp4_top_level_boxes(head)
+        if "moov" in boxes and ("mdat" not in boxes or boxes.index("moov") < boxes.index("mdat")):
+            return True
+        return supports_range
 
-                                
     def _download_video(self, url: str) -> str:
         try: 
             response = requests.get(
@@ -220,114 +366,160 @@ class SVGVideoConverter:
                 raise RuntimeError(f"Tipo de conteúdo inválido: {content_type}")
             
             content_length = int(response.headers.get('Content-Length', 0))
-            if content_length > 100 * 1024 * 1024:   #100MB
+            if content_length > MAX_VIDEO_BYTES:
                 raise RuntimeError(f"Vídeo muito grande: {content_length / (1024 * 1024):.2f}MB")
             
             temp_video = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
             self.temp_files.append(temp_video.name)
 
-            with open(temp_video.name, 'wb') as f:
+            with temp_video:
+                downloaded = 0
                 for chunk in response.iter_content(chunk_size=5 * 1024 * 1024):
                     if chunk:
+                        downloaded += len(chunk)
+                        if downloaded > MAX_VIDEO_BYTES:  # sem Content-Length, o teto vale durante o download
+                            raise RuntimeError("Vídeo muito grande: >100MB")
                         temp_video.write(chunk)
 
-            temp_video.close()
             return temp_video.name
         
         except Exception as e:
             raise RuntimeError(f"Falha no Download do vídeo: {str(e)}")
         
-    def _render_svg_to_png(self, scale: float = 1.2) -> str:
+    # O fundo renderizado não depende do vídeo: fica em cache por template (SVG sem
+    # os atributos de URL de vídeo) + escala + conteúdo das imagens. As imagens vêm do
+    # cache de assets (revalidadas por ETag), e uma imagem trocada na mesma URL muda
+    # a chave e gera um fundo novo.
+    async def _render_svg_to_png(self, scale: float = 1.2) -> str:
         try:
-            width, height = self._get_svg_dimensions()
+            if self.resources is None:
+                with self._stage("fetch_images"):
+                    await self.fetch_images(scale=scale)
 
-            temp_png = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-            self.temp_files.append(temp_png.name)
+            png_path = os.path.join(BACKGROUND_CACHE_FOLDER, f"{self._background_key()}-{scale}.png")
+            if output_cache.lookup(png_path):
+                print("♻️ Reutilizando fundo renderizado do template")
+                return png_path
 
-            cairosvg.svg2png(
-                bytestring=self.processed_svg.encode('utf-8'),
-                write_to=temp_png.name,
-                output_width=int(width * scale),
-                output_height=int(height * scale)
-            )
-            return temp_png.name
+            width, height = self._get_svg_dimensions()
+            tmp_path = f"{png_path}.{os.getpid()}.{id(self)}.tmp"
+            self.temp_files.append(tmp_path)
+
+            # Requisição síncrona sem vaga recebe 429; um job espera a vez
+            async with governor.slot("rasterize", wait=self.wait_for_resources):
+                await render_pool.render(
+                    render_svg,
+                    self.svg_content.encode('utf-8'),
+                    int(width * scale),
+                    int(height * scale),
+                    1.0,
+                    False,
+                    tmp_path,
+                    self.resources,
+                    wait=self.wait_for_resources
+                )
+            os.replace(tmp_path, png_path)
+            output_cache.add(png_path)
+            return png_path
         
+        except RenderPoolBusy:
+            raise
         except Exception as e:
             raise RuntimeError(f"Erro ao renderizar SVG para PNG: {str(e)}")
         
-    def _get_svg_dimensions(self) -> tuple:
-        root = ET.fromstring(self.processed_svg)
-
-        width_str = root.get('width', '1080').replace('px', '').replace(',', '.')
-        height_str = root.get('height', '1920').replace('px', '').replace(',', '.')
+    def _background_key(self) -> str:
+        template_key = self._template.template_key(self._variables) if self._template else self.metadata.template_key()
+        shas = "\n".join(
+            f"{url} {asset.get('sha') or hashlib.sha256(asset['content']).hexdigest()}"
+            for url, asset in sorted(self.assets.items())
+        )
+        return hashlib.sha256(f"{template_key}\n{shas}".encode("utf-8")).hexdigest()
 
-        try:
-            width = int(float(width_str))
-            height = int(float(height_str))
-            return width, height
-
-        except: 
-            viewbox = root.get('viewBox', '0 0 1080 1920').split()
-            width = int(float(viewbox[2].replace(',', '.')))
-            height = int(float(viewbox[3].replace(',', '.')))
-            return width, height 
+    def _get_svg_dimensions(self) -> tuple:
+        if self._template:
+            return self._template.dimensions(self._variables, (1080, 1920))
+        return self.metadata.dimensions((1080, 1920))
         
-    def _get_video_overlay_position(self, scale: float = 1.5) -> tuple:
-        root = ET.fromstring(self.processed_svg)
-        video_rect = root.find(".//*[@id='video-area']")
-
-        if video_rect is None:
+    def _get_video_overlay_position(self, scale: float = OVERLAY_SCALE) -> tuple:
+        region = self._get_video_regions(None, scale)[0]
+        return region["x"], region["y"], region["width"], region["height"], region["rx"], region["ry"]
+
+    # Áreas de vídeo: id="video-area" e, para múltiplas áreas, id="video-area-2", ...
+    # Cada uma usa o próprio data-video-url ou, na falta dele, o vídeo principal.
+    def _get_video_regions(self, video_url: str = None, scale: float = OVERLAY_SCALE) -> list:
+        if self._template:
+            elements = self._template.video_areas(self._variables)
+        else:
+            elements = self.metadata.video_areas
+        if not elements:
             raise RuntimeError("Elemento com id='video-area' não encontrado no SVG")
-        
-        def clean(value: str, fallback: str = "0") -> float:
-            return float(value.replace("px", "").strip()) if value else float(fallback)
 
-        x = int(clean(video_rect.get("x")) * scale)
-        y = int(clean(video_rect.get("y")) * scale)
-        width = int(clean(video_rect.get("width", "850")) * scale)
-        height = int(clean(video_rect.get("height", "600")) * scale)
-        rx = int(clean(video_rect.get("rx")))
-        ry = int(clean(video_rect.get("ry")))
+        canvas = self._get_svg_dimensions()
+        regions = [region_from_element(elem, scale, video_url, canvas) for elem in elements]
+        if video_url:
+            regions[0]["video_url"] = video_url
 
         print("📐 Extraindo posição do vídeo:")
-        print("x:", x, "y:", y, "width:", width, "height:", height, "rx:", rx, "ry:", ry)
-        return x, y, width, height, rx, ry
+        for region in regions:
+            print("x:", region["x"], "y:", region["y"], "width:", region["width"], "height:", region["height"],
+                  "rx:", region["rx"], "ry:", region["ry"])
+        return regions
         
-    async def _ffmpeg_processing(self, png_path: str, video_path: str, output_path: str):
-        x, y, width, height, rx, ry = self._get_video_overlay_position()
-
-        filter_complex = f"""
-        [1:v]scale={width}:{height}:force_original_aspect_ratio=increase, crop={width}:{height}[vid];
-        [0:v][vid]overlay={x}:{y}:shortest=1
-    """.replace("\n", "").strip()
+    async def _ffmpeg_processing(self, png_path: str, video_paths: dict, output_path: str, regions: list = None):
+        if regions is None:
+            regions = self._get_video_regions(next(iter(video_paths)))
+
+        cutout_paths = []
+        for i, region in enumerate(regions):
+            if COMPOSITING_ENGINE == "legacy" or not (region["rx"] or region["ry"]):
+                cutout_paths.append(None)
+                continue
+            cutout_path = f"{os.path.splitext(png_path)[0]}-cut-{region['x']}-{region['y']}-{region['width']}x{region['height']}-{region['rx']}-{region['ry']}.png"
+            if not output_cache.lookup(cutout_path):
+                async with governor.slot("rasterize"):
+                    await asyncio.to_thread(make_corner_cutout, png_path, region, cutout_path)
+                output_cache.add(cutout_path)
+            cutout_paths.append(cutout_path)
+
+        inputs, filter_complex = build_inputs_and_filter(
+            png_path, regions, video_paths, cutout_paths,
+            ENCODING_PROFILES[self.profile]["fps"], _video_input_options
+        )
+        # Grava ao lado e renomeia: um MP4 parcial nunca vira acerto de cache
+        tmp_path = f"{output_path}.{os.getpid()}.{id(self)}.tmp"
+        self.temp_files.append(tmp_path)
             
         cmd = [
             'ffmpeg', '-y',
-            '-threads', '1',
             '-loglevel', 'error',
-            '-loop', '1', '-r', '24', '-i', png_path,
-            '-i', video_path,
+            *[arg for input_args in inputs for arg in input_args],
             '-filter_complex', filter_complex,
-            '-c:a', 'aac', '-b:a', '128k',
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',
-            '-tune', 'fastdecode',
+            *encoding_args(self.profile, self.video_metadata),
+            '-threads', str(FFMPEG_THREADS),  # opção de saída: threads do libx264
             '-movflags', '+faststart',
-            '-crf', '28',
+            '-progress', 'pipe:1', '-nostats',
             '-f', 'mp4',
-            output_path
+            tmp_path
         ]
 
         print("🧠 Comando FFmpeg sendo executado:")
         print(shlex.join(cmd))
     
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-
-        stdout, stderr = await process.communicate()
+        # Cancelado (prazo da requisição estourado), o ffmpeg é morto em vez de seguir
+        # ocupando CPU e memória sem ninguém esperando o resultado
+        async with governor.slot("encode"):
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await process.communicate()
+            except BaseException:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
 
         if process.returncode != 0:
             print("❌ FFmpeg falhou")
@@ -335,10 +527,19 @@ class SVGVideoConverter:
             print("❌ STDERR:", stderr.decode())
             raise RuntimeError(f"Erro FFmpeg: {stderr.decode()}")
         else:
-            print("✅ FFmpeg completado com sucesso.")
-            print("✅ STDOUT:", stdout.decode())
+            os.replace(tmp_path, output_path)
+            progress = _ffmpeg_progress(stdout.decode())
+            print("✅ FFmpeg completado com sucesso.", {k: progress.get(k) for k in ("frame", "fps", "speed")})
+            try:
+                FFMPEG_SPEED.labels(self.profile).observe(float(progress.get("speed", "").rstrip("x")))
+                FFMPEG_FPS.labels(self.profile).observe(float(progress.get("fps", "")))
+            except ValueError:
+                pass
         
     def _cleanup_temp_files(self):
+            while self._cached_videos:
+                source_video_cache.release(self._cached_videos.pop())
+
             for path in self.temp_files: 
                 try:
                     if os.path.isfile(path):
@@ -346,22 +547,39 @@ class SVGVideoConverter:
                 except Exception as e:
                     print(f"⚠️ Erro ao limpar arquivo temporário '{path}':{str(e)}")
 
-    def _purge_expired_cache(self):
-        now = time.time()
-        expired = [k for k, v in _video_cache.items() if now - v["timestamp"] > TTL_SECONDS]
 
-        for key in expired:
-            try:
-                os.remove(_video_cache[key]["path"])
-            except Exception as e:
-                print(f"⚠️ Erro ao remover vídeo expirado '{key}': {str(e)}")
-            _video_cache.pop(key)
-
-        # Limite de tamanho
-        while len(_video_cache) > MAX_CACHE_SIZE:
-            oldest = next(iter(_video_cache))
-            try:
-                os.remove(_video_cache[oldest]["path"])
-            except:
-                pass
-            _video_cache.pop(oldest)
\ No newline at end of file
+def _video_input_options(video_path: str) -> list:
+    if urlparse(video_path).scheme not in ("http", "https"):
+        return []
+    return [
+        '-user_agent', 'Mozilla/5.0',
+        '-reconnect', '1',
+        '-reconnect_streamed', '1',
+        '-reconnect_delay_max', '2',
+        '-rw_timeout', '20000000',
+    ]
+
+
+# Saída de -progress: blocos chave=valor; vale o último valor de cada chave
+def _ffmpeg_progress(output: str) -> dict:
+    progress = {}
+    for line in output.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            progress[key.strip()] = value.strip()
+    return progress
+
+
+def _mp4_top_level_boxes(data: bytes) -> list:
+    boxes = []
+    offset = 0
+    while offset + 8 <= len(data):
+        size = int.from_bytes(data[offset:offset + 4], "big")
+        box_type = data[offset + 4:offset + 8].decode("latin-1")
+        boxes.append(box_type)
+        if size == 1 and offset + 16 <= len(data):
+            size = int.from_bytes(data[offset + 8:offset + 16], "big")
+        if size < 8:
+            break
+        offset += size
+    return boxes
@@ -0,0 +1,51 @@
+import os
+
+from common.governor import GOVERNOR_ENCODE_CONCURRENCY
+
+# "fast-preview" é o comportamento histórico do serviço (ultrafast/crf 28/24fps).
+ENCODING_PROFILES = {
+    "fast-preview": {"codec": "libx264", "preset": "ultrafast", "tune": "fastdecode", "crf": 28, "fps": 24, "audio": "aac", "audio_bitrate": "128k"},
+    "balanced": {"codec": "libx264", "preset": "veryfast", "crf": 23, "fps": 24, "audio": "aac", "audio_bitrate": "128k"},
+    "small-file": {"codec": "libx264", "preset": "slow", "crf": 30, "fps": 24, "audio": "aac", "audio_bitrate": "96k"},
+    "audio-copy": {"codec": "libx264", "preset": "veryfast", "crf": 23, "fps": 24, "audio": "copy", "audio_bitrate": "128k"},
+}
+LEGACY_PROFILE = "fast-preview"
+DEFAULT_ENCODING_PROFILE = os.getenv("ENCODING_PROFILE", LEGACY_PROFILE)
+
+# Threads por ffmpeg: por padrão, os núcleos divididos entre os encodes simultâneos
+# (estágio "encode" do governador), em vez de fixar cada encode em um único núcleo.
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", "0")) or max(1, (os.cpu_count() or 1) // max(1, GOVERNOR_ENCODE_CONCURRENCY))
+
+if DEFAULT_ENCODING_PROFILE not in ENCODING_PROFILES:
+    raise RuntimeError(f"ENCODING_PROFILE inválido: {DEFAULT_ENCODING_PROFILE}")
+
+
+def resolve_profile(name: str = None) -> str:
+    name = name or DEFAULT_ENCODING_PROFILE
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"Perfil de codificação desconhecido: '{name}'. Opções: {', '.join(ENCODING_PROFILES)}")
+    return name
+
+
+# audio=False: saída sem áudio (animações), só os argumentos de vídeo e -an
+def encoding_args(name: str, video_metadata: dict = None, audio: bool = True) -> list:
+    profile = ENCODING_PROFILES[name]
+    video_metadata = video_metadata or {}
+
+    video_args = ['-c:v', profile["codec"], '-preset', profile["preset"]]
+    if profile.get("tune"):
+        video_args += ['-tune', profile["tune"]]
+    video_args += ['-crf', str(profile["crf"])]
+    if not audio:
+        return ['-an'] + video_args
+
+    # Só copia o áudio quando sabemos que a origem já é AAC (compatível com MP4)
+    if profile["audio"] == "copy" and video_metadata.get("audio_codec") == "aac":
+        audio_args = ['-c:a', 'copy']
+    else:
+        if profile["audio"] == "copy":
+            print(f"⚠️ Perfil {name}: áudio de origem {video_metadata.get('audio_codec') or 'desconhecido'} "
+                  f"não é AAC, recodificando")
+        audio_args = ['-c:a', 'aac', '-b:a', profile["audio_bitrate"]]
+
+    return audio_args + video_args
@@ -0,0 +1,208 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import time
+import traceback
+import uuid
+from urllib.parse import urlparse
+
+from converter import SVGVideoConverter, create_and_upload_video
+from common.http_pool import get_session
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))  # 1 hora após terminar
+WEBHOOK_TIMEOUT_SECONDS = 10
+# Hosts aceitos para webhooks (separados por vírgula). Vazio: qualquer host público;
+# endereços internos (loopback, rede privada, link-local...) são sempre recusados,
+# exceto quando o próprio host está nesta lista.
+WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()}
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+def _internal_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return not ip.is_global or ip.is_multicast
+
+
+# Recusa (ValueError -> 400) webhooks que fariam o servidor chamar a própria rede:
+# só http(s), e host na lista de WEBHOOK_ALLOWED_HOSTS quando ela existe; sem lista,
+# nada de localhost nem IP interno. Nomes que resolvem para IPs internos são
+# barrados na hora do envio (_resolve_webhook).
+def validate_webhook_url(url: str) -> str:
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme not in ("http", "https") or not host:
+        raise ValueError("webhook_url precisa ser uma URL http(s) com host")
+    if WEBHOOK_ALLOWED_HOSTS:
+        if host not in WEBHOOK_ALLOWED_HOSTS:
+            raise ValueError(f"Host de webhook não permitido: {host}")
+        return url
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ValueError("webhook_url não pode apontar para a rede interna")
+    try:
+        internal = _internal_address(host)
+    except ValueError:
+        return url  # nome: verificado ao resolver, no envio
+    if internal:
+        raise ValueError("webhook_url não pode apontar para a rede interna")
+    return url
+
+
+# `resolver` segue a assinatura de loop.getaddrinfo (padrão); os testes injetam um
+# resolvedor falso para não depender de DNS.
+async def _resolve_webhook(url: str, resolver=None):
+    host = urlparse(url).hostname.lower()
+    if host in WEBHOOK_ALLOWED_HOSTS:
+        return
+    port = urlparse(url).port or (443 if url.startswith("https") else 80)
+    resolver = resolver or asyncio.get_running_loop().getaddrinfo
+    infos = await resolver(host, port, type=socket.SOCK_STREAM)
+    if any(_internal_address(info[4][0]) for info in infos):
+        raise ValueError(f"{host} resolve para um endereço interno")
+
+
+# Fila em processo para /jobs: o POST só enfileira e devolve o id; N workers
+# consomem a fila com um SVGVideoConverter cada. Jobs com o mesmo hash de SVG
+# ainda na fila/em execução são agrupados no mesmo job.
+class VideoJobQueue:
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.coalesced = 0
+        self._jobs = {}
+        self._in_flight = {}  # svg_hash -> job_id
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, converter: SVGVideoConverter, webhook_url: str = None) -> dict:
+        if webhook_url:
+            validate_webhook_url(webhook_url)
+        self._purge_finished()
+
+        svg_hash = converter.cache_key()
+        job_id = self._in_flight.get(svg_hash)
+        if job_id is not None:
+            job = self._jobs[job_id]
+            if webhook_url:
+                job["webhooks"].append(webhook_url)
+            self.coalesced += 1
+            print(f"🔗 Job {job_id} reaproveitado para SVG idêntico")
+            return job
+
+        converter.wait_for_resources = True
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "svg_hash": svg_hash,
+            "profile": converter.profile,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "timings": {},
+            "video_url": None,
+            "error": None,
+            "converter": converter,
+            "webhooks": [webhook_url] if webhook_url else [],
+        }
+        try:
+            self._queue.put_nowait(job["id"])
+        except asyncio.QueueFull:
+            raise JobQueueFull("Fila de jobs cheia, tente novamente em instantes.")
+
+        self._jobs[job["id"]] = job
+        self._in_flight[svg_hash] = job["id"]
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def public_view(self, job: dict) -> dict:
+        return {k: v for k, v in job.items() if k not in ("converter", "webhooks")}
+
+    def stats(self) -> dict:
+        statuses = [job["status"] for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "running": statuses.count("running"),
+            "coalesced": self.coalesced,
+        }
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs[job_id]
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: dict):
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        job["timings"]["queue_wait"] = round(job["started_at"] - job["created_at"], 3)
+
+        converter = job.pop("converter")
+        converter.timings = job["timings"]
+        try:
+            job["video_url"] = await create_and_upload_video(converter)
+            job["status"] = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            job["timings"]["total"] = round(job["finished_at"] - job["created_at"], 3)
+            self._in_flight.pop(job["svg_hash"], None)
+
+        await self._notify(job)
+
+    async def _notify(self, job: dict):
+        if not job["webhooks"]:
+            return
+        session = await get_session()
+        payload = self.public_view(job)
+        for url in job["webhooks"]:
+            try:
+                await _resolve_webhook(url)
+                # Sem seguir redirecionamentos: um 307 levaria o POST a um host não verificado
+                async with session.post(url, json=payload, timeout=WEBHOOK_TIMEOUT_SECONDS,
+                                        allow_redirects=False) as response:
+                    if response.status >= 400:
+                        print(f"⚠️ Webhook {url} respondeu {response.status} para o job {job['id']}")
+            except Exception as e:
+                print(f"⚠️ Falha ao chamar webhook {url} do job {job['id']}: {str(e)}")
+
+    def _purge_finished(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > JOB_TTL_SECONDS
+        ]
+        for job_id in expired:
+            self._jobs.pop(job_id)
+
+
+job_queue = VideoJobQueue()
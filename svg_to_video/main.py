@@ -1,16 +1,77 @@
-from converter import SVGVideoConverter, upload_to_supabase
-import os
-from pydantic import BaseModel
+from converter import SVGVideoConverter, create_and_upload_video, _video_flight, output_cache, template_registry, storage
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 from fastapi import FastAPI, HTTPException
 import traceback
 from dotenv import load_dotenv
+from common.asset_cache import asset_cache
+from common.governor import governor
+from common.http_pool import close_session
+from common.image_variants import image_variants
+from common.metrics import instrument_app, register_stats
+from common.render_pool import RenderPoolBusy, render_pool
+from jobs import JobQueueFull, job_queue
+from video_cache import source_video_cache
 
 load_dotenv()
 
 app = FastAPI()
 
+# Mesmas fontes em /status (JSON) e /metrics (Prometheus)
+STATS_SOURCES = {
+    "asset_cache": asset_cache.stats,
+    "render_pool": render_pool.stats,
+    "jobs": job_queue.stats,
+    "single_flight": _video_flight.stats,
+    "source_video_cache": source_video_cache.stats,
+    "storage": storage.stats,
+    "output_cache": output_cache.stats,
+    "image_variants": image_variants.stats,
+    "governor": governor.stats,
+}
+register_stats(STATS_SOURCES)
+instrument_app(app)
+
+@app.on_event("startup")
+async def startup():
+    job_queue.start()
+    output_cache.start()
+    image_variants.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    await output_cache.stop()
+    await image_variants.stop()
+    await close_session()
+    render_pool.shutdown()
+
 class SVGInput(BaseModel):
     svg_content: str
+    profile: Optional[str] = None  # perfil de codificação (ver encoding_profiles.py)
+    duration: Optional[float] = Field(None, gt=0)  # SVG animado (SMIL) sem vídeo: segundos do MP4
+
+class JobInput(BaseModel):
+    svg_content: str
+    webhook_url: Optional[str] = None
+    profile: Optional[str] = None
+    duration: Optional[float] = Field(None, gt=0)
+
+class TemplateInput(BaseModel):
+    svg_content: str
+    name: Optional[str] = None
+
+class Keyframe(BaseModel):
+    time: float = Field(ge=0)  # segundos
+    variables: Dict[str, str]
+
+class TemplateRenderInput(BaseModel):
+    variables: Dict[str, str] = {}
+    profile: Optional[str] = None
+    timeline: Optional[List[Keyframe]] = None  # anima as variáveis em vez de usar um vídeo de origem
+    duration: Optional[float] = Field(None, gt=0)
+    as_job: bool = False  # enfileira em /jobs em vez de aguardar o vídeo
+    webhook_url: Optional[str] = None
 
 @app.post("/generate-video/")
 async def generate_video(svg_input: SVGInput):
@@ -18,23 +79,85 @@ async def generate_video(svg_input: SVGInput):
         if not svg_input.svg_content:
             raise ValueError("Campo 'svg_content' está vazio ou ausente")
 
-        converter = SVGVideoConverter(svg_input.svg_content)
-        await converter.embed_images_as_base64()
-        output_path = await converter.create_video()
+        try:
+            converter = SVGVideoConverter(svg_input.svg_content, svg_input.profile, svg_input.duration)
+            converter.cache_key()  # analisa o SVG aqui: inválido vira 400
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # ✅ Gera o MP4 e faz upload para Supabase
+        public_url = await create_and_upload_video(converter)
+
+        return {
+            "message": "Vídeo criado com sucesso",
+            "video_url": public_url
+        }
+
+    except HTTPException:
+        raise
+    except RenderPoolBusy as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar vídeo: {str(e)}")
+
+@app.post("/jobs", status_code=202)
+async def create_job(job_input: JobInput):
+    if not job_input.svg_content:
+        raise HTTPException(status_code=400, detail="Campo 'svg_content' está vazio ou ausente")
+    try:
+        job = job_queue.submit(SVGVideoConverter(job_input.svg_content, job_input.profile, job_input.duration), job_input.webhook_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return job_queue.public_view(job)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job_queue.public_view(job)
 
-        if not os.path.isfile(output_path):
-            raise RuntimeError(f"Arquivo MP4 não gerado: {output_path}")
+@app.post("/templates")
+def create_template(template_input: TemplateInput):
+    try:
+        template = template_registry.add(template_input.svg_content, template_input.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return template.describe()
 
-        filename = os.path.basename(output_path)
+@app.post("/templates/{template_id}/render")
+async def render_template(template_id: str, render_input: TemplateRenderInput):
+    template = template_registry.get(template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template não encontrado")
 
-        # ✅ Upload para Supabase
-        public_url = upload_to_supabase(output_path, filename)
+    try:
+        timeline = [keyframe.dict() for keyframe in render_input.timeline] if render_input.timeline else None
+        converter = SVGVideoConverter.from_template(
+            template, render_input.variables, render_input.profile, timeline, render_input.duration
+        )
+        if render_input.as_job:
+            return job_queue.public_view(job_queue.submit(converter, render_input.webhook_url))
 
+        public_url = await create_and_upload_video(converter)
         return {
             "message": "Vídeo criado com sucesso",
             "video_url": public_url
         }
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except RenderPoolBusy as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar vídeo: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar vídeo: {str(e)}")
+
+@app.get("/status")
+def status():
+    return {"status": "ok", **{name: get_stats() for name, get_stats in STATS_SOURCES.items()}}
\ No newline at end of file
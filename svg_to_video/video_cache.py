@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from common.governor import governor
+from common.http_pool import get_session
+from common.singleflight import SingleFlight
+
+SOURCE_VIDEO_CACHE_FOLDER = os.getenv("SOURCE_VIDEO_CACHE_FOLDER", "/app/generated_videos/sources")
+SOURCE_VIDEO_CACHE_BYTES = int(os.getenv("SOURCE_VIDEO_CACHE_MB", "2048")) * 1024 * 1024
+SOURCE_VIDEO_FRESH_SECONDS = int(os.getenv("SOURCE_VIDEO_FRESH_SECONDS", "3600"))  # 1 hora
+SOURCE_VIDEO_MAX_BYTES = 100 * 1024 * 1024  # 100MB
+SOURCE_VIDEO_SEEN_URLS = int(os.getenv("SOURCE_VIDEO_SEEN_URLS", "10000"))  # URLs lembradas para o streaming
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+# Cache em disco dos vídeos de origem (data-video-url). Cada URL vira <sha>.mp4 +
+# <sha>.json com ETag/Last-Modified e os metadados do ffprobe. Downloads simultâneos
+# da mesma URL são compartilhados e arquivos em uso por um ffmpeg não são removidos.
+# URLs lidas por streaming ficam registradas (LRU limitado, só em memória) para que a
+# próxima requisição da mesma URL baixe o vídeo para o cache.
+class SourceVideoCache:
+
+    def __init__(self, folder: str = SOURCE_VIDEO_CACHE_FOLDER, max_bytes: int = SOURCE_VIDEO_CACHE_BYTES,
+                 fresh_seconds: int = SOURCE_VIDEO_FRESH_SECONDS, max_seen: int = SOURCE_VIDEO_SEEN_URLS):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.max_seen = max(0, max_seen)
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self.bytes_fetched = 0
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # url -> meta
+        self._pins = {}              # url -> nº de renders usando o arquivo
+        self._seen = OrderedDict()   # url -> None, URLs já pedidas fora do cache
+        self._total_bytes = 0
+        self._flight = SingleFlight("source_video")
+
+        try:
+            os.makedirs(folder, exist_ok=True)
+            self._load_index()
+        except OSError as e:
+            print(f"⚠️ Cache de vídeos de origem desativado ({folder}): {str(e)}")
+            self.max_bytes = 0
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith(".tmp"):
+                _silent_remove(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if os.path.isfile(self._video_path(meta["url"])):
+                    entries.append(meta)
+            except Exception:
+                continue
+
+        for meta in sorted(entries, key=lambda m: m.get("accessed_at", 0)):
+            self._index[meta["url"]] = meta
+            self._total_bytes += meta["size"]
+
+    def _video_path(self, url: str) -> str:
+        return os.path.join(self.folder, f"{_url_key(url)}.mp4")
+
+    def _meta_path(self, url: str) -> str:
+        return os.path.join(self.folder, f"{_url_key(url)}.json")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def lookup(self, url: str):
+        with self._lock:
+            meta = self._index.get(url)
+            if meta is None:
+                return None
+            if not os.path.isfile(self._video_path(url)):
+                self._remove(url)
+                return None
+            self._index.move_to_end(url)
+            meta["accessed_at"] = time.time()
+            return meta
+
+    # Registra a URL e diz se ela já tinha sido pedida antes
+    def seen_before(self, url: str) -> bool:
+        with self._lock:
+            seen = url in self._seen
+            self._seen[url] = None
+            self._seen.move_to_end(url)
+            while len(self._seen) > self.max_seen:
+                self._seen.popitem(last=False)
+            return seen
+
+    def metadata(self, url: str) -> dict:
+        meta = self._index.get(url)
+        return meta.get("probe", {}) if meta else {}
+
+    def is_fresh(self, meta: dict) -> bool:
+        return time.time() - meta["validated_at"] <= self.fresh_seconds
+
+    # Devolve o caminho local do vídeo, baixando (ou revalidando) se necessário. O
+    # arquivo fica "preso" até release(url), para não ser removido pela evicção.
+    async def acquire(self, url: str) -> str:
+        with self._lock:
+            self._pins[url] = self._pins.get(url, 0) + 1
+
+        try:
+            meta = self.lookup(url)
+            if meta is not None and self.is_fresh(meta):
+                self.hits += 1
+            else:
+                try:
+                    await self._flight.do(url, lambda: self._fetch(url))
+                except Exception as e:
+                    if meta is None or not os.path.isfile(self._video_path(url)):
+                        raise
+                    print(f"⚠️ Revalidação do vídeo falhou, usando cópia em cache: {str(e)}")
+        except BaseException:
+            self.release(url)
+            raise
+
+        return self._video_path(url)
+
+    def release(self, url: str):
+        with self._lock:
+            pins = self._pins.get(url, 0) - 1
+            if pins <= 0:
+                self._pins.pop(url, None)
+            else:
+                self._pins[url] = pins
+            self._evict()
+
+    async def _fetch(self, url: str) -> dict:
+        meta = self.lookup(url)
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        session = await get_session()
+        async with governor.slot("download"), session.get(
+            url, headers=headers, timeout=aiohttp.ClientTimeout(total=None, sock_read=20)
+        ) as response:
+            if meta is not None and response.status == 304:
+                self.hits += 1
+                self.revalidated += 1
+                meta["validated_at"] = time.time()
+                self._write_meta(meta)
+                return meta
+
+            if response.status != 200:
+                raise RuntimeError(f"Falha no Download do vídeo: HTTP {response.status}")
+
+            content_type = response.headers.get('Content-Type', '')
+            if not content_type.startswith('video/'):
+                raise RuntimeError(f"Falha no Download do vídeo: Tipo de conteúdo inválido: {content_type}")
+
+            content_length = int(response.headers.get('Content-Length', 0))
+            if content_length > SOURCE_VIDEO_MAX_BYTES:
+                raise RuntimeError(f"Falha no Download do vídeo: Vídeo muito grande: {content_length / (1024 * 1024):.2f}MB")
+
+            self.misses += 1
+            video_path = self._video_path(url)
+            tmp_path = f"{video_path}.{os.getpid()}.tmp"
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > SOURCE_VIDEO_MAX_BYTES:
+                            raise RuntimeError("Falha no Download do vídeo: Vídeo muito grande: >100MB")
+                        await asyncio.to_thread(f.write, chunk)
+            except BaseException:
+                _silent_remove(tmp_path)
+                raise
+
+            self.bytes_fetched += size
+            probe = await probe_video(tmp_path)
+            os.replace(tmp_path, video_path)
+
+        now = time.time()
+        new_meta = {
+            "url": url,
+            "size": size,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "validated_at": now,
+            "accessed_at": now,
+            "probe": probe,
+        }
+        with self._lock:
+            old = self._index.pop(url, None)
+            if old is not None:
+                self._total_bytes -= old["size"]
+            self._index[url] = new_meta
+            self._total_bytes += size
+            self._write_meta(new_meta)
+            self._evict()
+        return new_meta
+
+    def _write_meta(self, meta: dict):
+        meta_path = self._meta_path(meta["url"])
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            print(f"⚠️ Falha ao gravar metadados do vídeo em cache: {str(e)}")
+
+    def _remove(self, url: str):
+        meta = self._index.pop(url, None)
+        if meta is not None:
+            self._total_bytes -= meta["size"]
+        _silent_remove(self._video_path(url))
+        _silent_remove(self._meta_path(url))
+
+    def _evict(self):
+        for url in list(self._index):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if url in self._pins:
+                continue
+            self._remove(url)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "bytes_fetched": self.bytes_fetched,
+            "entries": len(self._index),
+            "seen_urls": len(self._seen),
+            "bytes": self._total_bytes,
+            "downloads_in_flight": self._flight.stats()["in_flight"],
+        }
+
+
+async def probe_video(path: str) -> dict:
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration:stream=codec_type,codec_name,width,height',
+        '-of', 'json',
+        path
+    ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, _ = await process.communicate()
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        data = json.loads(stdout or b"{}")
+    except Exception as e:
+        print(f"⚠️ ffprobe falhou para {path}: {str(e)}")
+        return {}
+
+    probe = {}
+    duration = data.get("format", {}).get("duration")
+    if duration:
+        probe["duration"] = float(duration)
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and "video_codec" not in probe:
+            probe["video_codec"] = stream.get("codec_name")
+            probe["width"] = stream.get("width")
+            probe["height"] = stream.get("height")
+        elif stream.get("codec_type") == "audio" and "audio_codec" not in probe:
+            probe["audio_codec"] = stream.get("codec_name")
+    return probe
+
+
+def _silent_remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+source_video_cache = SourceVideoCache()
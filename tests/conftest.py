@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Os módulos de svg_to_video se importam pelo nome (rodam de dentro da pasta no container)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "svg_to_video")]
@@ -0,0 +1,127 @@
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from animation import FrameCache, SMILAnimation, VariableTimeline, parse_clock
+from common.templates import SVGTemplate
+
+
+def smil(animation: str, target: str = '<rect x="0" width="10" fill="#000000"/>') -> SMILAnimation:
+    return SMILAnimation(ET.fromstring(animation), ET.fromstring(target))
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("2s", 2.0),
+    ("2", 2.0),
+    ("500ms", 0.5),
+    ("1.5min", 90.0),
+    ("1h", 3600.0),
+    ("01:30", 90.0),
+    ("1:00:05", 3605.0),
+    (" 3s; 5s", 3.0),
+])
+def test_parse_clock(value, seconds):
+    assert parse_clock(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", [None, "", "indefinite", "click", "rect.click+1s"])
+def test_parse_clock_without_a_time(value):
+    assert parse_clock(value) is None
+
+
+def test_value_at_interpolates_from_to():
+    animation = smil('<animate attributeName="x" from="0" to="100" dur="2s"/>')
+    assert animation.value_at(0) == "0"
+    assert animation.value_at(1) == "50"
+    assert animation.value_at(2) is None  # sem fill="freeze", volta ao valor base
+
+
+def test_value_at_before_begin_and_freeze():
+    animation = smil('<animate attributeName="x" from="0" to="100" begin="1s" dur="2s" fill="freeze"/>')
+    assert animation.value_at(0.5) is None
+    assert animation.value_at(2) == "50"
+    assert animation.value_at(10) == "100"
+    assert animation.end() == 3
+
+
+def test_value_at_repeats_each_cycle():
+    animation = smil('<animate attributeName="x" values="0;10" dur="1s" repeatCount="3"/>')
+    assert animation.value_at(1.5) == "5"
+    assert animation.value_at(2.25) == "2.5"
+    assert animation.end() == 3
+
+
+def test_value_at_indefinite_has_no_end():
+    animation = smil('<animate attributeName="x" values="0;10" dur="1s" repeatCount="indefinite"/>')
+    assert animation.end() is None
+    assert animation.value_at(100.5) == "5"
+
+
+def test_value_at_key_times_and_discrete():
+    animation = smil('<animate attributeName="x" values="0;10;20" keyTimes="0;0.8;1" dur="1s"/>')
+    assert animation.value_at(0.4) == "5"
+    assert animation.value_at(0.9) == "15"
+    discrete = smil('<animate attributeName="x" values="a;b;c" calcMode="discrete" dur="3s"/>')
+    assert [discrete.value_at(t) for t in (0.5, 1.5, 2.5)] == ["a", "b", "c"]
+
+
+def test_value_at_colors_set_and_transform():
+    color = smil('<animate attributeName="fill" to="#ffffff" dur="2s"/>')
+    assert color.value_at(1) == "#808080"  # do valor base do alvo até "to"
+    visibility = smil('<set attributeName="visibility" to="hidden" begin="1s"/>')
+    assert visibility.value_at(0.5) is None
+    assert visibility.value_at(5) == "hidden"
+    rotate = smil('<animateTransform attributeName="transform" type="rotate" from="0 5 5" to="90 5 5" dur="1s"/>')
+    assert rotate.value_at(0.5) == "rotate(45 5 5)"
+
+
+def test_animation_without_values_is_invalid():
+    assert not smil('<animate attributeName="x" dur="1s"/>').valid
+    assert not smil('<animate attributeName="x" to="1" begin="click"/>').valid
+
+
+def timeline(keyframes, variables=None):
+    template = SVGTemplate('<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10">'
+                           '<rect x="{{x}}" fill="{{color}}"/><text>{{label}}</text></svg>')
+    return VariableTimeline(template, variables or {"x": "0", "color": "#000000", "label": "a"}, keyframes)
+
+
+def test_variables_at_interpolates_between_keyframes():
+    line = timeline([
+        {"time": 0, "variables": {"x": "0", "color": "#000000"}},
+        {"time": 2, "variables": {"x": "100", "color": "#ffffff", "label": "b"}},
+    ])
+    assert line.variables_at(1) == {"x": "50", "color": "#808080", "label": "a"}  # label não interpola
+    assert line.variables_at(2) == {"x": "100", "color": "#ffffff", "label": "b"}
+    assert line.variables_at(10) == {"x": "100", "color": "#ffffff", "label": "b"}
+    assert line.natural_duration() == 2
+
+
+def test_variables_at_before_first_keyframe_uses_base_variables():
+    line = timeline([{"time": 1, "variables": {"x": "10"}}, {"time": 3, "variables": {"x": "30"}}])
+    assert line.variables_at(0)["x"] == "0"
+    assert line.variables_at(2)["x"] == "20"
+
+
+def test_variables_at_sorts_keyframes():
+    line = timeline([{"time": 2, "variables": {"x": "20"}}, {"time": 0, "variables": {"x": "0"}}])
+    assert line.variables_at(1)["x"] == "10"
+
+
+def test_timeline_rejects_missing_variables():
+    with pytest.raises(ValueError):
+        timeline([{"time": 0, "variables": {"x": "0"}}], variables={"x": "0"})
+    with pytest.raises(ValueError):
+        timeline([])
+
+
+def test_frame_cache_evicts_least_recently_used():
+    cache = FrameCache(max_bytes=8)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    cache.put("big", b"x" * 9)  # maior que o cache inteiro: nem entra
+    assert cache.get("big") is None and cache.hits == 3
@@ -0,0 +1,122 @@
+import asyncio
+import shutil
+import subprocess
+from xml.etree import ElementTree as ET
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from benchmarks.standin import make_sample_video
+from compare_compositing import frame_hashes
+from compositing import build_inputs_and_filter, make_corner_cutout, region_from_element
+from converter import _video_input_options
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg não instalado")
+
+FPS = 30
+SECONDS = 1
+AREAS = [
+    '<rect x="20" y="30" width="200" height="150"/>',
+    '<rect x="300" y="200" width="240" height="180" rx="24" ry="32"/>',
+]
+
+
+@pytest.fixture(scope="module")
+def scene(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("compositing")
+    video_path = str(folder / "clip.mp4")
+    make_sample_video(video_path, seconds=SECONDS, size="320x240")
+
+    png_path = str(folder / "background.png")
+    background = Image.new("RGB", (640, 480), (200, 40, 90))
+    ImageDraw.Draw(background).rectangle((0, 0, 319, 239), fill=(10, 120, 200))
+    background.save(png_path)
+
+    regions = [region_from_element(ET.fromstring(area), 1.0, "clip") for area in AREAS]
+    cutout_paths = []
+    for i, region in enumerate(regions):
+        if region["rx"] or region["ry"]:
+            cutout_path = str(folder / f"cutout-{i}.png")
+            make_corner_cutout(png_path, region, cutout_path)
+            cutout_paths.append(cutout_path)
+        else:
+            cutout_paths.append(None)
+    return {"png": png_path, "video_paths": {"clip": video_path}, "regions": regions,
+            "cutouts": cutout_paths, "folder": folder}
+
+
+def hashes(scene, engine: str, regions: list, cutouts: list = None) -> list:
+    return asyncio.run(frame_hashes(scene["png"], regions, scene["video_paths"], FPS, engine, SECONDS, cutouts))
+
+
+# Referência ingênua no estilo do "legacy" estendida para N áreas: cada camada estática
+# entra com -loop 1 e cada área abre o vídeo de novo (sem loop/split no filtro)
+def reference_hashes(scene) -> list:
+    inputs = ["-loop", "1", "-r", str(FPS), "-i", scene["png"]]
+    filters, current, index = [], "0:v", 1
+    for i, (region, cutout_path) in enumerate(zip(scene["regions"], scene["cutouts"])):
+        width, height = region["width"], region["height"]
+        inputs += ["-i", scene["video_paths"][region["video_url"]]]
+        filters.append(f"[{index}:v]scale={width}:{height}:force_original_aspect_ratio=increase,"
+                       f"crop={width}:{height}[vid{i}]")
+        filters.append(f"[{current}][vid{i}]overlay={region['x']}:{region['y']}:shortest=1[ov{i}]")
+        current, index = f"ov{i}", index + 1
+        if cutout_path:
+            inputs += ["-loop", "1", "-r", str(FPS), "-i", cutout_path]
+            filters.append(f"[{current}][{index}:v]overlay={region['x']}:{region['y']}:shortest=1[cv{i}]")
+            current, index = f"cv{i}", index + 1
+
+    result = subprocess.run([
+        "ffmpeg", "-loglevel", "error", *inputs,
+        "-filter_complex", ";".join(filters), "-map", f"[{current}]",
+        "-an", "-t", str(SECONDS), "-f", "framemd5", "-",
+    ], check=True, capture_output=True, text=True)
+    return [line.split(",")[-1].strip() for line in result.stdout.splitlines() if line and not line.startswith("#")]
+
+
+def first_frame(scene, engine: str, cutouts: list, name: str) -> Image.Image:
+    inputs, filter_complex = build_inputs_and_filter(
+        scene["png"], scene["regions"], scene["video_paths"], cutouts, FPS, _video_input_options, engine=engine
+    )
+    path = str(scene["folder"] / f"{name}.png")
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error", *[arg for input_args in inputs for arg in input_args],
+        "-filter_complex", filter_complex, "-frames:v", "1", path,
+    ], check=True)
+    return Image.open(path).convert("RGB")
+
+
+def test_regions_parse_rounded_corners(scene):
+    assert [(r["rx"], r["ry"]) for r in scene["regions"]] == [(0, 0), (24, 32)]
+    assert scene["cutouts"][0] is None and scene["cutouts"][1] is not None
+
+
+def test_static_layer_matches_legacy_on_the_first_area(scene):
+    legacy = hashes(scene, "legacy", scene["regions"][:1])
+    static = hashes(scene, "static-layer", scene["regions"][:1])
+    assert len(legacy) == FPS * SECONDS
+    assert static == legacy
+
+
+def test_static_layer_matches_the_reference_with_two_areas_and_cutouts(scene):
+    static = hashes(scene, "static-layer", scene["regions"], scene["cutouts"])
+    assert len(static) == FPS * SECONDS
+    assert static == reference_hashes(scene)
+
+
+def test_cutout_restores_the_background_only_in_the_corners(scene):
+    region = scene["regions"][1]
+    plain = first_frame(scene, "static-layer", [None, None], "plain")
+    rounded = first_frame(scene, "static-layer", scene["cutouts"], "rounded")
+
+    x, y, width, height = region["x"], region["y"], region["width"], region["height"]
+    left, top, right, bottom = ImageChops.difference(plain, rounded).getbbox()
+    assert x <= left and y <= top and right <= x + width and bottom <= y + height
+
+    with Image.open(scene["png"]) as background:
+        background = background.convert("RGB")
+    for corner in ((x + 1, y + 1), (x + width - 2, y + 1), (x + 1, y + height - 2), (x + width - 2, y + height - 2)):
+        # Tolerância para a conversão RGB -> YUV 4:2:0 e de volta
+        assert all(abs(a - b) <= 12 for a, b in zip(rounded.getpixel(corner), background.getpixel(corner)))
+    center = (x + width // 2, y + height // 2)
+    assert rounded.getpixel(center) == plain.getpixel(center)
@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from benchmarks.standin import StandInServer
+from common import storage
+from common.http_pool import close_session
+from common.storage import SupabaseStorage
+
+
+# Roda `scenario(server, storage)` contra o stand-in do Storage numa porta livre
+def run_against_standin(scenario):
+    async def main():
+        server = StandInServer()
+        runner = await server.start(port=0)
+        url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        try:
+            return await scenario(server, SupabaseStorage("videos", url, "key", retries=0))
+        finally:
+            await close_session()
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_uploads_once_and_deduplicates_identical_content():
+    async def scenario(server, client):
+        data = b"\x00video-1" * 100
+        first = await client.upload_bytes("abc.mp4", data, "video/mp4")
+        second = await client.upload_bytes("abc.mp4", data, "video/mp4")
+        assert first == second == f"{client.url}/storage/v1/object/public/videos/abc.mp4"
+        assert server.objects["videos/abc.mp4"]["metadata"] == {"sha256": hashlib.sha256(data).hexdigest()}
+        assert (client.uploads, client.deduplicated) == (1, 1)
+
+    run_against_standin(scenario)
+
+
+def test_reuploads_different_content_with_the_same_size():
+    async def scenario(server, client):
+        await client.upload_bytes("abc.png", b"A" * 64, "image/png")
+        await client.upload_bytes("abc.png", b"B" * 64, "image/png")
+        assert server.objects["videos/abc.png"]["data"] == b"B" * 64
+        assert (client.uploads, client.deduplicated) == (2, 0)
+
+    run_against_standin(scenario)
+
+
+def test_reuploads_objects_stored_without_a_sha256():
+    async def scenario(server, client):
+        server.objects["videos/old.mp4"] = {"data": b"same", "content_type": "video/mp4", "metadata": {}}
+        await client.upload_bytes("old.mp4", b"same", "video/mp4")
+        assert server.objects["videos/old.mp4"]["metadata"]["sha256"] == hashlib.sha256(b"same").hexdigest()
+        assert (client.uploads, client.deduplicated) == (1, 0)
+
+    run_against_standin(scenario)
+
+
+def test_resumable_upload_stores_the_sha256(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_TUS_THRESHOLD_MB", 0)
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"frame" * 1000)
+
+    async def scenario(server, client):
+        await client.upload_file(str(path), "big.mp4", "video/mp4")
+        await client.upload_file(str(path), "big.mp4", "video/mp4")
+        entry = server.objects["videos/big.mp4"]
+        assert entry["data"] == path.read_bytes()
+        assert entry["metadata"] == {"sha256": hashlib.sha256(path.read_bytes()).hexdigest()}
+        assert (client.uploads, client.resumable_uploads, client.deduplicated) == (1, 1, 1)
+
+    run_against_standin(scenario)
+
+
+def test_missing_object_is_not_an_error():
+    async def scenario(server, client):
+        assert await client._exists("nope.mp4", "0" * 64) is False
+
+    run_against_standin(scenario)
+
+
+@pytest.mark.parametrize("size", [0, 1, 1024 * 1024 + 3])
+def test_sha256_file_matches_hashlib(tmp_path, size):
+    path = tmp_path / "blob"
+    data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+    path.write_bytes(data)
+    assert storage._sha256_file(str(path)) == hashlib.sha256(data).hexdigest()
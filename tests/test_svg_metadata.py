@@ -0,0 +1,67 @@
+import pytest
+
+from common.svg_document import SVGDocument
+from common.svg_metadata import extract_metadata
+
+SVG_NS = 'xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"'
+
+# O cache de resultados depende de a leitura em streaming (extract_metadata) e a
+# árvore completa (SVGDocument) darem exatamente as mesmas chaves e metadados.
+SAMPLES = {
+    "text_and_tails": f'<svg {SVG_NS} width="1080" height="1350"><g><text x="10">Olá <tspan>mundo</tspan> fim'
+                      f'</text> depois do texto <!-- comentário --><rect width="5" height="5"/> cauda </g></svg>',
+    "xlink_and_plain_href": f'<svg {SVG_NS} viewBox="0 0 200 100"><image xlink:href="https://img.test/a.png" '
+                            f'x="0" y="0" width="50%" height="50"/><image href="https://img.test/b.jpg" width="10" '
+                            f'height="10" preserveAspectRatio="xMidYMid slice"/><image href="data:image/png;base64,AAAA" '
+                            f'width="1" height="1"/></svg>',
+    "video_areas": f'<svg {SVG_NS} width="1080" height="1920"><rect id="video-area" x="10" y="20" width="500" '
+                   f'height="300" rx="12" data-video-url="https://cdn.test/a.mp4"/><rect id="video-area-2" '
+                   f'x="10" y="400" width="500" height="300" video_url="https://cdn.test/b.mp4"/>'
+                   f'<text id="video-area-label">legenda</text></svg>',
+    "partial_video_id": f'<svg {SVG_NS} width="100" height="100"><g id="my-video-box" '
+                        f'data-video-url="https://cdn.test/c.mp4"><rect width="10" height="10"/></g></svg>',
+    "percentages": f'<svg {SVG_NS} width="100%" height="100%" viewBox="0 0 1080 1350"><image '
+                   f'href="https://img.test/c.png" width="100%" height="25%"/></svg>',
+    "nested_and_transforms": f'<svg {SVG_NS} viewBox="0 0 400 400"><g transform="scale(2)"><image '
+                             f'href="https://img.test/d.png" width="10" height="10"/></g><g transform="translate(5 5)">'
+                             f'<image href="https://img.test/d.png" width="20" height="20"/></g><svg width="50" '
+                             f'height="50" viewBox="0 0 10 10"><image href="https://img.test/e.png" width="5" '
+                             f'height="5"/></svg></svg>',
+    "animation": f'<svg {SVG_NS} width="200" height="200"><circle r="10"><animate attributeName="r" from="10" '
+                 f'to="50" dur="2s"/></circle></svg>',
+    "no_dimensions": f'<svg {SVG_NS}><rect width="1" height="1"/></svg>',
+}
+
+
+@pytest.fixture(params=sorted(SAMPLES))
+def svg(request):
+    return SAMPLES[request.param]
+
+
+def test_streaming_and_tree_keys_match(svg):
+    metadata, document = extract_metadata(svg), SVGDocument(svg)
+    assert metadata.cache_key() == document.cache_key()
+    assert metadata.cache_key(drop_video_urls=True) == document.cache_key(drop_video_urls=True)
+    assert metadata.template_key() == document.template_key()
+
+
+def test_streaming_and_tree_metadata_match(svg):
+    metadata, document = extract_metadata(svg), SVGDocument(svg)
+    assert metadata.dimensions((1080, 1350)) == document.dimensions((1080, 1350))
+    assert metadata.image_hrefs == document.image_hrefs()
+    assert metadata.image_urls() == document.image_urls()
+    assert metadata.image_slots == document.image_slots()
+    assert metadata.video_areas == [dict(elem.attrib) for elem in document.video_areas]
+    element = document.video_element()
+    assert metadata.video_element == (dict(element.attrib) if element is not None else None)
+    assert metadata.has_animations == bool(document.animations)
+
+
+def test_template_key_ignores_only_video_urls():
+    a = SAMPLES["xlink_and_plain_href"]
+    b = a.replace("https://img.test/a.png", "https://img.test/z.png")
+    assert extract_metadata(a).cache_key() != extract_metadata(b).cache_key()
+    video = SAMPLES["video_areas"]
+    other_video = video.replace("https://cdn.test/a.mp4", "https://cdn.test/z.mp4")
+    assert extract_metadata(video).cache_key() != extract_metadata(other_video).cache_key()
+    assert extract_metadata(video).template_key() == extract_metadata(other_video).template_key()
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+
+import pytest
+
+import jobs
+from jobs import _resolve_webhook, validate_webhook_url
+
+
+def resolver_for(*addresses):
+    async def getaddrinfo(host, port, type=0):
+        family = {4: socket.AF_INET, 6: socket.AF_INET6}
+        return [(family[6 if ":" in address else 4], type, 6, "", (address, port)) for address in addresses]
+    return getaddrinfo
+
+
+def resolve(url: str, *addresses):
+    asyncio.run(_resolve_webhook(url, resolver=resolver_for(*addresses)))
+
+
+@pytest.mark.parametrize("url", [
+    "http://localhost/hook",
+    "http://LOCALHOST:8000/hook",
+    "http://api.localhost/hook",
+    "http://127.0.0.1/hook",
+    "http://10.0.0.5/hook",
+    "http://172.16.3.4/hook",
+    "http://192.168.1.10/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://0.0.0.0/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://[::ffff:169.254.169.254]/hook",
+    "http://[fe80::1%25eth0]/hook",
+    "http://[fd00::1]/hook",
+    "http://224.0.0.1/hook",
+])
+def test_rejects_internal_hosts(url):
+    with pytest.raises(ValueError):
+        validate_webhook_url(url)
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "file:///etc/passwd",
+    "http:///hook",
+])
+def test_rejects_non_http_urls(url):
+    with pytest.raises(ValueError):
+        validate_webhook_url(url)
+
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/hook",
+    "http://93.184.216.34/hook",
+    "http://[2606:4700::1111]/hook",
+])
+def test_accepts_public_hosts(url):
+    assert validate_webhook_url(url) == url
+
+
+@pytest.mark.parametrize("addresses", [
+    ("127.0.0.1",),
+    ("10.1.2.3",),
+    ("169.254.169.254",),
+    ("::ffff:192.168.0.1",),
+    ("fe80::1%eth0",),
+    ("93.184.216.34", "10.0.0.1"),  # basta um endereço interno
+])
+def test_rejects_names_resolving_to_internal_addresses(addresses):
+    with pytest.raises(ValueError):
+        resolve("https://hooks.example.com/notify", *addresses)
+
+
+def test_accepts_names_resolving_to_public_addresses():
+    resolve("https://hooks.example.com/notify", "93.184.216.34", "2606:4700::1111")
+
+
+def test_resolver_receives_host_and_default_port():
+    calls = []
+
+    async def getaddrinfo(host, port, type=0):
+        calls.append((host, port))
+        return [(socket.AF_INET, type, 6, "", ("93.184.216.34", port))]
+
+    asyncio.run(_resolve_webhook("https://Hooks.Example.com/notify", resolver=getaddrinfo))
+    asyncio.run(_resolve_webhook("http://hooks.example.com:8080/notify", resolver=getaddrinfo))
+    assert calls == [("hooks.example.com", 443), ("hooks.example.com", 8080)]
+
+
+def test_allowed_hosts_bypass_the_internal_checks(monkeypatch):
+    monkeypatch.setattr(jobs, "WEBHOOK_ALLOWED_HOSTS", {"localhost", "hooks.internal"})
+
+    assert validate_webhook_url("http://localhost:9000/hook") == "http://localhost:9000/hook"
+    assert validate_webhook_url("http://hooks.internal/hook") == "http://hooks.internal/hook"
+    resolve("http://hooks.internal/hook", "10.0.0.8")  # não consulta o resolvedor
+
+
+def test_allowed_hosts_reject_everything_else(monkeypatch):
+    monkeypatch.setattr(jobs, "WEBHOOK_ALLOWED_HOSTS", {"hooks.internal"})
+
+    with pytest.raises(ValueError):
+        validate_webhook_url("https://example.com/hook")